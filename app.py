@@ -5,28 +5,50 @@ GreenH Project - OpenSolar Integration
 """
 
 import os
+import hmac
+import json
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from datetime import datetime
 from functools import wraps
 
 # Módulos del proyecto
 from config import get_config
-from database import Database, Notification
+from log_config import setup_logging, parse_sampling
+from database import Database, Notification, JobQueue, FetchLease
 from services import OpenSolarService, NotificationService
 from services.resend_service import ResendService
+from services.mail_transport import ResendTransport, LazyTransport
+from services.mail_router import MailRouter
+from services.batch_dispatcher import ResendBatchDispatcher
+from services.retry import RetryScheduler
+from services.http_session import PooledSession
+from services.cache import TTLCache
+from services.action_matcher import ActionMatcher
+from services.metrics import MetricsRegistry, clear_metrics_dir
+from services.webhook_processor import WebhookProcessor
+from services.webhook_recorder import WebhookRecorder
+from services.job_worker import JobWorkerPool
+from services.admission import AdmissionController
+
+# Cargar configuración
+config = get_config()
+
+# Máximo de caracteres de un payload en los registros DEBUG
+LOG_PAYLOAD_MAX_CHARS = 2000
 
 # ---------------------------------------------------------------------------
 # Configuración de Logging
 # ---------------------------------------------------------------------------
 
-logging.basicConfig(
-    level=os.getenv("LOG_LEVEL", "INFO"),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("notifications.log"),
-        logging.StreamHandler()
-    ]
+# Registros JSON escritos desde un hilo aparte (sin I/O en el hilo de la petición)
+setup_logging(
+    level=config.LOG_LEVEL,
+    log_file=config.LOG_FILE or None,
+    max_bytes=config.LOG_MAX_BYTES,
+    backup_count=config.LOG_BACKUP_COUNT,
+    json_format=config.LOG_FORMAT == 'json',
+    debug_sampling=parse_sampling(config.LOG_DEBUG_SAMPLING)
 )
 
 logger = logging.getLogger(__name__)
@@ -35,81 +57,280 @@ logger = logging.getLogger(__name__)
 # Inicialización de la Aplicación y Servicios
 # ---------------------------------------------------------------------------
 
-# Cargar configuración
-config = get_config()
-
 # Inicializar aplicación Flask
 app = Flask(__name__)
 app.config.from_object(config)
 
 # Inicializar base de datos (opcional - solo si DATABASE_URL está configurada)
 try:
-    db = Database(config.DATABASE_URL)
+    db = Database(
+        config.DATABASE_URL,
+        cache_size_kb=config.DB_CACHE_SIZE_KB,
+        mmap_size=config.DB_MMAP_SIZE,
+        pool_min_size=config.DB_POOL_MIN_SIZE,
+        pool_max_size=config.DB_POOL_MAX_SIZE
+    )
     notification_model = Notification(db)
+    job_queue = JobQueue(db)
+    fetch_lease = FetchLease(db)
     logger.info("Base de datos inicializada correctamente")
 except Exception as e:
     logger.warning(f"No se pudo inicializar la base de datos: {e}")
     logger.warning("La aplicación funcionará sin persistencia de notificaciones")
     db = None
     notification_model = None
+    job_queue = None
+    fetch_lease = None
+
+# Inicializar servicios (cada uno con su propio pool de conexiones HTTP keep-alive)
+def create_http_session():
+    """Crear una sesión HTTP con pool según la configuración"""
+    return PooledSession(
+        pool_connections=config.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=config.HTTP_POOL_MAXSIZE,
+        max_retries=config.HTTP_MAX_RETRIES,
+        backoff_factor=config.HTTP_BACKOFF_FACTOR
+    )
+
+# Métricas por etapa del procesamiento (agregadas entre workers en METRICS_DIR)
+metrics = MetricsRegistry(
+    metrics_dir=config.METRICS_DIR or None,
+    dump_interval=config.METRICS_DUMP_INTERVAL
+)
+
+# Índice de títulos de acción compartido por OpenSolarService y NotificationService
+action_matcher = ActionMatcher(config.ACTION_DESCRIPTIONS, config.TRIGGER_ACTIONS)
 
-# Inicializar servicios
 opensolar_service = OpenSolarService(
     api_token=config.OPENSOLAR_TOKEN,
     org_id=config.OPENSOLAR_ORG_ID,
-    base_url=config.OPENSOLAR_API_BASE
+    base_url=config.OPENSOLAR_API_BASE,
+    session=create_http_session(),
+    project_cache=TTLCache(
+        maxsize=config.OPENSOLAR_CACHE_SIZE,
+        ttl=config.OPENSOLAR_CACHE_TTL
+    ) if config.OPENSOLAR_CACHE_TTL > 0 else None,
+    lease_store=fetch_lease,
+    lease_ttl=config.OPENSOLAR_LEASE_TTL,
+    lease_poll_interval=config.OPENSOLAR_LEASE_POLL_INTERVAL,
+    action_matcher=action_matcher,
+    request_timeout=config.OPENSOLAR_REQUEST_TIMEOUT
 )
 
 resend_service = ResendService(
-    api_key=config.RESEND_API_KEY
+    api_key=config.RESEND_API_KEY,
+    api_url=config.RESEND_API_URL,
+    session=create_http_session()
 )
 
+
+def create_gmail_smtp_transport():
+    """Transporte Gmail SMTP (se crea en su primer envío)"""
+    from services.gmail_service import GmailService
+    from services.mail_transport import GmailSMTPTransport
+
+    return GmailSMTPTransport(GmailService(
+        from_email=config.GMAIL_FROM_EMAIL,
+        from_name=config.GMAIL_FROM_NAME,
+        smtp_password=config.GMAIL_SMTP_PASSWORD,
+        pool_size=config.GMAIL_SMTP_POOL_SIZE,
+        max_messages_per_connection=config.GMAIL_SMTP_MAX_MESSAGES_PER_CONNECTION
+    ))
+
+
+def create_gmail_api_transport():
+    """Transporte Gmail API (requiere las dependencias de Google y un token OAuth ya generado)"""
+    from services.gmail_api_service import GmailAPIService
+    from services.mail_transport import GmailAPITransport
+
+    return GmailAPITransport(GmailAPIService(
+        from_email=config.GMAIL_FROM_EMAIL,
+        from_name=config.GMAIL_FROM_NAME,
+        discovery_cache_file=config.GMAIL_DISCOVERY_CACHE_FILE
+    ))
+
+
+def create_mail_router() -> MailRouter:
+    """
+    Crear el enrutador de email con los proveedores de MAIL_TRANSPORTS (en orden de preferencia)
+
+    Los proveedores de Gmail se importan e inicializan en su primer envío.
+    """
+    transports = []
+    for name in config.MAIL_TRANSPORTS:
+        if name == "resend":
+            transports.append(ResendTransport(resend_service))
+        elif name == "gmail_smtp":
+            if not config.GMAIL_SMTP_PASSWORD:
+                logger.warning("Proveedor gmail_smtp omitido: GMAIL_SMTP_PASSWORD no está configurada")
+                continue
+            transports.append(LazyTransport("gmail_smtp", create_gmail_smtp_transport))
+        elif name == "gmail_api":
+            transports.append(LazyTransport("gmail_api", create_gmail_api_transport))
+        else:
+            logger.warning(f"Proveedor de email desconocido en MAIL_TRANSPORTS: {name}")
+
+    if not transports:
+        transports.append(ResendTransport(resend_service))
+
+    logger.info(f"Proveedores de email: {', '.join(t.name for t in transports)}")
+    return MailRouter(
+        transports,
+        failure_threshold=config.MAIL_ROUTER_FAILURE_THRESHOLD,
+        cooldown=config.MAIL_ROUTER_COOLDOWN
+    )
+
+
+mail_router = create_mail_router()
+
 notification_service = NotificationService(
     templates_dir=os.path.join(os.path.dirname(__file__), "templates"),
     client_portal_url=config.CLIENT_PORTAL_URL,
-    action_descriptions=config.ACTION_DESCRIPTIONS
+    action_descriptions=config.ACTION_DESCRIPTIONS,
+    production=config.TEMPLATE_PRODUCTION_MODE,
+    bytecode_cache_dir=config.TEMPLATE_BYTECODE_CACHE_DIR if config.TEMPLATE_PRODUCTION_MODE else None,
+    build_templates=config.TEMPLATE_INLINE_CSS,
+    fragment_cache_size=config.TEMPLATE_FRAGMENT_CACHE_SIZE,
+    action_matcher=action_matcher
+)
+
+# Reintentos de envío diferidos en la cola de trabajos (nunca se espera en el hilo de la petición)
+retry_scheduler = None
+if job_queue and config.WEBHOOK_ASYNC:
+    retry_scheduler = RetryScheduler(
+        job_queue=job_queue,
+        base_delay=config.NOTIFICATION_RETRY_DELAY,
+        max_delay=config.NOTIFICATION_RETRY_MAX_DELAY,
+        max_attempts=config.NOTIFICATION_RETRY_ATTEMPTS
+    )
+
+# Despachador de lotes de Resend (cada mensaje es un trabajo persistente; el resultado se registra en su notificación)
+batch_dispatcher = None
+if job_queue and config.RESEND_BATCH_ENABLED:
+    batch_dispatcher = ResendBatchDispatcher(
+        resend_service=resend_service,
+        notification_model=notification_model,
+        job_queue=job_queue,
+        max_batch_size=config.RESEND_BATCH_SIZE,
+        max_wait_ms=config.RESEND_BATCH_MAX_WAIT_MS,
+        max_attempts=config.NOTIFICATION_RETRY_ATTEMPTS,
+        lease_seconds=config.JOB_LEASE_SECONDS,
+        retry_delay=config.NOTIFICATION_RETRY_DELAY,
+        max_retry_delay=config.NOTIFICATION_RETRY_MAX_DELAY,
+        retention_seconds=config.JOB_RETENTION_SECONDS
+    )
+    batch_dispatcher.start()
+
+webhook_processor = WebhookProcessor(
+    opensolar_service=opensolar_service,
+    notification_service=notification_service,
+    mailer=mail_router,
+    notification_model=notification_model,
+    config=config,
+    batch_dispatcher=batch_dispatcher,
+    retry_scheduler=retry_scheduler,
+    job_queue=job_queue if config.WEBHOOK_ASYNC else None,
+    metrics=metrics
 )
 
-logger.info(f"Aplicación inicializada en modo {os.getenv("FLASK_ENV", "development")}")
+# Iniciar workers de la cola de trabajos (cada worker de gunicorn tiene su propio pool)
+job_worker_pool = None
+if job_queue and config.WEBHOOK_ASYNC:
+    job_worker_pool = JobWorkerPool(
+        job_queue=job_queue,
+        handlers={
+            "webhook": webhook_processor.process,
+            "send_email": webhook_processor.deliver,
+            "digest": webhook_processor.send_digest
+        },
+        num_workers=config.JOB_WORKER_THREADS,
+        poll_interval=config.JOB_POLL_INTERVAL,
+        lease_seconds=config.JOB_LEASE_SECONDS,
+        retry_delay=config.NOTIFICATION_RETRY_DELAY,
+        max_retry_delay=config.NOTIFICATION_RETRY_MAX_DELAY,
+        exhausted_handlers={
+            "send_email": webhook_processor.delivery_exhausted,
+            "digest": webhook_processor.digest_exhausted
+        },
+        retention_seconds=config.JOB_RETENTION_SECONDS,
+        maintenance=[webhook_processor.recover_stale_notifications]
+    )
+    job_worker_pool.start()
+else:
+    logger.warning("Procesamiento asíncrono desactivado: los webhooks se procesarán de forma síncrona")
+    # Sin workers, las notificaciones cuyo envío se interrumpió se cierran al arrancar
+    try:
+        webhook_processor.recover_stale_notifications()
+    except Exception as e:
+        logger.error(f"Error al recuperar notificaciones interrumpidas: {e}")
+
+# Control de admisión: limita las peticiones en curso y la profundidad de la cola
+admission = AdmissionController(
+    max_in_flight=config.ADMISSION_MAX_IN_FLIGHT,
+    max_queue_depth=config.ADMISSION_MAX_QUEUE_DEPTH,
+    queue_depth=job_queue.count_pending if job_queue and job_worker_pool else None,
+    queue_check_interval=config.ADMISSION_QUEUE_CHECK_INTERVAL,
+    retry_after=config.ADMISSION_RETRY_AFTER,
+    metrics=metrics
+)
+
+# Grabación del tráfico de webhooks para reproducirlo con webhook_replay.py
+webhook_recorder = WebhookRecorder(config.WEBHOOK_RECORD_PATH) if config.WEBHOOK_RECORD_PATH else None
+if webhook_recorder:
+    logger.info(f"Grabando los webhooks recibidos en {config.WEBHOOK_RECORD_PATH}")
+
+logger.info(f"Aplicación inicializada en modo {os.getenv('FLASK_ENV', 'development')}")
 
 # ---------------------------------------------------------------------------
 # Decoradores de Autenticación
 # ---------------------------------------------------------------------------
 
+def authenticate_request():
+    """
+    Validar el secreto del webhook de la petición actual
+
+    Returns:
+        None si la petición está autorizada o la respuesta de error
+    """
+    # Intentar obtener el secreto de diferentes headers
+    webhook_secret = request.headers.get("X-Webhook-Secret")
+    auth_header = request.headers.get("Authorization")
+    
+    # Validar con X-Webhook-Secret (OpenSolar); nunca se registran los secretos
+    if webhook_secret:
+        if hmac.compare_digest(webhook_secret, config.WEBHOOK_SECRET):
+            return None
+        else:
+            logger.warning(f"Webhook: Secreto inválido (len={len(webhook_secret)})")
+            return jsonify({"error": "Invalid webhook secret"}), 401
+    
+    # Validar con Authorization Bearer (alternativo)
+    if auth_header:
+        try:
+            auth_type, token = auth_header.split()
+            if auth_type.lower() == "bearer" and hmac.compare_digest(token, config.WEBHOOK_SECRET):
+                return None
+            else:
+                logger.warning("Webhook: Token inválido")
+                return jsonify({"error": "Invalid token"}), 403
+        except ValueError:
+            logger.warning("Webhook: Formato de token inválido")
+            return jsonify({"error": "Invalid token format"}), 401
+    
+    # Si no hay ningún header de autenticación
+    logger.warning("Webhook: Falta header de autorización")
+    return jsonify({"error": "Authorization header is missing"}), 401
+
+
 def require_webhook_auth(f):
     """Decorador para proteger el endpoint del webhook"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Intentar obtener el secreto de diferentes headers
-        webhook_secret = request.headers.get("X-Webhook-Secret")
-        auth_header = request.headers.get("Authorization")
-        
-        # Validar con X-Webhook-Secret (OpenSolar)
-        if webhook_secret:
-            logger.info(f"Webhook: Secreto recibido: '{webhook_secret}' (len={len(webhook_secret)})")
-            logger.info(f"Webhook: Secreto esperado: '{config.WEBHOOK_SECRET}' (len={len(config.WEBHOOK_SECRET)})")
-            if webhook_secret == config.WEBHOOK_SECRET:
-                return f(*args, **kwargs)
-            else:
-                logger.warning(f"Webhook: Secreto inválido. Recibido: '{webhook_secret}', Esperado: '{config.WEBHOOK_SECRET}'")
-                return jsonify({"error": "Invalid webhook secret"}), 401
-        
-        # Validar con Authorization Bearer (alternativo)
-        if auth_header:
-            try:
-                auth_type, token = auth_header.split()
-                if auth_type.lower() == "bearer" and token == config.WEBHOOK_SECRET:
-                    return f(*args, **kwargs)
-                else:
-                    logger.warning("Webhook: Token inválido")
-                    return jsonify({"error": "Invalid token"}), 403
-            except ValueError:
-                logger.warning("Webhook: Formato de token inválido")
-                return jsonify({"error": "Invalid token format"}), 401
-        
-        # Si no hay ningún header de autenticación
-        logger.warning("Webhook: Falta header de autorización")
-        return jsonify({"error": "Authorization header is missing"}), 401
+        with metrics.stage("auth"):
+            error_response = authenticate_request()
+        if error_response is not None:
+            return error_response
+        return f(*args, **kwargs)
         
     return decorated_function
 
@@ -117,6 +338,15 @@ def require_webhook_auth(f):
 # Endpoints de la API
 # ---------------------------------------------------------------------------
 
+@app.before_request
+def record_webhook():
+    """Grabar la petición al webhook antes de autenticarla (incluye las rechazadas)"""
+    if webhook_recorder and request.endpoint == "opensolar_webhook":
+        webhook_recorder.record(
+            request.method, request.full_path.rstrip("?"), request.headers, request.get_data(cache=True)
+        )
+
+
 @app.route("/health", methods=["GET"])
 def health_check():
     """Endpoint de health check para verificar que el servicio está activo"""
@@ -126,277 +356,94 @@ def health_check():
     })
 
 
+@app.route("/stats", methods=["GET"])
+@require_webhook_auth
+def stats():
+    """Estadísticas internas del proceso (conexiones HTTP, cola de trabajos)"""
+    return jsonify({
+        "pid": os.getpid(),
+        "http": {
+            "opensolar": opensolar_service.session.stats(),
+            "resend": resend_service.session.stats()
+        },
+        "cache": {
+            "opensolar_projects": opensolar_service.project_cache.stats()
+            if opensolar_service.project_cache else None,
+            "email_fragments": notification_service.fragment_cache.stats()
+            if notification_service.fragment_cache else None,
+            "action_titles": action_matcher.stats()
+        },
+        "single_flight": {
+            "opensolar_projects": opensolar_service.single_flight.stats(),
+            "leases": opensolar_service.lease_stats
+        },
+        "webhooks": {
+            "project_source": webhook_processor.project_source_counts,
+            "digests": webhook_processor.digest_counts,
+            "recorder": webhook_recorder.stats() if webhook_recorder else None
+        },
+        "mail_providers": mail_router.stats(),
+        "email_batches": batch_dispatcher.stats() if batch_dispatcher else None,
+        "jobs": {
+            "pending": job_queue.count_pending() if job_queue else None
+        },
+        "admission": admission.stats()
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+@require_webhook_auth
+def prometheus_metrics():
+    """Métricas por etapa del procesamiento de webhooks (formato de texto de Prometheus)"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/webhook/opensolar", methods=["POST"])
 @require_webhook_auth
 def opensolar_webhook():
     """
     Endpoint para recibir webhooks de OpenSolar.
-    Procesa los cambios en proyectos y envía notificaciones si es necesario.
+    Valida el payload y lo encola para procesarlo en segundo plano; si la cola
+    no está disponible, lo procesa de forma síncrona. Los eventos ignorados se
+    responden sin pasar por el control de admisión ni tocar la base de datos.
     """
-    webhook_data = request.get_json()
-    
-    if not webhook_data:
-        logger.error("Webhook: No se recibieron datos JSON")
-        return jsonify({"error": "No JSON data received"}), 400
-    
-    # Log del payload completo para debug
-    logger.info(f"Webhook payload completo: {webhook_data}")
-    model = webhook_data.get("model")
-    event = webhook_data.get("event")
-    logger.info(f"Webhook recibido: model={model}, event={event}")
-    
-    # Procesar eventos de tipo "Event" con acción "CREATE" (cuando se marca una acción como completada)
-    if model == "Event" and event == "CREATE":
-        logger.info(f"Procesando evento de tipo Event/CREATE")
-        
-        # Los datos del evento están en "fields"
-        event_data = webhook_data.get("fields", {})
-        if not event_data:
-            logger.error("Webhook: No hay datos de evento en el payload (fields)")
-            return jsonify({"error": "No event data in payload"}), 400
-        
-        # Verificar que el evento esté completado
-        is_complete = event_data.get("is_complete", False)
-        if not is_complete:
-            logger.info("Webhook ignorado: Evento no está completado")
-            return jsonify({"status": "ignored", "reason": "Event not complete"}), 200
-        
-        # Obtener información del proyecto
-        project_data_ref = event_data.get("project_data", {})
-        project_id = project_data_ref.get("id")
-        
-        if not project_id:
-            logger.error("Webhook: No se encontró ID de proyecto en el evento")
-            return jsonify({"error": "No project ID in event"}), 400
-        
-        logger.info(f"Procesando evento completado para proyecto ID: {project_id}")
-        
-        # Obtener datos completos del proyecto desde OpenSolar API
-        try:
-            project_full_data = opensolar_service.get_project(project_id)
-            if not project_full_data:
-                logger.error(f"No se pudo obtener datos del proyecto {project_id}")
-                return jsonify({"error": "Could not fetch project data"}), 500
-        except Exception as e:
-            logger.error(f"Error al obtener proyecto {project_id}: {str(e)}")
-            return jsonify({"error": f"Error fetching project: {str(e)}"}), 500
-        
-        # Extraer datos del cliente
-        client_data = opensolar_service.extract_client_data(project_full_data)
-        if not client_data or not client_data.get("email"):
-            logger.error(f"Proyecto {project_id}: No se encontraron datos de contacto o email del cliente")
-            return jsonify({"error": "Client contact data or email is missing"}), 400
-        
-        # Obtener información de la acción completada
-        action_title = event_data.get("title", "Acción")
-        action_url = event_data.get("action", "")
-        completion_date = event_data.get("completion_date")
-        
-        # Construir objeto de acción simulado para compatibilidad
-        action_info = {
-            "action": {
-                "id": event_data.get("id"),
-                "title": action_title,
-                "url": action_url
-            },
-            "event": {
-                "is_complete": True,
-                "completion_date": completion_date
-            },
-            "completion_date": completion_date
-        }
-        
-        # Verificar si es la primera notificación para este proyecto
-        is_first_notification_for_project = notification_model.check_if_first_notification(project_id) if notification_model else True
-        
-        # Determinar si es la acción que dispara la primera notificación
-        is_trigger_action = opensolar_service.is_initial_payment_action(
-            action_info["action"], config.TRIGGER_ACTIONS
-        )
-        
-        email_content = None
-        email_type = "progress_update"
-        
-        # Generar email de primera notificación
-        if is_first_notification_for_project and is_trigger_action:
-            logger.info(f"Proyecto {project_id}: Generando primera notificación")
-            email_content = notification_service.generate_first_notification_email(
-                client_data, project_full_data, action_info
-            )
-            email_type = "first_notification"
-        else:
-            # Generar email de actualización de progreso
-            logger.info(f"Proyecto {project_id}: Generando notificación de progreso")
-            email_content = notification_service.generate_progress_update_email(
-                client_data, project_full_data, action_info
-            )
-        
-        # Enviar email directamente al cliente usando Gmail (mantiene el diseño HTML completo)
-        # También se envía una copia a admin@greenhproject.com para registro
-        client_email = client_data["email"]
-        admin_email = "admin@greenhproject.com"
-        
-        try:
-            # IMPORTANTE: Este código requiere que se ejecute a través de Manus con gmail_send_message
-            # Por ahora, registramos los datos necesarios para el envío
-            logger.info(f"Preparando envío de email HTML a {client_email}")
-            logger.info(f"Asunto: {email_content['subject']}")
-            logger.info(f"HTML content length: {len(email_content['html'])} caracteres")
-            
-            # Guardar el HTML en un archivo temporal para referencia
-            import os
-            temp_dir = "/tmp/emails_to_send"
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            action_id = action_info["action"]["id"]
-            email_filename = f"{temp_dir}/email_{project_id}_{action_id}.html"
-            with open(email_filename, 'w', encoding='utf-8') as f:
-                f.write(email_content['html'])
-            
-            logger.info(f"Email HTML guardado en: {email_filename}")
-            logger.info(f"Cliente: {client_email}")
-            logger.info(f"Copia para admin: {admin_email}")
-            
-            # Enviar correo a admin@greenhproject.com con formato [Cliente: Nombre] en el asunto
-            admin_subject = f"[Cliente: {client_data['full_name']}] {email_content['subject']}"
-            success = resend_service.send_email_with_retry(
-                to_email=admin_email,
-                subject=admin_subject,
-                html_content=email_content['html']
-            )
-            
-            if success:
-                logger.info(f"Email preparado exitosamente para {client_email}")
-                
-                # Registrar notificación en la base de datos
-                if notification_model:
-                    notification_model.log_notification(
-                        project_id=project_id,
-                        action_id=action_info["action"]["id"],
-                        email=client_data["email"],
-                        notification_type=email_type
-                    )
-                
-                return jsonify({"status": "success", "email_sent": True}), 200
-            else:
-                logger.error(f"Error al enviar email a {client_data['email']}")
-                return jsonify({"status": "error", "message": "Failed to send email"}), 500
-                
-        except Exception as e:
-            logger.error(f"Error al procesar notificación: {str(e)}")
-            return jsonify({"status": "error", "message": str(e)}), 500
+    with metrics.stage("parse"):
+        webhook_data = request.get_json(silent=True)
     
-    # Ignorar otros tipos de webhooks
-    logger.info(f"Webhook ignorado: model={model}, event={event}")
-    return jsonify({"status": "ignored", "reason": f"Not a relevant webhook (model={model}, event={event})"}), 200
-    
-    # 1. Obtener acciones completadas recientemente
-    actions = project_data.get("actions", [])
-    completed_actions = opensolar_service.get_recently_completed_actions(
-        actions,
-        threshold_hours=config.RECENT_COMPLETION_THRESHOLD.total_seconds() / 3600
-    )
+    if logger.isEnabledFor(logging.DEBUG):
+        # Payload truncado; LOG_DEBUG_SAMPLING decide qué fracción se escribe
+        logger.debug("Webhook recibido", extra={
+            "payload": json.dumps(webhook_data, ensure_ascii=False)[:LOG_PAYLOAD_MAX_CHARS]
+        })
     
-    if not completed_actions:
-        logger.info(f"Proyecto {project_id}: No hay acciones completadas recientemente")
-        return jsonify({"status": "no_actions_to_notify"}), 200
+    validation = webhook_processor.validate(webhook_data)
+    http_status = validation.pop("http_status")
     
-    logger.info(f"Proyecto {project_id}: {len(completed_actions)} acciones completadas encontradas")
+    if validation["status"] != "accepted":
+        return jsonify(validation), http_status
     
-    # 2. Obtener datos del cliente
-    client_data = opensolar_service.extract_client_data(project_data)
-    if not client_data or not client_data.get("email"):
-        logger.error(f"Proyecto {project_id}: No se encontraron datos de contacto o email del cliente")
-        return jsonify({"error": "Client contact data or email is missing"}), 400
+    project_id = validation["project_id"]
     
-    # 3. Verificar si es la primera notificación para este proyecto
-    is_first_notification_for_project = notification_model.check_if_first_notification(project_id) if notification_model else True
-    
-    notifications_sent = 0
-    
-    # 4. Procesar cada acción completada
-    for action_info in completed_actions:
-        action = action_info["action"]
-        action_id = action["id"]
-        action_title = action["title"]
+    with admission.slot() as rejection:
+        if rejection:
+            retry_after = rejection.pop("retry_after")
+            http_status = rejection.pop("http_status")
+            return jsonify(rejection), http_status, {"Retry-After": str(retry_after)}
         
-        # Verificar si ya notificamos esta acción
-        if notification_model and notification_model.check_if_notified(project_id, action_id):
-            logger.info(f"Proyecto {project_id}, Acción {action_id}: Ya notificada, omitiendo")
-            continue
+        if job_queue and job_worker_pool:
+            job_id = job_queue.enqueue("webhook", webhook_data, max_attempts=config.JOB_MAX_ATTEMPTS)
+            admission.note_enqueued()
+            logger.info(f"Webhook encolado: proyecto {project_id}, trabajo {job_id}")
+            return jsonify({"status": "queued", "job_id": job_id}), 202
         
-        # Determinar si es la acción que dispara la primera notificación
-        is_trigger_action = opensolar_service.is_initial_payment_action(
-            action, config.TRIGGER_ACTIONS
-        )
-        
-        email_content = None
-        email_type = "progress_update"
-        
-        # Generar email de primera notificación
-        if is_first_notification_for_project and is_trigger_action:
-            logger.info(f"Proyecto {project_id}: Generando primera notificación")
-            email_content = notification_service.generate_first_notification_email(
-                client_data, project_data, action_info
-            )
-            email_type = "first_notification"
-            is_first_notification_for_project = False # Para no repetir en el mismo webhook
-        
-        # Generar email de actualización de progreso (si no es la primera)
-        elif not notification_model or not notification_model.check_if_first_notification(project_id):
-            logger.info(f"Proyecto {project_id}: Generando actualización de progreso")
-            email_content = notification_service.generate_progress_update_email(
-                client_data, project_data, action_info
-            )
-        
-        # Si no se debe enviar email, continuar
-        if not email_content:
-            logger.info(f"Proyecto {project_id}, Acción {action_id}: No se requiere notificación en este momento")
-            continue
-        
-        # 5. Enviar email
-        # NOTA: Por ahora enviamos a admin@greenhproject.com porque el dominio no está verificado en Resend
-        admin_email = "admin@greenhproject.com"
-        
-        success = resend_service.send_email_with_retry(
-            to_email=admin_email,  # Enviando a admin en lugar del cliente
-            subject=f"[Cliente: {client_data.get('full_name', client_data['email'])}] {email_content['subject']}",  # Incluir nombre del cliente en el asunto
-            html_content=email_content["html"],
-            from_email="onboarding@resend.dev",
-            max_retries=config.NOTIFICATION_RETRY_ATTEMPTS
-        )
-        
-        # 6. Registrar notificación en la base de datos (si está disponible)
-        if notification_model:
-            status = "sent" if success else "failed"
-            error_message = None if success else "Failed to send email after retries"
-            
-            notification_model.create(
-                project_id=project_id,
-                project_identifier=project_data.get("identifier"),
-                project_title=project_data.get("title"),
-                action_id=action_id,
-                action_title=action_title,
-                recipient_email=client_data["email"],
-                recipient_name=client_data.get("full_name"),
-                email_type=email_type,
-                email_subject=email_content["subject"],
-                email_body=email_content["html"],
-                webhook_data=webhook_data,
-                status=status,
-                error_message=error_message
-            )
-        
-        if success:
-            notifications_sent += 1
-            logger.info(f"Proyecto {project_id}, Acción {action_id}: Notificación enviada a {client_data["email"]}")
-        else:
-            logger.error(f"Proyecto {project_id}, Acción {action_id}: Fallo al enviar notificación a {client_data["email"]}")
-
-    return jsonify({
-        "status": "success",
-        "notifications_sent": notifications_sent
-    }), 200
+        # Procesamiento síncrono (sin base de datos o con WEBHOOK_ASYNC desactivado)
+        result = webhook_processor.process(webhook_data, in_request=True)
+    
+    result.pop("retry", None)
+    retry_after = result.pop("retry_after", None)
+    http_status = result.pop("http_status")
+    headers = {"Retry-After": str(int(retry_after))} if retry_after is not None else {}
+    return jsonify(result), http_status, headers
 
 # ---------------------------------------------------------------------------
 # Bloque Principal de Ejecución
@@ -405,5 +452,7 @@ def opensolar_webhook():
 if __name__ == "__main__":
     # Usar Waitress como servidor de producción en lugar del de desarrollo de Flask
     from waitress import serve
+    if config.METRICS_DIR:
+        clear_metrics_dir(config.METRICS_DIR)
     serve(app, host="0.0.0.0", port=int(os.getenv("PORT", 5000)))
 
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del costo por consulta de la base de datos
+
+Compara abrir una conexión SQLite nueva en cada consulta (comportamiento
+anterior) contra la conexión persistente por hilo de Database, usando las
+consultas que hace cada webhook (check_if_notified, check_if_first_notification).
+
+Uso:
+    python benchmarks/bench_db.py [--queries 2000] [--rows 5000]
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+
+# Agregar el directorio raíz del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, Notification
+
+
+def seed(notification_model: Notification, rows: int):
+    """Insertar notificaciones de prueba"""
+    for i in range(rows):
+        notification_model.create(
+            project_id=i % 500,
+            action_id=i,
+            action_title='Visita técnica',
+            recipient_email='cliente@example.com',
+            email_type='progress_update',
+            email_subject='Actualización de tu Proyecto Solar',
+            email_body='<html></html>'
+        )
+
+
+def bench_new_connection(db_path: str, queries: int) -> float:
+    """Una conexión nueva por consulta (como antes de la conexión persistente)"""
+    start = time.perf_counter()
+    for i in range(queries):
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*) as count 
+            FROM notifications 
+            WHERE project_id = ? AND action_id = ? AND status = 'sent'
+        ''', (i % 500, i))
+        cursor.fetchone()
+        conn.close()
+    return time.perf_counter() - start
+
+
+def bench_persistent_connection(notification_model: Notification, queries: int) -> float:
+    """Conexión persistente del hilo gestionada por Database"""
+    start = time.perf_counter()
+    for i in range(queries):
+        notification_model.check_if_notified(i % 500, i)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de conexiones a la base de datos')
+    parser.add_argument('--queries', type=int, default=2000, help='Número de consultas por escenario')
+    parser.add_argument('--rows', type=int, default=5000, help='Notificaciones de prueba a insertar')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        db = Database(db_path)
+        notification_model = Notification(db)
+        seed(notification_model, args.rows)
+
+        before = bench_new_connection(db_path, args.queries)
+        after = bench_persistent_connection(notification_model, args.queries)
+        db.close()
+
+    print("=" * 60)
+    print("BENCHMARK DE CONEXIONES A LA BASE DE DATOS")
+    print("=" * 60)
+    print(f"Consultas por escenario: {args.queries} ({args.rows} filas)")
+    print(f"Conexión nueva por consulta: {before / args.queries * 1e6:8.1f} µs/consulta")
+    print(f"Conexión persistente (WAL):  {after / args.queries * 1e6:8.1f} µs/consulta")
+    print(f"Mejora: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
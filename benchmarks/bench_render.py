@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de renderizado de los emails
+
+Compara el modo desarrollo de NotificationService (recarga automática, un
+get_template por email) con el modo producción (templates precargados, sin
+recarga y con caché de bytecode), midiendo:
+
+- El primer renderizado de un worker nuevo (compilación de los templates)
+- La latencia de cada renderizado en régimen estable (p50 / p95)
+- El efecto de la caché de fragmentos (HTML estático por acción)
+- El tamaño del HTML generado, con y sin la construcción de templates
+  (CSS en línea y HTML minificado)
+
+Uso:
+    python benchmarks/bench_render.py [--renders 2000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# Agregar el directorio raíz del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from services.notification_service import NotificationService
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+
+CLIENT = {'name': 'María Pérez', 'email': 'cliente@example.com'}
+PROJECT = {'id': 12345, 'title': 'Casa Pérez 5kW', 'address': 'Calle 10 # 20-30, Bogotá'}
+ACTION = {'action': {'title': 'Visita técnica'}, 'completion_date': '2025-10-04T21:34:27.540111Z'}
+
+
+def create_service(production: bool, bytecode_cache_dir: str = None,
+                   build_templates: bool = False, fragment_cache_size: int = 0) -> NotificationService:
+    return NotificationService(
+        templates_dir=TEMPLATES_DIR,
+        client_portal_url=Config.CLIENT_PORTAL_URL,
+        action_descriptions=Config.ACTION_DESCRIPTIONS,
+        production=production,
+        bytecode_cache_dir=bytecode_cache_dir,
+        build_templates=build_templates,
+        fragment_cache_size=fragment_cache_size
+    )
+
+
+def render(service: NotificationService, i: int):
+    if i % 2:
+        service.generate_progress_update_email(CLIENT, PROJECT, ACTION)
+    else:
+        service.generate_first_notification_email(CLIENT, PROJECT, ACTION)
+
+
+def first_render(production: bool, bytecode_cache_dir: str = None) -> float:
+    """Construcción del servicio y primer email de cada tipo (como un worker recién iniciado)"""
+    start = time.perf_counter()
+    service = create_service(production, bytecode_cache_dir)
+    render(service, 0)
+    render(service, 1)
+    return time.perf_counter() - start
+
+
+def steady_state(service: NotificationService, renders: int):
+    """Latencias de renderizado (segundos) después del calentamiento"""
+    for i in range(20):
+        render(service, i)
+
+    latencies = []
+    for i in range(renders):
+        start = time.perf_counter()
+        render(service, i)
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+
+def email_sizes(service: NotificationService):
+    """Bytes del HTML de cada tipo de email"""
+    return {
+        'first_notification': len(service.generate_first_notification_email(CLIENT, PROJECT, ACTION)['html'].encode()),
+        'progress_update': len(service.generate_progress_update_email(CLIENT, PROJECT, ACTION)['html'].encode())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de renderizado de emails')
+    parser.add_argument('--renders', type=int, default=2000, help='Renderizados por escenario')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold_dev = first_render(production=False)
+        cold_prod = first_render(production=True, bytecode_cache_dir=cache_dir)
+        # Segundo arranque: el bytecode ya está en disco
+        warm_prod = first_render(production=True, bytecode_cache_dir=cache_dir)
+
+        dev_p50, dev_p95 = steady_state(create_service(production=False), args.renders)
+        prod_p50, prod_p95 = steady_state(create_service(production=True, bytecode_cache_dir=cache_dir),
+                                          args.renders)
+        built_p50, built_p95 = steady_state(create_service(production=True, build_templates=True),
+                                            args.renders)
+        fragment_service = create_service(production=True, build_templates=True, fragment_cache_size=256)
+        frag_p50, frag_p95 = steady_state(fragment_service, args.renders)
+
+    plain_sizes = email_sizes(create_service(production=True))
+    built_sizes = email_sizes(create_service(production=True, build_templates=True))
+
+    print("=" * 60)
+    print("BENCHMARK DE RENDERIZADO DE EMAILS")
+    print("=" * 60)
+    print("Primer renderizado de un worker (construcción + 2 emails):")
+    print(f"  Desarrollo:                       {cold_dev * 1000:8.2f} ms")
+    print(f"  Producción (sin bytecode previo): {cold_prod * 1000:8.2f} ms")
+    print(f"  Producción (bytecode en disco):   {warm_prod * 1000:8.2f} ms")
+    print(f"Régimen estable ({args.renders} emails):")
+    print(f"  Desarrollo: p50 {dev_p50 * 1e6:8.1f} µs   p95 {dev_p95 * 1e6:8.1f} µs")
+    print(f"  Producción: p50 {prod_p50 * 1e6:8.1f} µs   p95 {prod_p95 * 1e6:8.1f} µs")
+    print(f"  Construido: p50 {built_p50 * 1e6:8.1f} µs   p95 {built_p95 * 1e6:8.1f} µs")
+    print(f"  Fragmentos: p50 {frag_p50 * 1e6:8.1f} µs   p95 {frag_p95 * 1e6:8.1f} µs")
+    fragment_stats = fragment_service.fragment_cache.stats()
+    print(f"  Caché de fragmentos: {fragment_stats['hits']} aciertos, {fragment_stats['builds']} construcciones")
+    print("Tamaño del HTML (bytes):")
+    for name in plain_sizes:
+        print(f"  {name:<32} {plain_sizes[name]:6d} -> {built_sizes[name]:6d}")
+
+
+if __name__ == "__main__":
+    main()
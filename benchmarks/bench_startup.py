@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reporte del tiempo de arranque (importación de la aplicación)
+
+Importa app.py en un proceso nuevo con `python -X importtime`, como lo haría
+un worker de gunicorn al despertar la instancia, y muestra el tiempo total y
+los módulos que más tardan en importarse (tiempo acumulado, incluye sus
+dependencias).
+
+Uso:
+    python benchmarks/bench_startup.py [--module app] [--top 20] [--runs 3] [--json startup.json]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Formato de -X importtime: "import time: self [us] | cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def run_import(module: str, env: dict) -> dict:
+    """Importar el módulo en un proceso nuevo y recoger los tiempos de importación"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{proc.stderr[-2000:]}")
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": len(indent) // 2
+            })
+
+    return {
+        "import_s": float(proc.stdout.strip().splitlines()[-1]),
+        "process_s": wall,
+        "modules": modules
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reporte del tiempo de importación de la aplicación')
+    parser.add_argument('--module', default='app', help='Módulo a importar (por defecto app)')
+    parser.add_argument('--top', type=int, default=20, help='Módulos más lentos a mostrar')
+    parser.add_argument('--runs', type=int, default=3, help='Repeticiones (se reporta la mediana)')
+    parser.add_argument('--json', help='Guardar el reporte en este archivo JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = dict(os.environ)
+        env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp_dir, 'startup.db')}")
+        env.setdefault("LOG_FILE", os.path.join(tmp_dir, "startup.log"))
+        env["WEBHOOK_ASYNC"] = "false"  # no iniciar hilos de workers durante la medición
+
+        runs = [run_import(args.module, env) for _ in range(args.runs)]
+
+    runs.sort(key=lambda r: r["import_s"])
+    median = runs[len(runs) // 2]
+    # Importaciones directas del módulo (profundidad 1) y módulos con más tiempo propio
+    direct = [m for m in median["modules"] if m["depth"] == 1]
+    slowest = sorted(direct, key=lambda m: m["cumulative_ms"], reverse=True)[:args.top]
+    heaviest = sorted(median["modules"], key=lambda m: m["self_ms"], reverse=True)[:args.top]
+
+    print("=" * 60)
+    print("REPORTE DE ARRANQUE")
+    print("=" * 60)
+    print(f"Módulo: {args.module} ({args.runs} ejecuciones, mediana)")
+    print(f"Importación:        {median['import_s'] * 1000:8.1f} ms")
+    print(f"Proceso completo:   {median['process_s'] * 1000:8.1f} ms")
+    print(f"Módulos importados: {len(median['modules']):8d}")
+    print()
+    print(f"Importaciones directas de {args.module}:")
+    print(f"{'acumulado (ms)':>15}  {'propio (ms)':>12}  módulo")
+    for module in slowest:
+        print(f"{module['cumulative_ms']:15.1f}  {module['self_ms']:12.1f}  {module['module']}")
+    print()
+    print("Módulos con más tiempo propio:")
+    for module in heaviest:
+        print(f"{module['self_ms']:15.1f} ms  {module['module']}")
+
+    loaded = {m["module"].split(".")[0] for m in median["modules"]}
+    for heavy in ("googleapiclient", "google_auth_oauthlib", "psycopg"):
+        print(f"{heavy}: {'importado' if heavy in loaded else 'no importado'}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                "module": args.module,
+                "import_ms": median["import_s"] * 1000,
+                "process_ms": median["process_s"] * 1000,
+                "modules": len(median["modules"]),
+                "direct_imports": slowest,
+                "heaviest": heaviest
+            }, f, indent=2)
+        print(f"\nReporte guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
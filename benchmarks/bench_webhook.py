@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de extremo a extremo del endpoint de webhooks
+
+Levanta servidores HTTP locales que imitan a OpenSolar
+(GET /orgs/<org>/projects/<id>/) y a Resend (POST /emails y /emails/batch),
+con latencia y tasa de errores configurables, y apunta la aplicación a ellos
+con OPENSOLAR_API_BASE y RESEND_API_URL. Después envía webhooks de acciones
+completadas a /webhook/opensolar a un ritmo fijo (carga de lazo abierto: cada
+petición sale a su hora aunque las anteriores no hayan terminado) y reporta:
+
+- Throughput logrado (peticiones y webhooks procesados por segundo)
+- Latencia de las peticiones admitidas (p50 / p95 / p99); las respuestas que
+  no son 2xx (rechazos del control de admisión, errores) se cuentan aparte
+- Latencia de cada etapa del procesamiento (las mismas de /metrics) y del
+  procesamiento completo
+- Peticiones recibidas por los servidores simulados
+
+Con --json los resultados se guardan junto con los parámetros y el commit,
+para comparar ejecuciones y detectar regresiones.
+
+Uso:
+    python benchmarks/bench_webhook.py [--rps 50] [--requests 500] [--sync] [--max-in-flight 0]
+        [--opensolar-latency-ms 80] [--resend-latency-ms 120] [--resend-error-rate 0.01]
+        [--json webhook.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Agregar el directorio raíz del proyecto al path
+sys.path.insert(0, ROOT_DIR)
+
+WEBHOOK_SECRET = "bench-webhook-secret"
+ORG_ID = "1"
+
+
+class FakeAPIServer:
+    """Servidor HTTP local con latencia y errores simulados"""
+
+    def __init__(self, name: str, latency_ms: float, jitter_ms: float, error_rate: float, error_status: int):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.counts = defaultdict(int)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"fake-{name}", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def wait(self):
+        """Simular la latencia de la API (con jitter uniforme)"""
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+    def respond(self, path: str, body: bytes):
+        """Respuesta (status, dict) de la API simulada; la implementa cada servidor"""
+        raise NotImplementedError
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como las APIs reales
+
+            def _reply(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                fake.wait()
+                if fake.fails():
+                    fake.count("errors")
+                    status, data = fake.error_status, {"message": "simulated error"}
+                else:
+                    status, data = fake.respond(self.path, body)
+                fake.count(str(status))
+
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _reply
+            do_POST = _reply
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class FakeOpenSolar(FakeAPIServer):
+    """GET /orgs/<org>/projects/<id>/ con un proyecto y su contacto principal"""
+
+    def respond(self, path: str, body: bytes):
+        parts = [p for p in path.split("/") if p]
+        if len(parts) != 4 or parts[0] != "orgs" or parts[2] != "projects" or not parts[3].isdigit():
+            return 404, {"detail": "Not found."}
+        return 200, fake_project(int(parts[3]))
+
+
+class FakeResend(FakeAPIServer):
+    """POST /emails (un email) y POST /emails/batch (lote)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._next_id = 0
+
+    def _message_id(self) -> str:
+        with self._lock:
+            self._next_id += 1
+            return f"bench-{self._next_id}"
+
+    def respond(self, path: str, body: bytes):
+        if path.rstrip("/") == "/emails":
+            return 200, {"id": self._message_id()}
+        if path.rstrip("/") == "/emails/batch":
+            messages = json.loads(body or b"[]")
+            return 200, {"data": [{"id": self._message_id()} for _ in messages]}
+        return 404, {"message": "Not found"}
+
+
+def fake_project(project_id: int) -> dict:
+    return {
+        "id": project_id,
+        "identifier": f"BENCH-{project_id}",
+        "title": f"Proyecto {project_id} 5kW",
+        "address": "Calle 10 # 20-30, Bogotá",
+        "contacts_data": [{
+            "first_name": "María",
+            "family_name": "Pérez",
+            "email": f"cliente{project_id}@example.com",
+            "phone": "+57 300 000 0000",
+            "display": "María Pérez"
+        }]
+    }
+
+
+def webhook_payload(i: int, projects: int, titles: list, full_project: bool) -> dict:
+    """Evento de acción completada (id de acción único para no caer en la deduplicación)"""
+    project_id = 1000 + i % projects
+    return {
+        "model": "Event",
+        "event": "CREATE",
+        "fields": {
+            "id": 1_000_000 + i,
+            "title": titles[i % len(titles)],
+            "is_complete": True,
+            "completion_date": datetime.now(timezone.utc).isoformat(),
+            "project_data": fake_project(project_id) if full_project else {"id": project_id}
+        }
+    }
+
+
+def percentiles(values: list) -> dict:
+    """p50 / p95 / p99 en milisegundos"""
+    if not values:
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(int(len(values) * q), len(values) - 1)] * 1000
+
+    return {"count": len(values), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def configure_environment(args, tmp_dir: str, opensolar: FakeAPIServer, resend: FakeAPIServer):
+    """Variables de entorno de la aplicación (antes de importar app)"""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+        "LOG_FILE": os.path.join(tmp_dir, "bench.log"),
+        "LOG_LEVEL": args.log_level,
+        "METRICS_DIR": "",
+        "OPENSOLAR_API_BASE": opensolar.url,
+        "OPENSOLAR_ORG_ID": ORG_ID,
+        "OPENSOLAR_TOKEN": "bench-token",
+        "OPENSOLAR_CACHE_TTL": str(args.opensolar_cache_ttl),
+        "RESEND_API_URL": f"{resend.url}/emails",
+        "RESEND_API_KEY": "bench-key",
+        "RESEND_BATCH_ENABLED": "true" if args.resend_batch else "false",
+        "MAIL_TRANSPORTS": "resend",
+        "WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "WEBHOOK_ASYNC": "false" if args.sync else "true",
+        "WEBHOOK_PAYLOAD_FAST_PATH": "true" if args.full_payload else "false",
+        "JOB_WORKER_THREADS": str(args.workers),
+        "JOB_POLL_INTERVAL": "0.05",
+        "NOTIFICATION_DIGEST_WINDOW": "0",
+        "ADMISSION_MAX_IN_FLIGHT": str(args.max_in_flight),
+        "ADMISSION_MAX_QUEUE_DEPTH": str(args.max_queue_depth)
+    })
+
+
+def record_observations(metrics) -> dict:
+    """Guardar cada observación de los histogramas además de acumularla (para percentiles exactos)"""
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    observe = metrics.observe
+
+    def recording_observe(name, value, **labels):
+        observe(name, value, **labels)
+        key = labels.get("stage", name)
+        with lock:
+            samples[key].append(value)
+
+    metrics.observe = recording_observe
+    return samples
+
+
+def drive(client_factory, payloads: list, rps: float, concurrency: int):
+    """
+    Enviar los webhooks a ritmo fijo
+
+    Returns:
+        Tupla (latencias en segundos de las respuestas 2xx, latencias del resto,
+        códigos HTTP, retraso máximo de salida, duración)
+    """
+    latencies = []
+    rejected_latencies = []
+    statuses = defaultdict(int)
+    lock = threading.Lock()
+    local = threading.local()
+    headers = {"X-Webhook-Secret": WEBHOOK_SECRET}
+    max_lag = [0.0]
+
+    def send(payload, scheduled):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = client_factory()
+        started = time.perf_counter()
+        response = client.post("/webhook/opensolar", json=payload, headers=headers)
+        elapsed = time.perf_counter() - started
+        with lock:
+            if 200 <= response.status_code < 300:
+                latencies.append(elapsed)
+            else:
+                rejected_latencies.append(elapsed)
+            statuses[response.status_code] += 1
+            max_lag[0] = max(max_lag[0], started - scheduled)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, payload in enumerate(payloads):
+            scheduled = started + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, payload, scheduled)
+    return latencies, rejected_latencies, dict(statuses), max_lag[0], time.perf_counter() - started
+
+
+def wait_for_jobs(job_queue, timeout: float) -> int:
+    """Esperar a que los workers vacíen la cola (devuelve los trabajos que quedaron pendientes)"""
+    deadline = time.monotonic() + timeout
+    pending = job_queue.count_pending()
+    while pending and time.monotonic() < deadline:
+        time.sleep(0.05)
+        pending = job_queue.count_pending()
+    return pending
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de extremo a extremo del endpoint de webhooks')
+    parser.add_argument('--rps', type=float, default=50, help='Peticiones por segundo')
+    parser.add_argument('--requests', type=int, default=500, help='Webhooks a enviar')
+    parser.add_argument('--duration', type=float, help='Segundos de carga (reemplaza a --requests)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Peticiones simultáneas como máximo')
+    parser.add_argument('--projects', type=int, default=50, help='Proyectos distintos entre los que se reparten los eventos')
+    parser.add_argument('--sync', action='store_true', help='Procesar en el hilo de la petición (WEBHOOK_ASYNC=false)')
+    parser.add_argument('--workers', type=int, default=4, help='Hilos de la cola de trabajos (modo asíncrono)')
+    parser.add_argument('--full-payload', action='store_true',
+                        help='Incluir el proyecto completo en el webhook (camino rápido, sin consultar OpenSolar)')
+    parser.add_argument('--opensolar-cache-ttl', type=int, default=0, help='OPENSOLAR_CACHE_TTL (0 consulta siempre la API)')
+    parser.add_argument('--resend-batch', action='store_true', help='Envío por lotes de Resend')
+    parser.add_argument('--max-in-flight', type=int, default=0,
+                        help='ADMISSION_MAX_IN_FLIGHT (0 sin límite; con límite, el exceso se responde 503)')
+    parser.add_argument('--max-queue-depth', type=int, default=0,
+                        help='ADMISSION_MAX_QUEUE_DEPTH (0 sin límite; con límite, el exceso se responde 429)')
+    parser.add_argument('--opensolar-latency-ms', type=float, default=80)
+    parser.add_argument('--opensolar-jitter-ms', type=float, default=20)
+    parser.add_argument('--opensolar-error-rate', type=float, default=0.0)
+    parser.add_argument('--resend-latency-ms', type=float, default=120)
+    parser.add_argument('--resend-jitter-ms', type=float, default=30)
+    parser.add_argument('--resend-error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=500, help='Código HTTP de los errores simulados')
+    parser.add_argument('--drain-timeout', type=float, default=120, help='Segundos máximos de espera de la cola')
+    parser.add_argument('--log-level', default='CRITICAL',
+                        help='Nivel de log de la aplicación (los errores simulados se registran como ERROR)')
+    parser.add_argument('--json', help='Guardar los resultados en este archivo JSON')
+    args = parser.parse_args()
+
+    total = int(args.duration * args.rps) if args.duration else args.requests
+
+    opensolar = FakeOpenSolar("opensolar", args.opensolar_latency_ms, args.opensolar_jitter_ms,
+                              args.opensolar_error_rate, args.error_status)
+    resend = FakeResend("resend", args.resend_latency_ms, args.resend_jitter_ms,
+                        args.resend_error_rate, args.error_status)
+    opensolar.start()
+    resend.start()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        configure_environment(args, tmp_dir, opensolar, resend)
+        import app as webhook_app
+
+        samples = record_observations(webhook_app.metrics)
+        titles = list(webhook_app.config.ACTION_DESCRIPTIONS)
+        payloads = [webhook_payload(i, args.projects, titles, args.full_payload) for i in range(total)]
+
+        started = time.perf_counter()
+        latencies, rejected_latencies, statuses, max_lag, send_time = drive(
+            webhook_app.app.test_client, payloads, args.rps, args.concurrency
+        )
+        pending = 0
+        if webhook_app.job_worker_pool or webhook_app.batch_dispatcher:
+            pending = wait_for_jobs(webhook_app.job_queue, args.drain_timeout)
+        if webhook_app.batch_dispatcher:
+            webhook_app.batch_dispatcher.stop()
+        elapsed = time.perf_counter() - started
+
+        processed = webhook_app.metrics.snapshot()["counters"]
+        outcomes = {dict(labels)["status"]: int(value) for (name, labels), value in processed.items()
+                    if name == "webhooks_processed_total"}
+
+        if webhook_app.job_worker_pool:
+            webhook_app.job_worker_pool.stop()
+
+    opensolar.stop()
+    resend.stop()
+
+    stage_names = [name for name in samples if name not in ("webhook_processing_duration_seconds",)]
+    results = {
+        "requests": total,
+        "send_seconds": send_time,
+        "elapsed_seconds": elapsed,
+        "achieved_rps": total / send_time if send_time else None,
+        "throughput_per_second": sum(outcomes.values()) / elapsed if elapsed else None,
+        "max_send_lag_ms": max_lag * 1000,
+        "http_status": {str(k): v for k, v in sorted(statuses.items())},
+        "outcomes": outcomes,
+        "pending_jobs": pending,
+        "non_2xx": len(rejected_latencies),
+        "request_latency": percentiles(latencies),
+        "non_2xx_latency": percentiles(rejected_latencies),
+        "processing_latency": percentiles(samples.get("webhook_processing_duration_seconds", [])),
+        "stages": {stage: percentiles(samples[stage]) for stage in stage_names},
+        "fake_apis": {"opensolar": dict(opensolar.counts), "resend": dict(resend.counts)}
+    }
+
+    print("=" * 60)
+    print("BENCHMARK DE EXTREMO A EXTREMO DE WEBHOOKS")
+    print("=" * 60)
+    print(f"Modo: {'síncrono' if args.sync else f'asíncrono ({args.workers} workers)'}, "
+          f"{total} webhooks a {args.rps:g} rps, {args.projects} proyectos")
+    print(f"Admisión: peticiones en curso {args.max_in_flight or 'sin límite'}, "
+          f"trabajos pendientes {args.max_queue_depth or 'sin límite'}")
+    print(f"Ritmo logrado:       {results['achieved_rps']:8.1f} peticiones/s "
+          f"(retraso máximo de salida {results['max_send_lag_ms']:.1f} ms)")
+    print(f"Throughput:          {results['throughput_per_second']:8.1f} webhooks procesados/s "
+          f"({elapsed:.2f} s en total)")
+    print(f"Códigos HTTP:        {results['http_status']}")
+    if results["non_2xx"]:
+        print(f"Respuestas no 2xx:   {results['non_2xx']} (excluidas de la latencia de petición HTTP)")
+    print(f"Resultados:          {outcomes}")
+    if pending:
+        print(f"Trabajos pendientes al terminar la espera: {pending}")
+    print()
+    print(f"{'':24}{'n':>7}{'p50 (ms)':>11}{'p95 (ms)':>11}{'p99 (ms)':>11}")
+    rows = [("petición HTTP (2xx)", results["request_latency"]), ("respuestas no 2xx", results["non_2xx_latency"]),
+            ("procesamiento", results["processing_latency"])]
+    rows += [(f"  {stage}", stats) for stage, stats in results["stages"].items()]
+    for label, stats in rows:
+        if not stats["count"]:
+            continue
+        print(f"{label:<24}{stats['count']:7d}{stats['p50_ms']:11.2f}{stats['p95_ms']:11.2f}{stats['p99_ms']:11.2f}")
+    print()
+    print(f"OpenSolar simulado: {results['fake_apis']['opensolar']}")
+    print(f"Resend simulado:    {results['fake_apis']['resend']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                "benchmark": "webhook",
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "commit": git_commit(),
+                "args": vars(args),
+                "results": results
+            }, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,35 +17,125 @@ class Config:
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///notifications.db')
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '8192'))
+    DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))  # solo PostgreSQL
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '5'))  # solo PostgreSQL
     
     # OpenSolar API
     OPENSOLAR_TOKEN = os.getenv('OPENSOLAR_TOKEN', '')
     OPENSOLAR_ORG_ID = os.getenv('OPENSOLAR_ORG_ID', '80856')
-    OPENSOLAR_API_BASE = 'https://api.opensolar.com/api'
+    OPENSOLAR_API_BASE = os.getenv('OPENSOLAR_API_BASE', 'https://api.opensolar.com/api')
+    OPENSOLAR_CACHE_SIZE = int(os.getenv('OPENSOLAR_CACHE_SIZE', '256'))
+    OPENSOLAR_CACHE_TTL = int(os.getenv('OPENSOLAR_CACHE_TTL', '300'))  # segundos, 0 desactiva la caché
+    OPENSOLAR_REQUEST_TIMEOUT = 30  # segundos por intento de consulta de un proyecto
+    # Segundos que un worker reserva la consulta de un proyecto; None la deriva del
+    # timeout y de los reintentos HTTP para que no venza a mitad de la consulta
+    OPENSOLAR_LEASE_TTL = None
+    OPENSOLAR_LEASE_POLL_INTERVAL = 0.1  # segundos
     
     # Webhook
     WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', 'dev-webhook-secret')
     WEBHOOK_URL = os.getenv('WEBHOOK_URL', 'http://localhost:5000/webhook/opensolar')
     
+    # Procesamiento asíncrono de webhooks (cola persistente en la base de datos)
+    WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', 'true').lower() == 'true'
+    JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', '2'))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '0.5'))  # segundos
+    JOB_LEASE_SECONDS = 300
+    JOB_MAX_ATTEMPTS = 5
+    # Segundos que se conservan los trabajos terminados antes de eliminarlos (0 = no eliminar)
+    JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', str(7 * 24 * 3600)))
+    
+    # Usar los datos del proyecto del payload del webhook cuando estén completos
+    # (solo se consulta la API de OpenSolar si faltan campos)
+    WEBHOOK_PAYLOAD_FAST_PATH = os.getenv('WEBHOOK_PAYLOAD_FAST_PATH', 'true').lower() == 'true'
+    # Grabar cada webhook recibido (headers y cuerpo) en este archivo NDJSON para
+    # reproducirlo con webhook_replay.py (vacío = desactivado)
+    WEBHOOK_RECORD_PATH = os.getenv('WEBHOOK_RECORD_PATH', '')
+    
+    # Control de admisión del webhook (0 = sin límite): peticiones en curso por
+    # worker (503) y trabajos pendientes en la cola (429), ambos con Retry-After
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '4'))
+    ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv('ADMISSION_MAX_QUEUE_DEPTH', '1000'))
+    ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '10'))  # segundos
+    ADMISSION_QUEUE_CHECK_INTERVAL = 1.0  # segundos entre consultas de la profundidad de la cola
+    
     # Resend API
     RESEND_API_KEY = os.getenv('RESEND_API_KEY', '')
+    RESEND_API_URL = os.getenv('RESEND_API_URL', 'https://api.resend.com/emails')
+    # Envío por lotes: agrupar emails hasta RESEND_BATCH_MAX_WAIT_MS o RESEND_BATCH_SIZE mensajes
+    RESEND_BATCH_ENABLED = os.getenv('RESEND_BATCH_ENABLED', 'false').lower() == 'true'
+    RESEND_BATCH_SIZE = int(os.getenv('RESEND_BATCH_SIZE', '50'))  # máximo 100
+    RESEND_BATCH_MAX_WAIT_MS = int(os.getenv('RESEND_BATCH_MAX_WAIT_MS', '200'))
+    
+    # Conexiones HTTP (pool keep-alive por worker para OpenSolar y Resend)
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))
+    HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+    HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.3'))
+    
+    # Proveedores de email en orden de preferencia: resend, gmail_smtp, gmail_api.
+    # Se envía por el más sano y se pasa al siguiente si falla
+    MAIL_TRANSPORTS = [t.strip() for t in os.getenv('MAIL_TRANSPORTS', 'resend').split(',') if t.strip()]
+    MAIL_ROUTER_FAILURE_THRESHOLD = int(os.getenv('MAIL_ROUTER_FAILURE_THRESHOLD', '3'))
+    MAIL_ROUTER_COOLDOWN = float(os.getenv('MAIL_ROUTER_COOLDOWN', '30'))  # segundos
     
     # Gmail SMTP (deprecated - usando Resend)
     GMAIL_SMTP_PASSWORD = os.getenv('GMAIL_SMTP_PASSWORD', '')
     GMAIL_FROM_EMAIL = 'admin@greenhproject.com'
     GMAIL_FROM_NAME = 'Green House Project'
+    # Pool de conexiones SMTP autenticadas (se reutilizan entre envíos)
+    GMAIL_SMTP_POOL_SIZE = int(os.getenv('GMAIL_SMTP_POOL_SIZE', '2'))
+    GMAIL_SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv('GMAIL_SMTP_MAX_MESSAGES_PER_CONNECTION', '100'))
+    # Documento de discovery de Gmail API guardado en disco (evita buscarlo en cada arranque)
+    GMAIL_DISCOVERY_CACHE_FILE = os.getenv('GMAIL_DISCOVERY_CACHE_FILE', '.cache/gmail_v1_discovery.json')
     
     # Notificaciones
     NOTIFICATION_RETRY_ATTEMPTS = 3
-    NOTIFICATION_RETRY_DELAY = 2  # segundos
+    NOTIFICATION_RETRY_DELAY = 2  # segundos (base del backoff exponencial con jitter)
+    NOTIFICATION_RETRY_MAX_DELAY = int(os.getenv('NOTIFICATION_RETRY_MAX_DELAY', '600'))  # segundos
+    # Segundos tras los que se reintenta un envío si el proceso muere antes de registrar
+    # su resultado (mayor que la duración máxima de un envío)
+    NOTIFICATION_SEND_RECOVERY_DELAY = int(os.getenv('NOTIFICATION_SEND_RECOVERY_DELAY', '300'))
+    # Antigüedad (segundos) a partir de la cual una notificación en 'sending' o 'queued'
+    # sin trabajo de envío se considera interrumpida y se recupera
+    NOTIFICATION_STALE_AFTER = int(os.getenv('NOTIFICATION_STALE_AFTER', '600'))
     RECENT_COMPLETION_THRESHOLD = timedelta(hours=24)
+    # Ventana (segundos) en la que las actualizaciones de progreso de un proyecto se
+    # agrupan en un solo email de resumen; 0 envía cada una por separado.
+    # Requiere base de datos y WEBHOOK_ASYNC
+    NOTIFICATION_DIGEST_WINDOW = int(os.getenv('NOTIFICATION_DIGEST_WINDOW', '0'))
+    # Veces que un resumen se pospone (una ventana cada vez) mientras la primera
+    # notificación del proyecto sigue pendiente; después se envía sin esperarla
+    NOTIFICATION_DIGEST_MAX_DEFERRALS = int(os.getenv('NOTIFICATION_DIGEST_MAX_DEFERRALS', '6'))
+    
+    # Templates de email: en producción sin recarga automática, precargados y con
+    # caché de bytecode en disco (por defecto, activo cuando DEBUG está desactivado)
+    TEMPLATE_PRODUCTION_MODE = os.getenv('TEMPLATE_PRODUCTION_MODE', str(not DEBUG)).lower() == 'true'
+    TEMPLATE_BYTECODE_CACHE_DIR = os.getenv('TEMPLATE_BYTECODE_CACHE_DIR', '.cache/jinja')
+    # Construir los templates al cargarlos: CSS en línea y HTML minificado
+    TEMPLATE_INLINE_CSS = os.getenv('TEMPLATE_INLINE_CSS', 'true').lower() == 'true'
+    # Combinaciones (template, acción) con el HTML estático memoizado (0 desactiva la caché)
+    TEMPLATE_FRAGMENT_CACHE_SIZE = int(os.getenv('TEMPLATE_FRAGMENT_CACHE_SIZE', '256'))
     
     # Portal de clientes
     CLIENT_PORTAL_URL = 'https://www.greenhproject.com/gestionproyectos'
     
+    # Métricas (/metrics): directorio donde cada worker guarda las suyas para agregarlas
+    # entre procesos (vacío para reportar solo las del worker que atiende la consulta)
+    METRICS_DIR = os.getenv('METRICS_DIR', '.cache/metrics')
+    METRICS_DUMP_INTERVAL = float(os.getenv('METRICS_DUMP_INTERVAL', '5'))  # segundos
+    
     # Logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'notifications.log')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' o 'text'
+    # Rotación por tamaño; las copias antiguas se guardan comprimidas (.1.gz, .2.gz, ...)
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    # Fracción de registros DEBUG que se escriben por logger (ej: "app=0.01,services.resend_service=0.1")
+    LOG_DEBUG_SAMPLING = os.getenv('LOG_DEBUG_SAMPLING', '')
     
     # Acciones que activan notificaciones
     TRIGGER_ACTIONS = [
@@ -2,6 +2,11 @@
 Módulo de base de datos
 """
 
-from .models import Database, Notification, ConfigModel
+from .models import (
+    Database, Notification, NotificationRecord, BlobStore, ConfigModel, JobQueue, FetchLease
+)
 
-__all__ = ['Database', 'Notification', 'ConfigModel']
+__all__ = [
+    'Database', 'Notification', 'NotificationRecord', 'BlobStore', 'ConfigModel',
+    'JobQueue', 'FetchLease'
+]
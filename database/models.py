@@ -2,90 +2,302 @@
 Modelos de base de datos para el sistema de notificaciones
 """
 
-import sqlite3
-from datetime import datetime
-from typing import List, Dict, Optional
+import time
+import zlib
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 import json
 
+from .backends import create_backend
+
 
 class Database:
     """Clase para manejar la conexión y operaciones de base de datos"""
     
-    def __init__(self, db_path: str = 'notifications.db'):
-        self.db_path = db_path
+    def __init__(self, database_url: str = 'notifications.db',
+                 cache_size_kb: int = 8192,
+                 mmap_size: int = 64 * 1024 * 1024,
+                 busy_timeout_ms: int = 5000,
+                 pool_min_size: int = 1,
+                 pool_max_size: int = 5):
+        """
+        Inicializar base de datos
+        
+        Args:
+            database_url: URL de la base de datos (sqlite:///ruta.db, postgresql://...)
+                o ruta simple de un archivo SQLite
+            cache_size_kb: Tamaño de la caché de páginas por conexión SQLite (KiB)
+            mmap_size: Bytes del archivo SQLite que se leen con memoria mapeada (0 lo desactiva)
+            busy_timeout_ms: Milisegundos de espera cuando otra conexión SQLite tiene el lock de escritura
+            pool_min_size: Conexiones mínimas del pool de PostgreSQL
+            pool_max_size: Conexiones máximas del pool de PostgreSQL
+        """
+        self.database_url = database_url
+        self.backend = create_backend(
+            database_url,
+            cache_size_kb=cache_size_kb,
+            mmap_size=mmap_size,
+            busy_timeout_ms=busy_timeout_ms,
+            pool_min_size=pool_min_size,
+            pool_max_size=pool_max_size
+        )
+        self.dialect = self.backend.dialect
         self.init_database()
     
-    def get_connection(self):
-        """Obtener conexión a la base de datos"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Para acceder a columnas por nombre
-        return conn
+    def connection(self):
+        """
+        Contexto de una operación sobre la base de datos
+        
+        Hace commit al salir del bloque o rollback si hubo una excepción. Los
+        bloques anidados en el mismo hilo comparten la transacción del exterior,
+        de modo que varias operaciones de los modelos pueden confirmarse juntas.
+        """
+        return self.backend.connection()
+    
+    def close(self):
+        """Cerrar las conexiones del backend"""
+        self.backend.close()
     
     def init_database(self):
         """Inicializar la base de datos con las tablas necesarias"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Tabla de notificaciones
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER NOT NULL,
-                project_identifier TEXT,
-                project_title TEXT,
-                action_id INTEGER NOT NULL,
-                action_title TEXT NOT NULL,
-                recipient_email TEXT NOT NULL,
-                recipient_name TEXT,
-                email_type TEXT NOT NULL,
-                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                email_subject TEXT,
-                email_body TEXT,
-                status TEXT DEFAULT 'sent',
-                error_message TEXT,
-                webhook_data TEXT
-            )
-        ''')
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            if self.dialect == 'postgresql':
+                # Evitar que varios workers creen el esquema al mismo tiempo
+                cursor.execute('SELECT pg_advisory_xact_lock(7772938)')
+            
+            # Tabla de notificaciones
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS notifications (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    project_id INTEGER NOT NULL,
+                    project_identifier TEXT,
+                    project_title TEXT,
+                    action_id INTEGER NOT NULL,
+                    action_title TEXT NOT NULL,
+                    recipient_email TEXT NOT NULL,
+                    recipient_name TEXT,
+                    email_type TEXT NOT NULL,
+                    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    email_subject TEXT,
+                    email_body TEXT,
+                    status TEXT DEFAULT 'sent',
+                    error_message TEXT,
+                    webhook_data TEXT,
+                    email_body_hash TEXT,
+                    webhook_data_hash TEXT,
+                    provider_message_id TEXT,
+                    digest_claim TEXT,
+                    delivery_job_id INTEGER
+                )
+            ''')
+            
+            # Bases creadas antes del almacenamiento por contenido
+            self._add_column_if_missing(cursor, 'notifications', 'email_body_hash', 'TEXT')
+            self._add_column_if_missing(cursor, 'notifications', 'webhook_data_hash', 'TEXT')
+            self._add_column_if_missing(cursor, 'notifications', 'provider_message_id', 'TEXT')
+            self._add_column_if_missing(cursor, 'notifications', 'digest_claim', 'TEXT')
+            self._add_column_if_missing(cursor, 'notifications', 'delivery_job_id', 'INTEGER')
+            
+            # Contenidos comprimidos (cuerpos de email y payloads) direccionados por su hash
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Tabla de configuración
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS config (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Crear índices
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_project_id 
+                ON notifications(project_id)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_sent_at 
+                ON notifications(sent_at)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_status 
+                ON notifications(status)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_action_id 
+                ON notifications(action_id)
+            ''')
+            
+            # Índices para la paginación por cursor (sent_at, id)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_sent_at_id 
+                ON notifications(sent_at, id)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_project_sent_at_id 
+                ON notifications(project_id, sent_at, id)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_status_sent_at_id 
+                ON notifications(status, sent_at, id)
+            ''')
+            
+            # Índice compuesto que cubre la verificación de duplicados y de primera notificación
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_project_status_action 
+                ON notifications(project_id, status, action_id)
+            ''')
+            
+            # Tabla de trabajos en cola (webhooks pendientes de procesar)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    max_attempts INTEGER DEFAULT 5,
+                    run_at REAL NOT NULL,
+                    locked_until REAL,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at 
+                ON jobs(status, run_at)
+            ''')
+            
+            # Tabla de leases para coalescer peticiones entre procesos
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fetch_leases (
+                    lease_key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    result TEXT,
+                    completed_at REAL
+                )
+            ''')
+
+
+    def _add_column_if_missing(self, cursor, table: str, column: str, definition: str):
+        """Agregar una columna a una tabla existente si aún no la tiene"""
+        if self.dialect == 'postgresql':
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}')
+            return
         
-        # Tabla de configuración
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS config (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [row['name'] for row in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+class BlobStore:
+    """Almacén de contenidos comprimidos con zlib y direccionados por su hash SHA-256"""
+    
+    def __init__(self, db: Database, compression_level: int = 6):
+        self.db = db
+        self.compression_level = compression_level
+    
+    def put(self, cursor, content: str) -> str:
+        """
+        Guardar un contenido (solo se almacena una vez aunque se repita)
         
-        # Crear índices
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_project_id 
-            ON notifications(project_id)
-        ''')
+        Args:
+            cursor: Cursor de la transacción en curso
+            content: Texto a guardar
+            
+        Returns:
+            Hash del contenido
+        """
+        data = content.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
         
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_sent_at 
-            ON notifications(sent_at)
-        ''')
+            INSERT INTO blobs (hash, data, size)
+            VALUES (?, ?, ?)
+            ON CONFLICT(hash) DO NOTHING
+        ''', (content_hash, zlib.compress(data, self.compression_level), len(data)))
         
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_status 
-            ON notifications(status)
-        ''')
+        return content_hash
+    
+    def get(self, content_hash: str) -> Optional[str]:
+        """Obtener y descomprimir un contenido por su hash"""
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT data FROM blobs WHERE hash = ?', (content_hash,))
+            row = cursor.fetchone()
         
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_action_id 
-            ON notifications(action_id)
-        ''')
+        if not row:
+            return None
+        return zlib.decompress(row['data']).decode('utf-8')
+
+
+class NotificationRecord(dict):
+    """
+    Notificación leída de la base de datos
+    
+    email_body y webhook_data se guardan comprimidos en la tabla blobs y solo se
+    leen y descomprimen cuando se accede a ellos.
+    """
+    
+    LAZY_FIELDS = {'email_body': 'email_body_hash', 'webhook_data': 'webhook_data_hash'}
+    
+    def __init__(self, row, blob_store: BlobStore):
+        data = dict(row)
+        for field, hash_field in self.LAZY_FIELDS.items():
+            if data.get(field) is None and data.get(hash_field):
+                data.pop(field, None)
+        super().__init__(data)
+        self._blob_store = blob_store
+    
+    def __missing__(self, key):
+        hash_field = self.LAZY_FIELDS.get(key)
+        if hash_field is None or not dict.get(self, hash_field):
+            raise KeyError(key)
         
-        conn.commit()
-        conn.close()
+        value = self._blob_store.get(dict.__getitem__(self, hash_field))
+        self[key] = value
+        return value
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
 
 
 class Notification:
     """Modelo para notificaciones"""
     
+    # Columnas que se leen por defecto en los listados (sin cuerpos de email ni payloads)
+    SUMMARY_COLUMNS = (
+        'id', 'project_id', 'project_identifier', 'project_title',
+        'action_id', 'action_title', 'recipient_email', 'recipient_name',
+        'email_type', 'sent_at', 'email_subject', 'status', 'error_message',
+        'provider_message_id'
+    )
+    
     def __init__(self, db: Database):
         self.db = db
+        self.blob_store = BlobStore(db)
     
     def create(self
 
@@ -102,66 +314,67 @@ class Notification:
                recipient_name: Optional[str] = None,
                webhook_data: Optional[Dict] = None,
                status: str = 'sent',
-               error_message: Optional[str] = None) -> int:
+               error_message: Optional[str] = None,
+               provider_message_id: Optional[str] = None) -> int:
         """
         Crear una nueva notificación en la base de datos
         
         Returns:
             ID de la notificación creada
         """
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        webhook_json = json.dumps(webhook_data) if webhook_data else None
-        
-        cursor.execute('''
-            INSERT INTO notifications (
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            # El cuerpo y el payload se guardan comprimidos y deduplicados en blobs
+            email_body_hash = self.blob_store.put(cursor, email_body) if email_body else None
+            webhook_data_hash = (
+                self.blob_store.put(cursor, json.dumps(webhook_data)) if webhook_data else None
+            )
+            
+            cursor.execute('''
+                INSERT INTO notifications (
+                    project_id, project_identifier, project_title,
+                    action_id, action_title, recipient_email, recipient_name,
+                    email_type, email_subject, email_body_hash,
+                    status, error_message, webhook_data_hash, provider_message_id
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING id
+            ''', (
                 project_id, project_identifier, project_title,
                 action_id, action_title, recipient_email, recipient_name,
-                email_type, email_subject, email_body,
-                status, error_message, webhook_data
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            project_id, project_identifier, project_title,
-            action_id, action_title, recipient_email, recipient_name,
-            email_type, email_subject, email_body,
-            status, error_message, webhook_json
-        ))
-        
-        notification_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+                email_type, email_subject, email_body_hash,
+                status, error_message, webhook_data_hash, provider_message_id
+            ))
+            
+            notification_id = cursor.fetchone()['id']
         
         return notification_id
     
     def get_by_id(self, notification_id: int) -> Optional[Dict]:
         """Obtener notificación por ID"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM notifications WHERE id = ?', (notification_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM notifications WHERE id = ?', (notification_id,))
+            row = cursor.fetchone()
         
         if row:
-            return dict(row)
+            return NotificationRecord(row, self.blob_store)
         return None
     
-    def get_by_project(self, project_id: int) -> List[Dict]:
-        """Obtener todas las notificaciones de un proyecto"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM notifications 
-            WHERE project_id = ? 
-            ORDER BY sent_at DESC
-        ''', (project_id,))
-        
-        rows = cursor.fetchall()
-        conn.close()
+    def get_by_project(self, project_id: int, limit: Optional[int] = None,
+                       after: Optional[Tuple] = None,
+                       columns: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Obtener las notificaciones de un proyecto (más recientes primero)
         
-        return [dict(row) for row in rows]
+        Args:
+            project_id: ID del proyecto
+            limit: Número máximo de notificaciones (None para todas)
+            after: Cursor (sent_at, id) de la última notificación de la página anterior
+            columns: Columnas a leer (por defecto SUMMARY_COLUMNS, sin cuerpos ni payloads)
+        """
+        return self._query_page({'project_id': project_id}, columns, after, limit)
     
     def check_if_notified(self, project_id: int, action_id: int) -> bool:
         """
@@ -170,19 +383,7 @@ class Notification:
         Returns:
             True si ya se notificó, False si no
         """
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT COUNT(*) as count 
-            FROM notifications 
-            WHERE project_id = ? AND action_id = ? AND status = 'sent'
-        ''', (project_id, action_id))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result['count'] > 0
+        return self.get_notification_state(project_id, action_id)['already_notified']
     
     def check_if_first_notification(self, project_id: int) -> bool:
         """
@@ -191,65 +392,304 @@ class Notification:
         Returns:
             True si es la primera, False si ya hay notificaciones previas
         """
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT EXISTS (
+                    SELECT 1 FROM notifications 
+                    WHERE project_id = ? AND status IN ('sent', 'sending', 'queued', 'buffered', 'digesting')
+                ) as has_previous
+            ''', (project_id,))
+            
+            result = cursor.fetchone()
         
-        cursor.execute('''
-            SELECT COUNT(*) as count 
-            FROM notifications 
-            WHERE project_id = ? AND status = 'sent'
-        ''', (project_id,))
+        return not result['has_previous']
+    
+    def get_notification_state(self, project_id: int, action_id: int) -> Dict[str, bool]:
+        """
+        Verificar en una sola consulta si la acción ya se notificó y si el
+        proyecto tiene notificaciones enviadas previamente
+        
+        Ambas comprobaciones usan el índice (project_id, status, action_id),
+        por lo que su costo no crece con el tamaño de la tabla. Las notificaciones
+        en envío, en cola de reintento o de un lote, o retenidas para un resumen
+        cuentan como realizadas para no duplicarlas.
         
-        result = cursor.fetchone()
-        conn.close()
+        Returns:
+            Dict con 'already_notified' e 'is_first_notification'
+        """
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT 
+                    EXISTS (
+                        SELECT 1 FROM notifications 
+                        WHERE project_id = ? AND status IN ('sent', 'sending', 'queued', 'buffered', 'digesting') AND action_id = ?
+                    ) as already_notified,
+                    EXISTS (
+                        SELECT 1 FROM notifications 
+                        WHERE project_id = ? AND status IN ('sent', 'sending', 'queued', 'buffered', 'digesting')
+                    ) as has_previous
+            ''', (project_id, action_id, project_id))
+            
+            result = cursor.fetchone()
         
-        return result['count'] == 0
+        return {
+            'already_notified': bool(result['already_notified']),
+            'is_first_notification': not result['has_previous']
+        }
+    
+    def update_status(self, notification_id: int, status: str, error_message: Optional[str] = None,
+                      provider_message_id: Optional[str] = None):
+        """Actualizar el estado de una notificación (y el ID asignado por el proveedor, si se conoce)"""
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE notifications 
+                SET status = ?, error_message = ?, 
+                    provider_message_id = COALESCE(?, provider_message_id) 
+                WHERE id = ?
+            ''', (status, error_message, provider_message_id, notification_id))
     
-    def update_status(self, notification_id: int, status: str, error_message: Optional[str] = None):
-        """Actualizar el estado de una notificación"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+    def set_delivery_job(self, notification_id: int, job_id: int):
+        """Asociar a la notificación el trabajo que la enviará ('send_email' o 'batch_email')"""
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE notifications SET delivery_job_id = ? WHERE id = ?
+            ''', (job_id, notification_id))
+    
+    def claim_stale(self, older_than: float, status: str, error_message: str,
+                    limit: int = 100) -> List[Dict]:
+        """
+        Tomar las notificaciones que quedaron en 'sending' o 'queued' sin trabajo de envío
         
-        cursor.execute('''
-            UPDATE notifications 
-            SET status = ?, error_message = ? 
-            WHERE id = ?
-        ''', (status, error_message, notification_id))
+        Una notificación queda así si el proceso murió entre registrarla y
+        enviarla (o encolar su envío). Las que tienen su trabajo pendiente o en
+        proceso no se tocan, aunque sean antiguas.
         
-        conn.commit()
-        conn.close()
+        Args:
+            older_than: Segundos desde su registro a partir de los cuales se consideran abandonadas
+            status: Nuevo estado ('queued' para reenviarlas o 'failed')
+            error_message: Motivo que se registra
+            limit: Máximo de notificaciones por llamada
+            
+        Returns:
+            Lista de dicts con id, recipient_name y email_subject
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=older_than)).strftime('%Y-%m-%d %H:%M:%S')
+        lock_clause = 'FOR UPDATE SKIP LOCKED' if self.db.dialect == 'postgresql' else ''
+        
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                UPDATE notifications 
+                SET status = ?, error_message = ?, delivery_job_id = NULL 
+                WHERE id IN (
+                    SELECT n.id FROM notifications n 
+                    WHERE n.status IN ('sending', 'queued') AND n.sent_at < ? 
+                      AND NOT EXISTS (
+                          SELECT 1 FROM jobs j 
+                          WHERE j.id = n.delivery_job_id AND j.status IN ('pending', 'processing')
+                      )
+                    ORDER BY n.id 
+                    LIMIT ?
+                    {lock_clause}
+                )
+                RETURNING id, recipient_name, email_subject
+            ''', (status, error_message, cutoff, limit))
+            
+            rows = cursor.fetchall()
+        
+        return [dict(row) for row in rows]
     
-    def get_recent_notifications(self, limit: int = 50) -> List[Dict]:
-        """Obtener las notificaciones más recientes"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+    def update_statuses(self, notification_ids: List[int], status: str,
+                        error_message: Optional[str] = None,
+                        provider_message_id: Optional[str] = None):
+        """Actualizar el estado de varias notificaciones (por ejemplo las de un resumen)"""
+        if not notification_ids:
+            return
         
-        cursor.execute('''
-            SELECT * FROM notifications 
-            ORDER BY sent_at DESC 
-            LIMIT ?
-        ''', (limit,))
+        placeholders = ', '.join('?' for _ in notification_ids)
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                UPDATE notifications 
+                SET status = ?, error_message = ?, 
+                    provider_message_id = COALESCE(?, provider_message_id) 
+                WHERE id IN ({placeholders})
+            ''', (status, error_message, provider_message_id, *notification_ids))
+    
+    def has_pending(self, project_id: int, email_type: str) -> bool:
+        """Verificar si el proyecto tiene una notificación de ese tipo en envío o en cola de envío"""
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT EXISTS (
+                    SELECT 1 FROM notifications 
+                    WHERE project_id = ? AND status IN ('sending', 'queued') AND email_type = ?
+                ) as pending
+            ''', (project_id, email_type))
+            
+            result = cursor.fetchone()
         
-        rows = cursor.fetchall()
-        conn.close()
+        return bool(result['pending'])
+    
+    def is_oldest_buffered(self, project_id: int, notification_id: int) -> bool:
+        """
+        Verificar si una notificación retenida es la más antigua del proyecto
         
-        return [dict(row) for row in rows]
+        La más antigua abre la ventana del resumen y es la que programa su envío.
+        """
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT MIN(id) as oldest_id FROM notifications 
+                WHERE project_id = ? AND status = 'buffered'
+            ''', (project_id,))
+            
+            result = cursor.fetchone()
+        
+        return result['oldest_id'] == notification_id
     
-    def get_failed_notifications(self) -> List[Dict]:
-        """Obtener notificaciones fallidas"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+    def claim_buffered(self, project_id: int, claim_id: str) -> List[Dict]:
+        """
+        Tomar de forma atómica las notificaciones retenidas de un proyecto
         
-        cursor.execute('''
-            SELECT * FROM notifications 
-            WHERE status = 'failed' 
-            ORDER BY sent_at DESC
-        ''')
+        Las notificaciones pasan a 'digesting' marcadas con claim_id, de modo que
+        otro envío del resumen que se ejecute al mismo tiempo no las vuelva a
+        tomar. Si el trabajo que las tomó se interrumpe (el worker muere o el
+        handler lanza una excepción), su reintento usa el mismo claim_id y las
+        recupera junto con las que se hayan retenido después.
         
-        rows = cursor.fetchall()
-        conn.close()
+        Args:
+            project_id: ID del proyecto
+            claim_id: Identificador del trabajo de resumen que las toma
         
-        return [dict(row) for row in rows]
+        Returns:
+            Notificaciones tomadas, de la más antigua a la más reciente
+        """
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE notifications 
+                SET status = 'digesting', digest_claim = ? 
+                WHERE project_id = ? 
+                  AND (status = 'buffered' OR (status = 'digesting' AND digest_claim = ?))
+                RETURNING *
+            ''', (claim_id, project_id, claim_id))
+            
+            rows = cursor.fetchall()
+        
+        records = [NotificationRecord(row, self.blob_store) for row in rows]
+        return sorted(records, key=lambda record: record['id'])
+    
+    def get_recent_notifications(self, limit: int = 50, after: Optional[Tuple] = None,
+                                 columns: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Obtener las notificaciones más recientes
+        
+        Args:
+            limit: Número máximo de notificaciones
+            after: Cursor (sent_at, id) de la última notificación de la página anterior
+            columns: Columnas a leer (por defecto SUMMARY_COLUMNS, sin cuerpos ni payloads)
+        """
+        return self._query_page({}, columns, after, limit)
+    
+    def get_failed_notifications(self, limit: int = 100, after: Optional[Tuple] = None,
+                                 columns: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Obtener notificaciones fallidas
+        
+        Args:
+            limit: Número máximo de notificaciones
+            after: Cursor (sent_at, id) de la última notificación de la página anterior
+            columns: Columnas a leer (por defecto SUMMARY_COLUMNS, sin cuerpos ni payloads)
+        """
+        return self._query_page({'status': 'failed'}, columns, after, limit)
+    
+    def iter_notifications(self, project_id: Optional[int] = None, status: Optional[str] = None,
+                           columns: Optional[Iterable[str]] = None,
+                           batch_size: int = 100) -> Iterator[Dict]:
+        """
+        Recorrer notificaciones (más recientes primero) leyendo por páginas
+        
+        Mantiene en memoria como máximo batch_size filas a la vez.
+        
+        Args:
+            project_id: Filtrar por proyecto (opcional)
+            status: Filtrar por estado (opcional)
+            columns: Columnas a leer (por defecto SUMMARY_COLUMNS)
+            batch_size: Filas por consulta
+        """
+        filters = {}
+        if project_id is not None:
+            filters['project_id'] = project_id
+        if status is not None:
+            filters['status'] = status
+        
+        after = None
+        while True:
+            page = self._query_page(filters, columns, after, batch_size)
+            yield from page
+            
+            if len(page) < batch_size:
+                return
+            after = self.cursor_for(page[-1])
+    
+    @staticmethod
+    def cursor_for(notification: Dict) -> Tuple:
+        """Cursor (sent_at, id) para pedir la página siguiente a esta notificación"""
+        return (notification['sent_at'], notification['id'])
+    
+    def _select_columns(self, columns: Optional[Iterable[str]]) -> str:
+        """Lista de columnas para el SELECT (siempre incluye sent_at e id para paginar)"""
+        selected = ['id', 'sent_at']
+        for column in (self.SUMMARY_COLUMNS if columns is None else columns):
+            if column in NotificationRecord.LAZY_FIELDS:
+                # Filas antiguas guardan el contenido en línea, las nuevas en blobs
+                selected += [column, NotificationRecord.LAZY_FIELDS[column]]
+            elif column in self.SUMMARY_COLUMNS or column in NotificationRecord.LAZY_FIELDS.values():
+                selected.append(column)
+            else:
+                raise ValueError(f"Columna desconocida: {column}")
+        
+        return ', '.join(dict.fromkeys(selected))
+    
+    def _query_page(self, filters: Dict, columns: Optional[Iterable[str]],
+                    after: Optional[Tuple], limit: Optional[int]) -> List[Dict]:
+        """Consultar una página de notificaciones ordenada por (sent_at, id) descendente"""
+        conditions = [f'{column} = ?' for column in filters]
+        params = list(filters.values())
+        
+        if after is not None:
+            conditions.append('(sent_at, id) < (?, ?)')
+            params += [after[0], after[1]]
+        
+        sql = f'SELECT {self._select_columns(columns)} FROM notifications'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY sent_at DESC, id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        
+        return [NotificationRecord(row, self.blob_store) for row in rows]
 
 
 class ConfigModel:
@@ -260,12 +700,11 @@ class ConfigModel:
     
     def get(self, key: str) -> Optional[str]:
         """Obtener valor de configuración"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT value FROM config WHERE key = ?', (key,))
-        row = cursor.fetchone()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT value FROM config WHERE key = ?', (key,))
+            row = cursor.fetchone()
         
         if row:
             return row['value']
@@ -273,24 +712,338 @@ class ConfigModel:
     
     def set(self, key: str, value: str):
         """Establecer valor de configuración"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO config (key, value, updated_at)
-            VALUES (?, ?, CURRENT_TIMESTAMP)
-        ''', (key, value))
-        
-        conn.commit()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO config (key, value, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(key) DO UPDATE SET 
+                    value = excluded.value, updated_at = excluded.updated_at
+            ''', (key, value))
     
     def get_all(self) -> Dict[str, str]:
         """Obtener toda la configuración"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT key, value FROM config')
-        rows = cursor.fetchall()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT key, value FROM config')
+            rows = cursor.fetchall()
         
         return {row['key']: row['value'] for row in rows}
+
+
+class JobQueue:
+    """Cola persistente de trabajos respaldada por la base de datos"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def enqueue(self, job_type: str, payload: Dict, delay: float = 0,
+                max_attempts: int = 5) -> int:
+        """
+        Agregar un trabajo a la cola
+        
+        Args:
+            job_type: Tipo de trabajo (determina el handler que lo procesa)
+            payload: Datos del trabajo (serializables a JSON)
+            delay: Segundos a esperar antes de que el trabajo esté disponible
+            max_attempts: Número máximo de intentos antes de marcarlo como fallido
+            
+        Returns:
+            ID del trabajo creado
+        """
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO jobs (job_type, payload, status, max_attempts, run_at)
+                VALUES (?, ?, 'pending', ?, ?)
+                RETURNING id
+            ''', (job_type, json.dumps(payload), max_attempts, time.time() + delay))
+            
+            job_id = cursor.fetchone()['id']
+        
+        return job_id
+    
+    def claim(self, lease_seconds: float = 300,
+              job_types: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        """
+        Tomar el siguiente trabajo disponible de forma atómica
+        
+        También recupera trabajos en estado 'processing' cuyo lease expiró
+        (por ejemplo, si el worker que los tomó murió) mientras les queden
+        intentos; los que ya los agotaron se cierran con reap_exhausted.
+        
+        Args:
+            lease_seconds: Segundos que el trabajo queda reservado para este worker
+            job_types: Tipos de trabajo a tomar (None para cualquiera)
+            
+        Returns:
+            Diccionario con id, job_type, payload, attempts y max_attempts, o None si no hay trabajos
+        """
+        jobs = self._claim(1, lease_seconds, job_types)
+        return jobs[0] if jobs else None
+    
+    def claim_batch(self, job_type: str, limit: int, lease_seconds: float = 300) -> List[Dict]:
+        """
+        Tomar de forma atómica hasta limit trabajos disponibles de un tipo
+        
+        Args:
+            job_type: Tipo de trabajo
+            limit: Número máximo de trabajos
+            lease_seconds: Segundos que los trabajos quedan reservados
+            
+        Returns:
+            Trabajos tomados (mismo formato que claim), del más antiguo al más reciente
+        """
+        return self._claim(limit, lease_seconds, [job_type])
+    
+    def reap_exhausted(self, job_types: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Marcar como 'failed' los trabajos cuyo lease expiró en su último intento
+        
+        Args:
+            job_types: Tipos de trabajo a revisar (None para cualquiera)
+            
+        Returns:
+            Trabajos cerrados (mismo formato que claim, con last_error), para
+            que quien los procesa registre el fallo definitivo
+        """
+        type_clause, type_params = self._type_filter(job_types)
+        if job_types is not None and not type_params:
+            return []
+        
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                UPDATE jobs 
+                SET status = 'failed', locked_until = NULL, last_error = ?,
+                    updated_at = CURRENT_TIMESTAMP 
+                WHERE status = 'processing' AND locked_until < ? 
+                  AND attempts >= max_attempts
+                  {type_clause}
+                RETURNING id, job_type, payload, attempts, max_attempts, last_error
+            ''', ('Lease expired on the last attempt', time.time(), *type_params))
+            
+            rows = cursor.fetchall()
+        
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job['payload'] = json.loads(job['payload'])
+            jobs.append(job)
+        return jobs
+    
+    def purge_finished(self, older_than: float, job_types: Optional[Iterable[str]] = None,
+                       limit: int = 1000) -> int:
+        """
+        Eliminar los trabajos terminados ('done' o 'failed') hace más de older_than segundos
+        
+        Args:
+            older_than: Segundos desde su última actualización
+            job_types: Tipos de trabajo a eliminar (None para cualquiera)
+            limit: Máximo de trabajos eliminados por llamada (acota la duración del bloqueo)
+            
+        Returns:
+            Número de trabajos eliminados
+        """
+        type_clause, type_params = self._type_filter(job_types)
+        if job_types is not None and not type_params:
+            return 0
+        
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=older_than)).strftime('%Y-%m-%d %H:%M:%S')
+        
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                DELETE FROM jobs 
+                WHERE id IN (
+                    SELECT id FROM jobs 
+                    WHERE status IN ('done', 'failed') AND updated_at < ? 
+                      {type_clause}
+                    LIMIT ?
+                )
+                RETURNING id
+            ''', (cutoff, *type_params, limit))
+            
+            rows = cursor.fetchall()
+        
+        return len(rows)
+    
+    @staticmethod
+    def _type_filter(job_types: Optional[Iterable[str]]):
+        """Condición SQL y parámetros para filtrar por tipo de trabajo"""
+        if job_types is None:
+            return '', []
+        type_params = list(job_types)
+        return f"AND job_type IN ({', '.join('?' for _ in type_params)})", type_params
+    
+    def _claim(self, limit: int, lease_seconds: float,
+               job_types: Optional[Iterable[str]]) -> List[Dict]:
+        now = time.time()
+        # En PostgreSQL varios workers pueden leer la misma fila candidata a la vez
+        lock_clause = 'FOR UPDATE SKIP LOCKED' if self.db.dialect == 'postgresql' else ''
+        
+        type_clause, type_params = self._type_filter(job_types)
+        if job_types is not None and not type_params:
+            return []
+        
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                UPDATE jobs 
+                SET status = 'processing', attempts = attempts + 1,
+                    locked_until = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM jobs 
+                    WHERE ((status = 'pending' AND run_at <= ?)
+                           OR (status = 'processing' AND locked_until < ?
+                               AND attempts < max_attempts))
+                      {type_clause}
+                    ORDER BY run_at, id 
+                    LIMIT ?
+                    {lock_clause}
+                )
+                RETURNING id, job_type, payload, attempts, max_attempts
+            ''', (now + lease_seconds, now, now, *type_params, limit))
+            
+            rows = cursor.fetchall()
+        
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job['payload'] = json.loads(job['payload'])
+            jobs.append(job)
+        return sorted(jobs, key=lambda job: job['id'])
+    
+    def complete(self, job_id: int):
+        """Marcar un trabajo como completado"""
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE jobs 
+                SET status = 'done', locked_until = NULL, last_error = NULL,
+                    updated_at = CURRENT_TIMESTAMP 
+                WHERE id = ?
+            ''', (job_id,))
+    
+    def fail(self, job_id: int, error_message: str, retry_delay: Optional[float] = None):
+        """
+        Registrar el fallo de un trabajo
+        
+        Si se indica retry_delay y quedan intentos, el trabajo vuelve a 'pending'
+        para ejecutarse después del retraso. En caso contrario queda como 'failed'.
+        """
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            if retry_delay is not None:
+                cursor.execute('''
+                    UPDATE jobs 
+                    SET status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END,
+                        run_at = ?, locked_until = NULL, last_error = ?,
+                        updated_at = CURRENT_TIMESTAMP 
+                    WHERE id = ?
+                ''', (time.time() + retry_delay, error_message, job_id))
+            else:
+                cursor.execute('''
+                    UPDATE jobs 
+                    SET status = 'failed', locked_until = NULL, last_error = ?,
+                        updated_at = CURRENT_TIMESTAMP 
+                    WHERE id = ?
+                ''', (error_message, job_id))
+    
+    def count_pending(self) -> int:
+        """Contar trabajos pendientes o en proceso"""
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT COUNT(*) as count 
+                FROM jobs 
+                WHERE status IN ('pending', 'processing')
+            ''')
+            
+            result = cursor.fetchone()
+        
+        return result['count']
+
+
+class FetchLease:
+    """Modelo de leases para que un solo proceso ejecute una petición a la vez"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def acquire(self, lease_key: str, owner: str, ttl: float) -> bool:
+        """
+        Intentar tomar el lease de una clave
+        
+        Args:
+            lease_key: Clave del recurso (por ejemplo 'opensolar:project:123')
+            owner: Identificador de quien toma el lease
+            ttl: Segundos tras los cuales el lease expira si no se libera
+            
+        Returns:
+            True si se obtuvo el lease, False si otro proceso lo tiene vigente
+        """
+        now = time.time()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO fetch_leases (lease_key, owner, expires_at, result, completed_at)
+                VALUES (?, ?, ?, NULL, NULL)
+                ON CONFLICT(lease_key) DO UPDATE SET 
+                    owner = excluded.owner, expires_at = excluded.expires_at,
+                    result = NULL, completed_at = NULL
+                WHERE fetch_leases.expires_at <= ?
+            ''', (lease_key, owner, now + ttl, now))
+            
+            acquired = cursor.rowcount == 1
+        
+        return acquired
+    
+    def release(self, lease_key: str, owner: str, result: Optional[Dict] = None):
+        """
+        Liberar un lease publicando el resultado para los procesos que esperan
+        
+        Args:
+            lease_key: Clave del recurso
+            owner: Identificador de quien tomó el lease
+            result: Resultado de la petición (None si falló)
+        """
+        now = time.time()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE fetch_leases 
+                SET expires_at = ?, result = ?, completed_at = ? 
+                WHERE lease_key = ? AND owner = ?
+            ''', (now, json.dumps(result) if result is not None else None, now, lease_key, owner))
+    
+    def get(self, lease_key: str) -> Optional[Dict]:
+        """Obtener el estado de un lease"""
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT lease_key, owner, expires_at, result, completed_at 
+                FROM fetch_leases 
+                WHERE lease_key = ?
+            ''', (lease_key,))
+            
+            row = cursor.fetchone()
+        
+        if not row:
+            return None
+        
+        lease = dict(row)
+        lease['result'] = json.loads(lease['result']) if lease['result'] else None
+        return lease
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Configuración de gunicorn
+
+Los parámetros de arranque (bind, workers, timeout) se pasan en la línea de
+comandos (Procfile / render.yaml); aquí solo se definen los hooks.
+"""
+
+
+def on_starting(server):
+    """Eliminar las métricas guardadas por los workers de una ejecución anterior"""
+    from config import Config
+    from services.metrics import clear_metrics_dir
+    if Config.METRICS_DIR:
+        clear_metrics_dir(Config.METRICS_DIR)
+
+
+def post_worker_init(worker):
+    """
+    Calentar los templates de email en cada worker antes de atender peticiones
+
+    Se ejecuta después de cargar la aplicación en el worker, por lo que el
+    primer webhook no paga la compilación ni el primer renderizado.
+    """
+    try:
+        from app import notification_service
+        notification_service.warm_up()
+        worker.log.info("Templates de email precargados en el worker %s", worker.pid)
+    except Exception as e:
+        worker.log.warning("No se pudieron precargar los templates de email: %s", e)
+
+
+def worker_exit(server, worker):
+    """
+    Guardar las métricas del worker al terminar (sus contadores siguen sumando
+    en /metrics) y escribir los registros de log que queden en cola
+    """
+    try:
+        from app import metrics
+        metrics.dump()
+    except Exception as e:
+        worker.log.warning("No se pudieron guardar las métricas del worker: %s", e)
+
+    from log_config import stop_logging
+    stop_logging()
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Configuración de logging asíncrono y estructurado
+
+Los hilos de la aplicación solo encolan los registros (QueueHandler); un hilo
+aparte (QueueListener) los formatea como JSON y los escribe en consola y en un
+archivo que rota por tamaño y comprime con gzip las copias antiguas. Los
+registros DEBUG de cada logger pueden muestrearse para no volcar todos los
+payloads.
+
+El hilo del listener no sobrevive a un fork (gunicorn --preload importa la
+aplicación en el master): el primer registro emitido en un proceso hijo
+arranca un listener propio con los mismos handlers, como hace SQLiteBackend
+con sus conexiones.
+"""
+
+import os
+import sys
+import gzip
+import json
+import queue
+import atexit
+import random
+import shutil
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: rotación sin lock entre procesos
+    fcntl = None
+
+# Atributos estándar de LogRecord (el resto son campos pasados con extra=)
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_pid: Optional[int] = None
+_listener_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatea cada registro como una línea JSON (incluye los campos de extra=)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Deja pasar solo una fracción de los registros DEBUG de cada logger
+
+    La tasa se busca por el prefijo más largo del nombre del logger
+    (ej: {'app': 0.01, 'services.resend_service': 0.1}); los loggers sin
+    tasa y los niveles INFO o superiores no se muestrean.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._cache: Dict[str, Optional[float]] = {}
+
+    def _rate(self, name: str) -> Optional[float]:
+        if name not in self._cache:
+            prefixes = [p for p in self.rates if name == p or name.startswith(p + '.')]
+            self._cache[name] = self.rates[max(prefixes, key=len)] if prefixes else None
+        return self._cache[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler que comprime las copias rotadas (.1.gz, .2.gz, ...)
+
+    Varios workers escriben en el mismo archivo: la rotación se hace con un lock
+    de archivo y, si otro proceso ya rotó, este solo reabre el archivo nuevo.
+    """
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source: str, dest: str):
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+    def _rotated_elsewhere(self) -> bool:
+        """El archivo abierto ya no es el de baseFilename (otro proceso lo rotó)"""
+        if self.stream is None:
+            return False
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        opened = os.fstat(self.stream.fileno())
+        return (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino)
+
+    def _reopen(self):
+        if self.stream:
+            self.stream.close()
+        self.stream = self._open()
+
+    def emit(self, record: logging.LogRecord):
+        if self._rotated_elsewhere():
+            self._reopen()
+        super().emit(record)
+
+    def doRollover(self):
+        if fcntl is None:
+            return super().doRollover()
+
+        with open(f"{self.baseFilename}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Otro proceso pudo haber rotado mientras se esperaba el lock
+                if self._rotated_elsewhere():
+                    self._reopen()
+                    return
+                super().doRollover()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ForkSafeQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que arranca un listener en el proceso actual si el suyo quedó en el padre"""
+
+    def emit(self, record: logging.LogRecord):
+        if _listener_pid != os.getpid():
+            _restart_listener(self)
+        super().emit(record)
+
+
+def _restart_listener(queue_handler: logging.handlers.QueueHandler):
+    """Arrancar un listener en este proceso con los handlers del heredado y una cola nueva"""
+    global _listener, _listener_pid
+    with _listener_lock:
+        pid = os.getpid()
+        if _listener is None or _listener_pid == pid:
+            return
+        # Los registros que quedaron en la cola heredada los escribe el proceso padre
+        log_queue = queue.SimpleQueue()
+        queue_handler.queue = log_queue
+        _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = pid
+
+
+def _reset_lock_after_fork():
+    global _listener_lock
+    _listener_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_lock_after_fork)
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """
+    Interpretar las tasas de muestreo de LOG_DEBUG_SAMPLING
+
+    Args:
+        spec: Pares logger=tasa separados por comas (ej: "app=0.01,services=0.1")
+
+    Returns:
+        Dict de nombre de logger a tasa (0-1)
+    """
+    rates = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        name, rate = item.split('=', 1)
+        rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def setup_logging(level: str = 'INFO', log_file: Optional[str] = None,
+                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                  json_format: bool = True, debug_sampling: Optional[Dict[str, float]] = None):
+    """
+    Configurar el logging de la aplicación
+
+    Args:
+        level: Nivel del logger raíz
+        log_file: Archivo de log (None para escribir solo en consola)
+        max_bytes: Tamaño a partir del cual se rota el archivo
+        backup_count: Copias comprimidas que se conservan
+        json_format: Registros en JSON (False para texto legible)
+        debug_sampling: Tasas de muestreo de DEBUG por logger (ver SamplingFilter)
+    """
+    global _listener, _listener_pid
+    stop_logging()
+
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    handlers = []
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+    handlers.append(stream_handler)
+
+    if log_file:
+        log_dir = os.path.dirname(log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        file_handler = CompressingRotatingFileHandler(log_file, max_bytes, backup_count)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = ForkSafeQueueHandler(log_queue)
+    if debug_sampling:
+        queue_handler.addFilter(SamplingFilter(debug_sampling))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+
+
+def stop_logging():
+    """Escribir los registros pendientes y detener el hilo de logging"""
+    global _listener, _listener_pid
+    if _listener is not None:
+        # Un listener heredado no tiene hilo en este proceso (lo detiene el padre)
+        if _listener_pid == os.getpid():
+            _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _listener_pid = None
+
+
+atexit.register(stop_logging)
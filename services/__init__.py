@@ -1,9 +1,34 @@
 """
 Módulo de servicios
+
+Los servicios se importan de forma diferida (al primer acceso) para que
+importar el paquete no cargue dependencias que quizá no se usen, como los
+clientes de Gmail.
 """
 
-from .opensolar import OpenSolarService
-from .gmail_service import GmailService
-from .notification_service import NotificationService
+import importlib
+
+# Nombre exportado -> módulo que lo define
+_LAZY_IMPORTS = {
+    'OpenSolarService': '.opensolar',
+    'GmailService': '.gmail_service',
+    'GmailAPIService': '.gmail_api_service',
+    'NotificationService': '.notification_service',
+    'ResendService': '.resend_service',
+}
+
+__all__ = ['OpenSolarService', 'GmailService', 'GmailAPIService', 'NotificationService', 'ResendService']
+
+
+def __getattr__(name):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ['OpenSolarService', 'GmailService', 'NotificationService']
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
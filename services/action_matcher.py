@@ -0,0 +1,170 @@
+"""
+Índice precompilado para reconocer acciones de OpenSolar por su título
+
+Los títulos se normalizan (sin tildes, minúsculas, espacios simples) y se
+buscan en un autómata Aho-Corasick con todas las claves conocidas, de modo que
+cada búsqueda recorre el título una sola vez sin importar cuántas claves haya.
+El resultado de cada título se memoiza.
+"""
+
+import logging
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_title(text: str) -> str:
+    """
+    Normalizar un título para compararlo
+
+    Args:
+        text: Título original (ej: "  Visita Técnica ")
+
+    Returns:
+        Título sin tildes, en minúsculas y con espacios simples (ej: "visita tecnica")
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+
+class AhoCorasick:
+    """Autómata de búsqueda simultánea de varios patrones en un texto"""
+
+    def __init__(self, patterns: Iterable[str]):
+        """
+        Args:
+            patterns: Patrones a buscar; el resultado usa su posición en esta lista
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[int]] = [set()]
+
+        for index, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                state = next_state
+            self._output[state].add(index)
+
+        # Enlaces de fallo en orden de anchura (BFS)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Set[int]:
+        """
+        Buscar los patrones contenidos en el texto
+
+        Returns:
+            Posiciones de los patrones encontrados
+        """
+        found: Set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            found |= self._output[state]
+        return found
+
+
+class ActionMatcher:
+    """
+    Reconoce el tipo de acción de un título y si dispara la primera notificación
+
+    Una clave de descripción coincide si está contenida en el título o si el
+    título está contenido en ella; con varias coincidencias gana la primera en
+    el orden del mapeo. Una palabra clave de disparo coincide si está contenida
+    en el título.
+    """
+
+    def __init__(self, descriptions: Optional[Dict[str, Dict]] = None,
+                 trigger_keywords: Optional[Iterable[str]] = None, memo_size: int = 1024):
+        """
+        Construir el índice
+
+        Args:
+            descriptions: Mapeo de títulos de acción a descripciones (Config.ACTION_DESCRIPTIONS)
+            trigger_keywords: Palabras clave del pago inicial (Config.TRIGGER_ACTIONS)
+            memo_size: Títulos distintos cuyo resultado se memoiza
+        """
+        self.descriptions = descriptions or {}
+        self.trigger_keywords = list(trigger_keywords or [])
+        self._keys = list(self.descriptions)
+
+        normalized_keys = [normalize_title(key) for key in self._keys]
+        self._key_automaton = AhoCorasick(normalized_keys)
+        self._trigger_automaton = AhoCorasick(normalize_title(k) for k in self.trigger_keywords)
+
+        # Subcadenas de cada clave -> primera clave que la contiene (título contenido en una clave)
+        self._key_substrings: Dict[str, int] = {}
+        for index, key in enumerate(normalized_keys):
+            for start in range(len(key)):
+                for end in range(start + 1, len(key) + 1):
+                    self._key_substrings.setdefault(key[start:end], index)
+
+        self._memo = TTLCache(maxsize=memo_size, ttl=None)
+
+    def _lookup(self, title: str) -> Tuple[Optional[str], bool]:
+        """Clave de descripción y si es acción de disparo (memoizado por título)"""
+        cached = self._memo.get(title)
+        if cached is not None:
+            return cached
+
+        normalized = normalize_title(title)
+        key = None
+        is_trigger = False
+        if normalized:
+            candidates = self._key_automaton.search(normalized)
+            contained_in = self._key_substrings.get(normalized)
+            if contained_in is not None:
+                candidates.add(contained_in)
+            if candidates:
+                key = self._keys[min(candidates)]
+            is_trigger = bool(self._trigger_automaton.search(normalized))
+
+        result = (key, is_trigger)
+        self._memo.set(title, result)
+        return result
+
+    def match(self, title: str) -> Optional[str]:
+        """
+        Clave del mapeo de descripciones que corresponde a un título
+
+        Returns:
+            La clave o None si el título no corresponde a ninguna acción conocida
+        """
+        return self._lookup(title)[0]
+
+    def description(self, title: str) -> Optional[Dict]:
+        """Descripción de la acción de un título (None si no se reconoce)"""
+        key = self.match(title)
+        return self.descriptions[key] if key is not None else None
+
+    def is_trigger(self, title: str) -> bool:
+        """True si el título contiene alguna palabra clave del pago inicial"""
+        return self._lookup(title)[1]
+
+    def stats(self) -> Dict[str, int]:
+        """Estadísticas de la memoización"""
+        return dict(self._memo.stats(), keys=len(self._keys), trigger_keywords=len(self.trigger_keywords))
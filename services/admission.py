@@ -0,0 +1,160 @@
+"""
+Control de admisión del endpoint de webhooks
+
+Cuando OpenSolar envía una ráfaga, aceptar todo hace que las peticiones se
+acumulen hasta que gunicorn mata a los workers por timeout, y los reintentos
+de OpenSolar empeoran la situación. El controlador limita:
+
+- Las peticiones en curso de cada worker: si se alcanza el límite, se responde
+  503 de inmediato en vez de dejar la petición esperando
+- La profundidad de la cola de trabajos: si hay demasiados pendientes, se
+  responde 429 para que OpenSolar reintente más tarde
+
+Ambas respuestas incluyen Retry-After. La profundidad de la cola se consulta
+como máximo una vez por intervalo y entre consultas se suman los trabajos
+encolados por este worker, por lo que el límite es aproximado (puede excederse
+en las peticiones admitidas por otros workers o antes de la primera consulta).
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_IN_FLIGHT = "webhook_admission_in_flight"
+ADMISSION_QUEUE_DEPTH = "webhook_admission_queue_depth"
+ADMISSION_REJECTED = "webhook_admission_rejected_total"
+
+
+class AdmissionController:
+    """Límites de peticiones en curso y de trabajos pendientes"""
+
+    def __init__(self, max_in_flight: int = 0, max_queue_depth: int = 0,
+                 queue_depth: Optional[Callable[[], int]] = None,
+                 queue_check_interval: float = 1.0, retry_after: int = 10,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Inicializar controlador
+
+        Args:
+            max_in_flight: Peticiones simultáneas admitidas en este proceso (0 sin límite)
+            max_queue_depth: Trabajos pendientes a partir de los cuales se rechaza (0 sin límite)
+            queue_depth: Función que cuenta los trabajos pendientes (ej: JobQueue.count_pending);
+                None si no hay cola
+            queue_check_interval: Segundos entre consultas de la profundidad de la cola
+            retry_after: Segundos sugeridos en Retry-After al rechazar
+            metrics: Registro donde publicar los gauges y el contador de rechazos (opcional)
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth if queue_depth else 0
+        self.queue_check_interval = queue_check_interval
+        self.retry_after = retry_after
+        self.metrics = metrics
+        self._count_queue = queue_depth
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.in_flight = 0
+        self._queue_depth: Optional[int] = None
+        self._queue_checked_at = 0.0
+        self.admitted = 0
+        self.rejected = {"in_flight": 0, "queue_depth": 0}
+
+        if metrics:
+            metrics.gauge(ADMISSION_IN_FLIGHT, "Peticiones de webhook en curso", lambda: self.in_flight)
+            if queue_depth:
+                metrics.gauge(ADMISSION_QUEUE_DEPTH, "Trabajos pendientes en la cola",
+                              self.queue_depth, aggregate="latest")
+            metrics.counter(ADMISSION_REJECTED, "Webhooks rechazados por el control de admisión")
+
+    def queue_depth(self) -> Optional[int]:
+        """
+        Trabajos pendientes (consultados como máximo una vez por queue_check_interval)
+
+        Returns:
+            Profundidad de la cola o None si no hay cola o nunca se pudo consultar
+        """
+        if self._count_queue is None:
+            return None
+
+        now = time.monotonic()
+        if now - self._queue_checked_at >= self.queue_check_interval:
+            # Un solo hilo consulta; el resto usa el último valor conocido
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    depth = self._count_queue()
+                    with self._lock:
+                        self._queue_depth = depth
+                        self._queue_checked_at = time.monotonic()
+                except Exception as e:
+                    # Si no se puede consultar se admite (mejor que rechazar todo)
+                    logger.warning(f"No se pudo consultar la profundidad de la cola: {e}")
+                    self._queue_checked_at = now
+                finally:
+                    self._refresh_lock.release()
+        return self._queue_depth
+
+    def note_enqueued(self, count: int = 1):
+        """Contar trabajos encolados por este proceso hasta la próxima consulta"""
+        with self._lock:
+            if self._queue_depth is not None:
+                self._queue_depth += count
+
+    @contextmanager
+    def slot(self) -> Iterator[Optional[Dict]]:
+        """
+        Reservar un lugar para atender una petición
+
+        Uso:
+            with admission.slot() as rejection:
+                if rejection:
+                    return respuesta de rechazo
+                ...
+
+        Returns:
+            None si la petición se admite, o un Dict con 'status', 'error',
+            'reason', 'http_status' y 'retry_after' si se rechaza
+        """
+        rejection = self._admit()
+        try:
+            yield rejection
+        finally:
+            if rejection is None:
+                with self._lock:
+                    self.in_flight -= 1
+
+    def _admit(self) -> Optional[Dict]:
+        depth = self.queue_depth() if self.max_queue_depth else None
+        if depth is not None and depth >= self.max_queue_depth:
+            return self._reject("queue_depth", 429, f"Job queue is full ({depth} pending)")
+
+        with self._lock:
+            if not self.max_in_flight or self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+        return self._reject("in_flight", 503, f"Too many requests in flight ({self.max_in_flight})")
+
+    def _reject(self, reason: str, http_status: int, error: str) -> Dict:
+        with self._lock:
+            self.rejected[reason] += 1
+        if self.metrics:
+            self.metrics.inc(ADMISSION_REJECTED, reason=reason)
+        logger.warning(f"Webhook rechazado por control de admisión: {error}")
+        return {"status": "rejected", "error": error, "reason": reason,
+                "http_status": http_status, "retry_after": self.retry_after}
+
+    def stats(self) -> Dict:
+        """Estado actual y contadores del proceso"""
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self._queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected)
+        }
@@ -0,0 +1,246 @@
+"""
+Despachador que agrupa los correos salientes en lotes para el endpoint batch de Resend
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List
+
+from .retry import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+
+class ResendBatchDispatcher:
+    """
+    Agrupa mensajes durante unos milisegundos (o hasta completar un lote) y los
+    envía con una sola petición a Resend
+
+    Cada mensaje es un trabajo 'batch_email' en la cola persistente, de modo que
+    un reinicio o un deploy no pierde los que esperaban lote. El hilo del
+    despachador toma los trabajos en bloque (con lease, como los workers) y solo
+    marca cada uno como completado, y su notificación como 'sent', después de la
+    respuesta de Resend. Si el proceso muere a mitad de un lote, los trabajos se
+    recuperan al vencer su lease y el lote se reenvía (entrega al menos una vez).
+    """
+
+    JOB_TYPE = "batch_email"
+
+    def __init__(self, resend_service, notification_model, job_queue,
+                 max_batch_size: int = 50, max_wait_ms: int = 200, max_attempts: int = 5,
+                 lease_seconds: float = 300, poll_interval: float = 0.5,
+                 retry_delay: float = 2, max_retry_delay: float = 600, reap_interval: float = 30,
+                 retention_seconds: float = 0):
+        """
+        Inicializar despachador
+
+        Args:
+            resend_service: Servicio de Resend (ResendService)
+            notification_model: Modelo de notificaciones donde se registra el resultado
+            job_queue: Cola de trabajos (JobQueue) donde esperan los mensajes
+            max_batch_size: Mensajes máximos por lote (Resend acepta hasta 100)
+            max_wait_ms: Milisegundos máximos que un mensaje espera a completar el lote
+            max_attempts: Intentos de envío de cada mensaje
+            lease_seconds: Segundos que un lote queda reservado por este proceso
+            poll_interval: Segundos de espera cuando no hay mensajes pendientes
+            retry_delay: Retraso base (segundos) del backoff de los fallos transitorios
+            max_retry_delay: Retraso máximo (segundos) entre reintentos
+            reap_interval: Segundos entre revisiones de mensajes cuyo lease expiró
+                en el último intento (se marcan como fallidos)
+            retention_seconds: Segundos que se conservan los mensajes ya enviados o
+                fallidos antes de eliminarlos de la cola (0 = no eliminar)
+        """
+        self.resend_service = resend_service
+        self.notification_model = notification_model
+        self.job_queue = job_queue
+        self.max_batch_size = min(max_batch_size, 100)
+        self.max_wait_ms = max_wait_ms
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.reap_interval = reap_interval
+        self.retention_seconds = retention_seconds
+        self._next_reap = 0.0
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.batches_sent = 0
+        self.messages_sent = 0
+        self.messages_failed = 0
+
+    def start(self):
+        """Iniciar el hilo que envía los lotes"""
+        if self._thread:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="resend-batch-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Despachador de lotes iniciado (máx. {self.max_batch_size} mensajes / {self.max_wait_ms} ms)")
+
+    def stop(self, timeout: float = 5):
+        """Detener el despachador (los mensajes pendientes siguen en la cola persistente)"""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, notification_id: int, to_email: str, subject: str) -> int:
+        """
+        Encolar el email de una notificación para el próximo lote
+
+        Args:
+            notification_id: ID de la notificación (registrada como 'queued'; su
+                email_body es el HTML que se envía)
+            to_email: Destinatario
+            subject: Asunto
+
+        Returns:
+            ID del trabajo creado
+        """
+        job_id = self.job_queue.enqueue(
+            self.JOB_TYPE,
+            {"notification_id": notification_id, "to_email": to_email, "subject": subject},
+            max_attempts=self.max_attempts
+        )
+        self._wakeup.set()
+        return job_id
+
+    def _run(self):
+        """Bucle principal: reunir un lote y enviarlo"""
+        while not self._stop_event.is_set():
+            try:
+                batch = self._collect_batch()
+                if batch:
+                    self._send(batch)
+                    continue
+            except Exception as e:
+                logger.error(f"Error en el despachador de lotes: {e}")
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _collect_batch(self) -> List[Dict]:
+        """Tomar los mensajes disponibles y esperar los que lleguen hasta llenar el lote o agotar el tiempo"""
+        if time.monotonic() >= self._next_reap:
+            self._next_reap = time.monotonic() + self.reap_interval
+            self.reap_exhausted()
+
+        batch = self.job_queue.claim_batch(self.JOB_TYPE, self.max_batch_size, self.lease_seconds)
+        if not batch:
+            return []
+
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size and not self._stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._wakeup.wait(remaining)
+            self._wakeup.clear()
+            batch += self.job_queue.claim_batch(self.JOB_TYPE, self.max_batch_size - len(batch),
+                                                self.lease_seconds)
+
+        return batch
+
+    def reap_exhausted(self) -> int:
+        """
+        Marcar como fallidos los mensajes cuyo lote quedó sin respuesta en el último
+        intento y eliminar los terminados que superan el tiempo de retención
+
+        Returns:
+            Número de mensajes marcados como fallidos
+        """
+        jobs = self.job_queue.reap_exhausted(job_types=[self.JOB_TYPE])
+        for job in jobs:
+            notification_id = job["payload"]["notification_id"]
+            logger.error(f"Notificación {notification_id}: {job['last_error']} (lote de email)")
+            self.notification_model.update_status(notification_id, "failed", job["last_error"])
+        with self._stats_lock:
+            self.messages_failed += len(jobs)
+
+        if self.retention_seconds > 0:
+            self.job_queue.purge_finished(self.retention_seconds, job_types=[self.JOB_TYPE])
+        return len(jobs)
+
+    def _send(self, jobs: List[Dict]):
+        """Enviar un lote y registrar el resultado de cada mensaje"""
+        messages = []
+        pending = []
+        for job in jobs:
+            payload = job["payload"]
+            notification = self.notification_model.get_by_id(payload["notification_id"])
+            if not notification:
+                logger.error(f"Notificación {payload['notification_id']}: No existe, se descarta del lote")
+                self.job_queue.fail(job["id"], "Notification not found")
+                continue
+            if notification["status"] == "sent":
+                # Un lote anterior se envió pero el proceso murió antes de completar el trabajo
+                self.job_queue.complete(job["id"])
+                continue
+            messages.append({"to_email": payload["to_email"], "subject": payload["subject"],
+                             "html_content": notification["email_body"]})
+            pending.append(job)
+
+        if not pending:
+            return
+
+        with self._stats_lock:
+            self.in_flight = len(pending)
+        try:
+            results = self.resend_service.send_batch(messages)
+        except Exception as e:
+            logger.error(f"Error inesperado al enviar lote: {e}")
+            results = [{"success": False, "id": None, "error": str(e), "retryable": True, "retry_after": None}
+                       for _ in pending]
+
+        failed = 0
+        for job, result in zip(pending, results):
+            if not result["success"]:
+                failed += 1
+            try:
+                self._record_result(job, result)
+            except Exception as e:
+                # El lease del trabajo vencerá y el mensaje se reintentará
+                logger.error(f"Trabajo {job['id']}: Error al registrar resultado del lote: {e}")
+
+        with self._stats_lock:
+            self.in_flight = 0
+            self.batches_sent += 1
+            self.messages_sent += len(pending) - failed
+            self.messages_failed += failed
+
+    def _record_result(self, job: Dict, result: Dict):
+        """Actualizar la notificación con el resultado y completar (o reprogramar) el trabajo"""
+        notification_id = job["payload"]["notification_id"]
+
+        if result["success"]:
+            self.notification_model.update_status(notification_id, "sent", provider_message_id=result["id"])
+            self.job_queue.complete(job["id"])
+            return
+
+        if result.get("retryable") and job["attempts"] < job["max_attempts"]:
+            delay = result.get("retry_after")
+            if delay is None:
+                delay = backoff_delay(job["attempts"], self.retry_delay, self.max_retry_delay)
+            self.notification_model.update_status(notification_id, "queued", result["error"])
+            self.job_queue.fail(job["id"], result["error"], min(delay, self.max_retry_delay))
+            return
+
+        self.notification_model.update_status(notification_id, "failed", result["error"])
+        self.job_queue.fail(job["id"], result["error"])
+
+    def stats(self) -> Dict[str, int]:
+        """Estadísticas del despachador"""
+        with self._stats_lock:
+            return {
+                "in_flight": self.in_flight,
+                "batches": self.batches_sent,
+                "sent": self.messages_sent,
+                "failed": self.messages_failed
+            }
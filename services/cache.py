@@ -0,0 +1,140 @@
+"""
+Caché en memoria con expiración (TTL) y desalojo LRU
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Caché acotada con expiración por tiempo y desalojo del elemento menos usado
+
+    Las entradas expiradas no se eliminan de inmediato: se conservan (hasta que
+    las desaloje el LRU) para poder revalidarlas con el origen usando sus
+    metadatos (por ejemplo ETag o Last-Modified).
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = 300):
+        """
+        Inicializar caché
+
+        Args:
+            maxsize: Número máximo de entradas
+            ttl: Segundos de validez de cada entrada (None para no expirar)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.refreshes = 0
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.ttl if ttl is None else ttl
+        return time.monotonic() + ttl if ttl is not None else None
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Obtener el valor de una entrada vigente
+
+        Returns:
+            El valor guardado o None si no existe o expiró
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._is_expired(entry):
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def get_stale(self, key: Hashable) -> Optional[Dict]:
+        """
+        Obtener una entrada aunque haya expirado (no cuenta en las estadísticas)
+
+        Returns:
+            Dict con 'value', 'expired' y los metadatos guardados con la entrada
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            return dict(entry["meta"], value=entry["value"], expired=self._is_expired(entry))
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, **meta):
+        """
+        Guardar una entrada
+
+        Args:
+            key: Clave de la entrada
+            value: Valor a guardar
+            ttl: TTL específico de la entrada (por defecto el de la caché)
+            **meta: Metadatos asociados (por ejemplo etag, last_modified)
+        """
+        with self._lock:
+            self._data[key] = {"value": value, "expires_at": self._expires_at(ttl), "meta": meta}
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def refresh(self, key: Hashable, ttl: Optional[float] = None) -> bool:
+        """
+        Renovar la expiración de una entrada (por ejemplo después de un 304 Not Modified)
+
+        Returns:
+            True si la entrada existía
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False
+
+            entry["expires_at"] = self._expires_at(ttl)
+            self._data.move_to_end(key)
+            self.refreshes += 1
+            return True
+
+    def invalidate(self, key: Hashable) -> bool:
+        """
+        Eliminar una entrada
+
+        Returns:
+            True si la entrada existía
+        """
+        with self._lock:
+            if self._data.pop(key, None) is None:
+                return False
+            self.invalidations += 1
+            return True
+
+    def clear(self):
+        """Eliminar todas las entradas"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Estadísticas de uso de la caché"""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "refreshes": self.refreshes
+            }
+
+    @staticmethod
+    def _is_expired(entry: Dict) -> bool:
+        return entry["expires_at"] is not None and entry["expires_at"] <= time.monotonic()
@@ -0,0 +1,171 @@
+"""
+Caché de fragmentos renderizados de los templates de email
+
+Todo lo que depende de la acción (título, descripción, próximos pasos) y de la
+configuración (URL del portal, año) es igual para todos los clientes que
+completan la misma acción. El template se renderiza una vez por combinación de
+esos valores con marcadores en lugar de los campos de cada cliente, y el HTML
+resultante se guarda partido en fragmentos estáticos; cada email solo intercala
+los valores del cliente (escapados igual que lo haría Jinja2).
+"""
+
+import re
+import logging
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from jinja2 import Template, meta, nodes
+from markupsafe import escape
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Marcador de un campo del cliente en el HTML renderizado (sobrevive al autoescape)
+MARKER = "\x00{}\x00"
+MARKER_PATTERN = re.compile(r"\x00(\d+)\x00")
+
+
+class FragmentRenderCache:
+    """
+    Memoiza el HTML estático de cada (template, valores de la acción)
+
+    Solo se usa con templates en los que los campos del cliente aparecen como
+    salidas simples ({{ campo }}), sin filtros ni condiciones; el resto se
+    renderiza siempre con Jinja2. La primera vez que se construye una entrada se
+    compara con el renderizado directo, y si no coinciden la combinación queda
+    marcada para no usar la caché. Una entrada se descarta cuando Jinja2 recarga
+    el template (cambió el archivo en disco).
+    """
+
+    def __init__(self, client_fields: Iterable[str], maxsize: int = 256):
+        """
+        Inicializar caché
+
+        Args:
+            client_fields: Campos propios de cada cliente, que se intercalan en cada email
+            maxsize: Número máximo de combinaciones (template, acción) guardadas
+        """
+        self.client_fields = tuple(client_fields)
+        self.cache = TTLCache(maxsize=maxsize, ttl=None)
+        self._safe_templates: Dict[str, Tuple[Template, bool]] = {}
+        self.builds = 0
+        self.uncacheable = 0
+        self.template_changes = 0
+
+    def render(self, template: Template, data: Dict) -> str:
+        """
+        Renderizar un template usando los fragmentos guardados
+
+        Args:
+            template: Template de Jinja2 a renderizar
+            data: Variables del template (las de la acción y las del cliente)
+
+        Returns:
+            HTML renderizado, idéntico al de template.render(**data)
+        """
+        key = self._key(template.name, data)
+        if key is None or not self._is_safe(template):
+            return template.render(**data)
+
+        entry = self.cache.get(key)
+        if entry is not None and entry["template"] is not template:
+            # Jinja2 recargó el template: los fragmentos guardados ya no son válidos
+            self.cache.invalidate(key)
+            self.template_changes += 1
+            entry = None
+
+        if entry is None:
+            return self._build(key, template, data)
+
+        if entry["parts"] is None:
+            return template.render(**data)
+        return self._splice(entry["parts"], data, entry["autoescape"])
+
+    def _key(self, template_name: str, data: Dict) -> Optional[Hashable]:
+        """Clave de la entrada: el template y las variables que no son del cliente"""
+        static = tuple(sorted((k, v) for k, v in data.items() if k not in self.client_fields))
+        try:
+            hash(static)
+        except TypeError:
+            return None
+        return template_name, static
+
+    def _is_safe(self, template: Template) -> bool:
+        """Los campos del cliente solo aparecen como {{ campo }} en el template y sus padres"""
+        checked = self._safe_templates.get(template.name)
+        if checked is not None and checked[0] is template:
+            return checked[1]
+
+        safe = self._check_template(template.environment, template.name, set())
+        self._safe_templates[template.name] = (template, safe)
+        if not safe:
+            logger.info(f"Template '{template.name}' sin caché de fragmentos: "
+                        f"usa campos del cliente fuera de una salida simple")
+        return safe
+
+    def _check_template(self, environment, name: str, seen: set) -> bool:
+        if name in seen:
+            return True
+        seen.add(name)
+
+        source = environment.loader.get_source(environment, name)[0]
+        ast = environment.parse(source)
+
+        plain_outputs = {
+            id(child)
+            for output in ast.find_all(nodes.Output)
+            for child in output.nodes
+            if isinstance(child, nodes.Name)
+        }
+        for node in ast.find_all(nodes.Name):
+            if node.name in self.client_fields and id(node) not in plain_outputs:
+                return False
+
+        for parent in meta.find_referenced_templates(ast):
+            if parent is None or not self._check_template(environment, parent, seen):
+                return False
+        return True
+
+    def _build(self, key: Hashable, template: Template, data: Dict) -> str:
+        """Renderizar el esqueleto con marcadores y verificarlo contra el renderizado directo"""
+        html = template.render(**data)
+
+        markers = {field: MARKER.format(i) for i, field in enumerate(self.client_fields)}
+        skeleton = template.render(**dict(data, **{f: markers[f] for f in self.client_fields if f in data}))
+        parts = MARKER_PATTERN.split(skeleton)
+        autoescape = self._autoescape(template)
+
+        if self._splice(parts, data, autoescape) != html:
+            logger.warning(f"Fragmentos de '{template.name}' no coinciden con el renderizado directo; "
+                           f"se renderizará siempre con Jinja2")
+            parts = None
+            self.uncacheable += 1
+
+        self.cache.set(key, {"template": template, "parts": parts, "autoescape": autoescape})
+        self.builds += 1
+        return html
+
+    def _splice(self, parts: List[str], data: Dict, autoescape: bool) -> str:
+        """Intercalar los valores del cliente entre los fragmentos estáticos"""
+        out = []
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                out.append(part)
+                continue
+            value = data.get(self.client_fields[int(part)], '')
+            out.append(str(escape(value)) if autoescape else str(value))
+        return ''.join(out)
+
+    @staticmethod
+    def _autoescape(template: Template) -> bool:
+        autoescape = template.environment.autoescape
+        return autoescape(template.name) if callable(autoescape) else bool(autoescape)
+
+    def stats(self) -> Dict[str, int]:
+        """Estadísticas de uso de la caché"""
+        return dict(
+            self.cache.stats(),
+            builds=self.builds,
+            uncacheable=self.uncacheable,
+            template_changes=self.template_changes
+        )
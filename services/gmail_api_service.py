@@ -8,12 +8,11 @@ import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Optional
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 import pickle
 
+# Las librerías de Google se importan dentro de los métodos: su importación es
+# costosa y solo se necesitan si se usa este transporte
+
 logger = logging.getLogger(__name__)
 
 # Alcances necesarios para enviar emails
@@ -25,7 +24,8 @@ class GmailAPIService:
     
     def __init__(self, from_email: str, from_name: str = None, 
                  credentials_file: str = 'credentials.json',
-                 token_file: str = 'token.pickle'):
+                 token_file: str = 'token.pickle',
+                 discovery_cache_file: str = '.cache/gmail_v1_discovery.json'):
         """
         Inicializar servicio de Gmail con API
         
@@ -34,16 +34,21 @@ class GmailAPIService:
             from_name: Nombre del remitente (opcional)
             credentials_file: Ruta al archivo de credenciales OAuth
             token_file: Ruta al archivo de token guardado
+            discovery_cache_file: Ruta del documento de discovery de Gmail API en disco
         """
         self.from_email = from_email
         self.from_name = from_name or from_email
         self.credentials_file = credentials_file
         self.token_file = token_file
+        self.discovery_cache_file = discovery_cache_file
         self.service = None
         self._authenticate()
     
     def _authenticate(self):
         """Autenticar con Gmail API usando OAuth 2.0"""
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from google.auth.transport.requests import Request
+        
         creds = None
         
         # Cargar token guardado si existe
@@ -88,12 +93,56 @@ class GmailAPIService:
         
         # Crear servicio de Gmail API
         try:
-            self.service = build('gmail', 'v1', credentials=creds)
+            self.service = self._build_service(creds)
             logger.info("Servicio de Gmail API inicializado correctamente")
         except Exception as e:
             logger.error(f"Error al crear servicio de Gmail API: {e}")
             raise
     
+    def _build_service(self, creds):
+        """
+        Crear el cliente de Gmail API a partir del documento de discovery en disco
+        
+        Así el arranque no depende de buscar ni descargar el documento.
+        """
+        from googleapiclient.discovery import build, build_from_document
+        
+        document = self._load_discovery_document()
+        if document:
+            return build_from_document(document, credentials=creds)
+        
+        return build('gmail', 'v1', credentials=creds, cache_discovery=False)
+    
+    def _load_discovery_document(self) -> Optional[str]:
+        """
+        Leer el documento de discovery guardado en disco
+        
+        Si no existe, se copia la versión incluida en googleapiclient para
+        los siguientes arranques.
+        """
+        if os.path.exists(self.discovery_cache_file):
+            with open(self.discovery_cache_file, 'r', encoding='utf-8') as f:
+                return f.read()
+        
+        try:
+            from googleapiclient.discovery_cache import get_static_doc
+            document = get_static_doc('gmail', 'v1')
+        except ImportError:
+            document = None
+        
+        if document:
+            try:
+                directory = os.path.dirname(self.discovery_cache_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.discovery_cache_file, 'w', encoding='utf-8') as f:
+                    f.write(document)
+                logger.info(f"Documento de discovery de Gmail API guardado en {self.discovery_cache_file}")
+            except OSError as e:
+                logger.warning(f"No se pudo guardar el documento de discovery: {e}")
+        
+        return document
+    
     def send_email(self, to: str, subject: str, html_body: str, 
                    plain_body: Optional[str] = None) -> bool:
         """
@@ -149,32 +198,29 @@ class GmailAPIService:
                              plain_body: Optional[str] = None,
                              max_retries: int = 3) -> bool:
         """
-        Enviar email con reintentos en caso de fallo
+        Enviar email con reintentos inmediatos en caso de fallo
+        
+        No se espera entre intentos para no bloquear el hilo; los reintentos
+        con backoff se programan en la cola de trabajos (ver services.retry).
         
         Args:
             to: Email del destinatario
             subject: Asunto del email
             html_body: Cuerpo del email en HTML
             plain_body: Cuerpo del email en texto plano (opcional)
-            max_retries: Número máximo de reintentos
+            max_retries: Número máximo de intentos
             
         Returns:
             True si se envió exitosamente, False si falló después de todos los reintentos
         """
-        import time
-        
         for attempt in range(1, max_retries + 1):
             logger.info(f"Intento {attempt} de {max_retries} para enviar email a {to}")
             
-            success = self.send_email(to, subject, html_body, plain_body)
-            
-            if success:
+            if self.send_email(to, subject, html_body, plain_body):
                 return True
             
             if attempt < max_retries:
-                wait_time = 2 ** attempt  # Backoff exponencial: 2, 4, 8 segundos
-                logger.warning(f"Reintentando en {wait_time} segundos...")
-                time.sleep(wait_time)
+                logger.warning("Reintentando...")
         
         logger.error(f"Falló el envío de email a {to} después de {max_retries} intentos")
         return False
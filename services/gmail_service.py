@@ -7,7 +7,8 @@ import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Optional
-import time
+
+from .smtp_pool import SMTPConnectionPool
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +16,8 @@ logger = logging.getLogger(__name__)
 class GmailService:
     """Servicio para enviar emails usando Gmail SMTP"""
     
-    def __init__(self, from_email: str, from_name: str = None, smtp_password: str = None):
+    def __init__(self, from_email: str, from_name: str = None, smtp_password: str = None,
+                 pool_size: int = 2, max_messages_per_connection: int = 100):
         """
         Inicializar servicio de Gmail con SMTP
         
@@ -23,12 +25,22 @@ class GmailService:
             from_email: Email del remitente
             from_name: Nombre del remitente (opcional)
             smtp_password: Contraseña de aplicación de Gmail
+            pool_size: Conexiones SMTP autenticadas que se mantienen abiertas
+            max_messages_per_connection: Mensajes enviados antes de renovar una conexión
         """
         self.from_email = from_email
         self.from_name = from_name or from_email
         self.smtp_password = smtp_password
         self.smtp_server = "smtp.gmail.com"
         self.smtp_port = 587
+        self.pool = SMTPConnectionPool(
+            host=self.smtp_server,
+            port=self.smtp_port,
+            username=from_email,
+            password=smtp_password,
+            max_size=pool_size,
+            max_messages_per_connection=max_messages_per_connection
+        )
     
     def send_email(self, to: str, subject: str, html_body: str, 
                    plain_body: Optional[str] = None) -> bool:
@@ -64,28 +76,9 @@ class GmailService:
             part2 = MIMEText(html_body, 'html', 'utf-8')
             msg.attach(part2)
             
-            # Conectar al servidor SMTP de Gmail con timeout
-            logger.info(f"Conectando a {self.smtp_server}:{self.smtp_port}")
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=10)
-            server.ehlo()
-            logger.info("Iniciando TLS...")
-            server.starttls()
-            server.ehlo()
-            
-            # Autenticar
-            logger.info(f"Autenticando como {self.from_email}")
-            try:
-                server.login(self.from_email, self.smtp_password)
-                logger.info("Autenticación exitosa")
-            except smtplib.SMTPAuthenticationError as auth_err:
-                logger.error(f"Error de autenticación: {auth_err}")
-                logger.error(f"Código de error: {auth_err.smtp_code}, Mensaje: {auth_err.smtp_error}")
-                raise
-            
-            # Enviar email
+            # Enviar email con una conexión autenticada del pool (se reutiliza entre envíos)
             logger.info(f"Enviando email a {to} con asunto: {subject}")
-            server.send_message(msg)
-            server.quit()
+            self.pool.send_message(msg)
             
             logger.info(f"Email enviado exitosamente a {to}")
             return True
@@ -105,42 +98,35 @@ class GmailService:
                              plain_body: Optional[str] = None,
                              max_retries: int = 3) -> bool:
         """
-        Enviar email con reintentos en caso de error
+        Enviar email con reintentos inmediatos en caso de error
+        
+        Las conexiones cerradas por el servidor se renuevan en el pool, por lo
+        que reintentar de inmediato cubre las desconexiones transitorias. No se
+        espera entre intentos para no bloquear el hilo; los reintentos con
+        backoff se programan en la cola de trabajos (ver services.retry).
         
         Args:
             to: Email del destinatario
             subject: Asunto del email
             html_body: Cuerpo del email en HTML
             plain_body: Cuerpo del email en texto plano (opcional)
-            max_retries: Número máximo de reintentos
+            max_retries: Número máximo de intentos
             
         Returns:
             True si se envió exitosamente, False si falló después de todos los reintentos
         """
         for attempt in range(max_retries):
             try:
-                success = self.send_email(to, subject, html_body, plain_body)
-                
-                if success:
+                if self.send_email(to, subject, html_body, plain_body):
                     return True
                 
-                # Si no fue exitoso y no es el último intento, esperar antes de reintentar
                 if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt  # Backoff exponencial
-                    logger.info(f"Reintentando envío en {wait_time} segundos...")
-                    time.sleep(wait_time)
+                    logger.info(f"Reintentando envío (intento {attempt + 2}/{max_retries})...")
             
             except Exception as e:
                 logger.error(f"Intento {attempt + 1} fallido: {e}")
-                
-                if attempt == max_retries - 1:
-                    logger.error(f"Todos los intentos fallaron para enviar email a {to}")
-                    return False
-                
-                # Esperar antes de reintentar
-                wait_time = 2 ** attempt
-                time.sleep(wait_time)
         
+        logger.error(f"Todos los intentos fallaron para enviar email a {to}")
         return False
     
     def test_connection(self) -> bool:
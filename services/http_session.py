@@ -0,0 +1,151 @@
+"""
+Sesiones HTTP con pool de conexiones keep-alive para las APIs externas
+"""
+
+import os
+import logging
+import threading
+from typing import Dict, Iterable
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession:
+    """
+    Sesión HTTP compartida por proceso con pool de conexiones y reintentos de transporte
+
+    Reutiliza las conexiones TCP/TLS entre llamadas (keep-alive). La sesión se
+    recrea automáticamente si el proceso hace fork (por ejemplo, workers de
+    gunicorn con --preload), para no compartir sockets entre procesos.
+    """
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 10,
+                 max_retries: int = 3, backoff_factor: float = 0.3,
+                 status_forcelist: Iterable[int] = (502, 503, 504)):
+        """
+        Inicializar sesión con pool
+
+        Args:
+            pool_connections: Número de hosts distintos que se mantienen en el pool
+            pool_maxsize: Conexiones máximas reutilizables por host
+            max_retries: Reintentos a nivel de transporte (conexión y respuestas 5xx
+                en métodos idempotentes)
+            backoff_factor: Factor de backoff entre reintentos de transporte
+            status_forcelist: Códigos HTTP que se reintentan en métodos idempotentes
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.status_forcelist = tuple(status_forcelist)
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def _create_session(self) -> requests.Session:
+        """Crear una nueva sesión con el adaptador configurado"""
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.status_forcelist,
+            # Un Retry-After largo no debe dormir el hilo: la respuesta llega a la
+            # aplicación, que programa el reintento en la cola de trabajos
+            respect_retry_after_header=False,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+            pool_block=False
+        )
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["Connection"] = "keep-alive"
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """Sesión del proceso actual (se recrea después de un fork)"""
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._create_session()
+                    self._pid = pid
+        return self._session
+
+    def max_request_duration(self, timeout: float) -> float:
+        """
+        Duración máxima de una petición con sus reintentos de transporte
+
+        Args:
+            timeout: Timeout (segundos) de cada intento
+
+        Returns:
+            Segundos: cada intento agota el timeout y entre intentos se espera el backoff
+        """
+        backoff = sum(min(self.backoff_factor * (2 ** attempt), Retry.DEFAULT_BACKOFF_MAX)
+                      for attempt in range(self.max_retries))
+        return timeout * (self.max_retries + 1) + backoff
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Realizar una petición GET"""
+        return self.session.get(url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Realizar una petición POST"""
+        return self.session.post(url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        """Realizar una petición PATCH"""
+        return self.session.patch(url, **kwargs)
+
+    def close(self):
+        """Cerrar la sesión y sus conexiones"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._pid = None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Contadores de reutilización de conexiones del proceso actual
+
+        Returns:
+            Dict con requests (peticiones realizadas), connections (conexiones
+            TCP/TLS abiertas) y reused (peticiones servidas por una conexión existente)
+        """
+        requests_count = 0
+        connections_count = 0
+
+        session = self._session if self._pid == os.getpid() else None
+        if session is not None:
+            # El mismo adaptador está montado para http:// y https://
+            adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+            for adapter in adapters.values():
+                poolmanager = getattr(adapter, "poolmanager", None)
+                if poolmanager is None:
+                    continue
+                for key in list(poolmanager.pools.keys()):
+                    pool = poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    requests_count += pool.num_requests
+                    connections_count += pool.num_connections
+
+        return {
+            "requests": requests_count,
+            "connections": connections_count,
+            "reused": max(requests_count - connections_count, 0)
+        }
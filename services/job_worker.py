@@ -0,0 +1,198 @@
+"""
+Pool de workers que procesan la cola persistente de trabajos
+"""
+
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from .retry import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorkerPool:
+    """Pool de hilos que drena la cola de trabajos en segundo plano"""
+
+    def __init__(self, job_queue, handlers: Dict[str, Callable[[Dict], Dict]],
+                 num_workers: int = 2, poll_interval: float = 0.5,
+                 lease_seconds: float = 300, retry_delay: float = 2,
+                 max_retry_delay: float = 600,
+                 exhausted_handlers: Optional[Dict[str, Callable[[Dict, str], None]]] = None,
+                 reap_interval: float = 30, retention_seconds: float = 0,
+                 maintenance: Optional[List[Callable[[], object]]] = None):
+        """
+        Inicializar pool de workers
+
+        Args:
+            job_queue: Cola de trabajos (JobQueue)
+            handlers: Mapeo de tipo de trabajo a función que lo procesa. La función
+                recibe el payload y retorna un Dict; si contiene 'retry': True el
+                trabajo se reprograma (después de 'retry_after' segundos si se indica)
+            num_workers: Número de hilos de procesamiento
+            poll_interval: Segundos de espera cuando la cola está vacía
+            lease_seconds: Segundos que un trabajo queda reservado por un worker
+            retry_delay: Retraso base (segundos) para reintentos con backoff exponencial
+            max_retry_delay: Retraso máximo (segundos) entre reintentos
+            exhausted_handlers: Mapeo de tipo de trabajo a función que se llama con
+                el payload y el último error cuando el trabajo falla definitivamente
+            reap_interval: Segundos entre revisiones de trabajos cuyo lease expiró
+                en el último intento (se cierran como fallidos)
+            retention_seconds: Segundos que se conservan los trabajos terminados
+                antes de eliminarlos en la revisión periódica (0 = no eliminar)
+            maintenance: Funciones que se ejecutan en cada revisión periódica
+                (ej: recuperar notificaciones cuyo envío se interrumpió)
+        """
+        self.job_queue = job_queue
+        self.handlers = handlers
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.exhausted_handlers = exhausted_handlers or {}
+        self.reap_interval = reap_interval
+        self.retention_seconds = retention_seconds
+        self.maintenance = maintenance or []
+        self._next_reap = 0.0
+        self._reap_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Iniciar los hilos de procesamiento"""
+        if self._threads:
+            return
+
+        self._stop_event.clear()
+        for i in range(self.num_workers):
+            thread = threading.Thread(
+                target=self._run,
+                name=f"job-worker-{i + 1}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        logger.info(f"Pool de workers iniciado con {self.num_workers} hilos")
+
+    def stop(self, timeout: float = 5):
+        """Detener los hilos de procesamiento"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        """Bucle principal de cada worker"""
+        while not self._stop_event.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                logger.error(f"Error en worker de la cola: {e}")
+                processed = False
+
+            if not processed:
+                self._stop_event.wait(self.poll_interval)
+
+    def run_once(self) -> bool:
+        """
+        Tomar y procesar un trabajo de la cola
+
+        Returns:
+            True si se procesó un trabajo, False si la cola estaba vacía
+        """
+        if self._claim_reap():
+            self.reap_exhausted()
+            self._run_maintenance()
+
+        # Solo los tipos con handler (otros, como los lotes de email, los atiende su propio hilo)
+        job = self.job_queue.claim(self.lease_seconds, job_types=list(self.handlers))
+        if not job:
+            return False
+
+        job_id = job["id"]
+        handler = self.handlers.get(job["job_type"])
+        if not handler:
+            logger.error(f"Trabajo {job_id}: Tipo desconocido '{job['job_type']}'")
+            self.job_queue.fail(job_id, f"Unknown job type: {job['job_type']}")
+            return True
+
+        try:
+            result = handler(job["payload"]) or {}
+        except Exception as e:
+            logger.error(f"Trabajo {job_id}: Error inesperado: {e}")
+            result = {"status": "error", "error": str(e), "retry": True}
+
+        if result.get("status") == "error":
+            error_message = result.get("error", "Unknown error")
+            if result.get("retry") and job["attempts"] < job["max_attempts"]:
+                delay = result.get("retry_after")
+                if delay is None:
+                    delay = self._backoff(job["attempts"])
+                else:
+                    delay = min(delay, self.max_retry_delay)
+                logger.warning(f"Trabajo {job_id}: {error_message}. Reintento en {delay:.1f} segundos "
+                               f"(intento {job['attempts']}/{job['max_attempts']})")
+                self.job_queue.fail(job_id, error_message, delay)
+            else:
+                logger.error(f"Trabajo {job_id}: {error_message}")
+                self.job_queue.fail(job_id, error_message)
+                self._on_exhausted(job, error_message)
+        else:
+            self.job_queue.complete(job_id)
+
+        return True
+
+    def _claim_reap(self) -> bool:
+        """Reservar la revisión periódica: solo un hilo la ejecuta en cada intervalo"""
+        with self._reap_lock:
+            now = time.monotonic()
+            if now < self._next_reap:
+                return False
+            self._next_reap = now + self.reap_interval
+            return True
+
+    def reap_exhausted(self) -> int:
+        """
+        Cerrar los trabajos cuyo worker murió en el último intento y eliminar
+        los terminados que superan el tiempo de retención
+
+        Returns:
+            Número de trabajos marcados como fallidos
+        """
+        jobs = self.job_queue.reap_exhausted(job_types=list(self.handlers))
+        for job in jobs:
+            logger.error(f"Trabajo {job['id']}: {job['last_error']} "
+                         f"(intento {job['attempts']}/{job['max_attempts']})")
+            self._on_exhausted(job, job["last_error"])
+
+        if self.retention_seconds > 0:
+            purged = self.job_queue.purge_finished(self.retention_seconds, job_types=list(self.handlers))
+            if purged:
+                logger.info(f"{purged} trabajos terminados eliminados de la cola")
+        return len(jobs)
+
+    def _run_maintenance(self):
+        """Ejecutar las tareas de mantenimiento periódicas (un fallo no detiene el worker)"""
+        for task in self.maintenance:
+            try:
+                task()
+            except Exception as e:
+                logger.error(f"Error en tarea de mantenimiento de la cola: {e}")
+
+    def _on_exhausted(self, job: Dict, error_message: str):
+        """Notificar que un trabajo falló definitivamente"""
+        exhausted_handler = self.exhausted_handlers.get(job["job_type"])
+        if not exhausted_handler:
+            return
+
+        try:
+            exhausted_handler(job["payload"], error_message)
+        except Exception as e:
+            logger.error(f"Trabajo {job['id']}: Error al registrar el fallo definitivo: {e}")
+
+    def _backoff(self, attempts: int) -> float:
+        """Retraso antes del siguiente intento (backoff exponencial con jitter)"""
+        return backoff_delay(attempts, self.retry_delay, self.max_retry_delay)
@@ -0,0 +1,160 @@
+"""
+Enrutador de email entre varios proveedores con failover según su salud
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from .mail_transport import MailTransport
+
+logger = logging.getLogger(__name__)
+
+
+class _ProviderHealth:
+    """Latencia y tasa de error (medias móviles exponenciales) de un proveedor"""
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.updated_at = time.monotonic()
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.sends = 0
+        self.failures = 0
+
+
+class MailRouter:
+    """
+    Envía cada email por el proveedor más sano y pasa al siguiente si falla
+
+    Los proveedores se ordenan por una puntuación que combina su latencia media
+    y su tasa de error recientes (EWMA). Un proveedor con varios fallos seguidos
+    queda en pausa (circuit breaker) durante cooldown segundos y solo se usa si
+    los demás también fallan. La tasa de error se reduce a la mitad cada cooldown
+    segundos sin envíos, para que un proveedor recuperado vuelva a recibir tráfico.
+    Con proveedores sanos se respeta el orden configurado.
+    """
+
+    def __init__(self, transports: List[MailTransport], alpha: float = 0.2,
+                 failure_threshold: int = 3, cooldown: float = 30,
+                 error_penalty: float = 10, initial_latency: float = 1.0):
+        """
+        Inicializar enrutador
+
+        Args:
+            transports: Transportes en orden de preferencia
+            alpha: Peso de cada nueva muestra en las medias móviles (0-1)
+            failure_threshold: Fallos seguidos que ponen en pausa a un proveedor
+            cooldown: Segundos de pausa de un proveedor después de fallar repetidamente
+            error_penalty: Segundos que suma a la puntuación una tasa de error del 100%
+            initial_latency: Latencia supuesta (segundos) para proveedores sin muestras
+        """
+        if not transports:
+            raise ValueError("MailRouter requiere al menos un transporte")
+
+        self.transports = transports
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.error_penalty = error_penalty
+        self.initial_latency = initial_latency
+        self._lock = threading.Lock()
+        self._health: Dict[str, _ProviderHealth] = {t.name: _ProviderHealth() for t in transports}
+
+    def _error_rate(self, health: _ProviderHealth, now: float) -> float:
+        """Tasa de error con decaimiento por el tiempo transcurrido desde el último envío"""
+        return health.error_rate * 0.5 ** ((now - health.updated_at) / self.cooldown)
+
+    def _score(self, health: _ProviderHealth, now: float) -> float:
+        latency = self.initial_latency if health.latency is None else health.latency
+        return latency + self._error_rate(health, now) * self.error_penalty
+
+    def ranked_transports(self) -> List[MailTransport]:
+        """Transportes ordenados del más sano al menos sano (los que están en pausa al final)"""
+        now = time.monotonic()
+        with self._lock:
+            keys = {
+                t.name: (self._health[t.name].open_until > now, self._score(self._health[t.name], now), i)
+                for i, t in enumerate(self.transports)
+            }
+        return sorted(self.transports, key=lambda t: keys[t.name])
+
+    def _record(self, name: str, success: bool, latency: float):
+        """Actualizar la salud de un proveedor con el resultado de un envío"""
+        now = time.monotonic()
+        with self._lock:
+            health = self._health[name]
+            health.sends += 1
+            health.latency = latency if health.latency is None else (
+                self.alpha * latency + (1 - self.alpha) * health.latency
+            )
+            health.error_rate = (
+                self.alpha * (0.0 if success else 1.0) + (1 - self.alpha) * self._error_rate(health, now)
+            )
+            health.updated_at = now
+
+            if success:
+                health.consecutive_failures = 0
+                health.open_until = 0.0
+                return
+
+            health.failures += 1
+            health.consecutive_failures += 1
+            if health.consecutive_failures >= self.failure_threshold:
+                health.open_until = now + self.cooldown
+                logger.warning(f"Proveedor de email '{name}' en pausa por {self.cooldown} segundos "
+                               f"({health.consecutive_failures} fallos seguidos)")
+
+    def send(self, to_email: str, subject: str, html_content: str,
+             plain_content: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict:
+        """
+        Enviar un email por el proveedor más sano, con failover a los demás
+
+        Args:
+            idempotency_key: Clave de idempotencia que se pasa a cada proveedor
+                (Resend descarta los reenvíos con la misma clave durante 24 horas)
+
+        Returns:
+            Resultado del proveedor que envió el email (o del último que falló),
+            con 'provider'. 'retryable' es True si algún fallo fue transitorio
+        """
+        result = None
+        retryable = False
+
+        for transport in self.ranked_transports():
+            started = time.monotonic()
+            try:
+                result = transport.send(to_email, subject, html_content, plain_content, idempotency_key)
+            except Exception as e:
+                logger.error(f"Error inesperado en el proveedor de email '{transport.name}': {e}")
+                result = {"success": False, "id": None, "status_code": None, "error": str(e),
+                          "retryable": True, "retry_after": None}
+
+            self._record(transport.name, result["success"], time.monotonic() - started)
+            result = dict(result, provider=transport.name)
+
+            if result["success"]:
+                return result
+
+            retryable = retryable or result["retryable"]
+            logger.warning(f"Fallo de envío con '{transport.name}': {result['error']}")
+
+        result["retryable"] = retryable
+        return result
+
+    def stats(self) -> Dict[str, Dict]:
+        """Salud de cada proveedor"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "latency_ms": round(health.latency * 1000, 1) if health.latency is not None else None,
+                    "error_rate": round(self._error_rate(health, now), 3),
+                    "sends": health.sends,
+                    "failures": health.failures,
+                    "paused": health.open_until > now
+                }
+                for name, health in self._health.items()
+            }
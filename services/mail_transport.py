@@ -0,0 +1,126 @@
+"""
+Interfaz común para los proveedores de envío de email
+
+Cada transporte adapta un servicio existente (Resend, Gmail SMTP, Gmail API)
+a la misma firma y al mismo formato de resultado que ResendService.send_email_result.
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def send_result(success: bool, error: Optional[str] = None, retryable: bool = False) -> Dict:
+    """Resultado de envío para los transportes que solo informan éxito o fallo"""
+    return {
+        "success": success,
+        "id": None,
+        "status_code": None,
+        "error": error,
+        "retryable": retryable,
+        "retry_after": None
+    }
+
+
+class MailTransport:
+    """Transporte de email (interfaz base)"""
+
+    name = "base"
+
+    def send(self, to_email: str, subject: str, html_content: str,
+             plain_content: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict:
+        """
+        Enviar un email
+
+        Args:
+            to_email: Email del destinatario
+            subject: Asunto del email
+            html_content: Cuerpo HTML
+            plain_content: Cuerpo en texto plano (opcional, no todos los proveedores lo usan)
+            idempotency_key: Clave para que el proveedor descarte un reenvío del mismo
+                email (opcional; solo Resend la usa)
+
+        Returns:
+            Dict con 'success', 'id', 'status_code', 'error', 'retryable' y 'retry_after'
+        """
+        raise NotImplementedError
+
+
+class ResendTransport(MailTransport):
+    """Envío con la API de Resend"""
+
+    name = "resend"
+
+    def __init__(self, resend_service, from_email: str = "onboarding@resend.dev"):
+        self.resend_service = resend_service
+        self.from_email = from_email
+
+    def send(self, to_email: str, subject: str, html_content: str,
+             plain_content: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict:
+        return self.resend_service.send_email_result(to_email, subject, html_content, self.from_email,
+                                                     idempotency_key=idempotency_key)
+
+
+class GmailSMTPTransport(MailTransport):
+    """Envío con Gmail SMTP (GmailService)"""
+
+    name = "gmail_smtp"
+
+    def __init__(self, gmail_service):
+        self.gmail_service = gmail_service
+
+    def send(self, to_email: str, subject: str, html_content: str,
+             plain_content: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict:
+        if self.gmail_service.send_email(to_email, subject, html_content, plain_content):
+            return send_result(True)
+        return send_result(False, error="Gmail SMTP send failed", retryable=True)
+
+
+class GmailAPITransport(MailTransport):
+    """Envío con la API de Gmail (GmailAPIService)"""
+
+    name = "gmail_api"
+
+    def __init__(self, gmail_api_service):
+        self.gmail_api_service = gmail_api_service
+
+    def send(self, to_email: str, subject: str, html_content: str,
+             plain_content: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict:
+        if self.gmail_api_service.send_email(to_email, subject, html_content, plain_content):
+            return send_result(True)
+        return send_result(False, error="Gmail API send failed", retryable=True)
+
+
+class LazyTransport(MailTransport):
+    """
+    Transporte que se construye en su primer envío
+
+    Evita importar e inicializar proveedores de respaldo (por ejemplo los
+    clientes de Gmail) durante el arranque si nunca llegan a usarse.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], MailTransport]):
+        """
+        Args:
+            name: Nombre del proveedor
+            factory: Función que importa y crea el transporte real
+        """
+        self.name = name
+        self.factory = factory
+        self._transport: Optional[MailTransport] = None
+        self._lock = threading.Lock()
+
+    @property
+    def transport(self) -> MailTransport:
+        if self._transport is None:
+            with self._lock:
+                if self._transport is None:
+                    logger.info(f"Inicializando proveedor de email '{self.name}'")
+                    self._transport = self.factory()
+        return self._transport
+
+    def send(self, to_email: str, subject: str, html_content: str,
+             plain_content: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict:
+        return self.transport.send(to_email, subject, html_content, plain_content, idempotency_key)
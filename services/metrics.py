@@ -0,0 +1,335 @@
+"""
+Métricas del procesamiento de webhooks en formato de texto de Prometheus
+
+Cada hilo acumula sus observaciones en su propio fragmento (sin locks en el
+camino caliente) y la lectura suma todos los fragmentos. Con varios workers de
+gunicorn, cada proceso guarda periódicamente su estado en un archivo
+metrics_<pid>.json de un directorio compartido y /metrics suma los archivos de
+todos los procesos, de modo que los histogramas y contadores se agregan
+correctamente sin importar qué worker atienda la consulta.
+"""
+
+import os
+import json
+import glob
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Límites (segundos) de los buckets de latencia
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Etapas del procesamiento de un webhook
+STAGE_SECONDS = "webhook_stage_duration_seconds"
+STAGE_ERRORS = "webhook_stage_errors_total"
+PROCESSING_SECONDS = "webhook_processing_duration_seconds"
+PROCESSED_TOTAL = "webhooks_processed_total"
+
+FILE_PREFIX = "metrics_"
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict) -> LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def clear_metrics_dir(metrics_dir: str):
+    """Eliminar los archivos de métricas de ejecuciones anteriores (al arrancar el servidor)"""
+    for path in glob.glob(os.path.join(metrics_dir, f"{FILE_PREFIX}*.json")):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"No se pudo eliminar el archivo de métricas {path}: {e}")
+
+
+class _Shard:
+    """Observaciones de un hilo"""
+
+    def __init__(self):
+        # Histogramas: clave -> [conteo por bucket..., conteo > último bucket, suma, total]
+        self.histograms: Dict[LabelKey, List[float]] = {}
+        self.counters: Dict[LabelKey, float] = {}
+
+
+class MetricsRegistry:
+    """Registro de histogramas y contadores del proceso"""
+
+    def __init__(self, metrics_dir: Optional[str] = None, dump_interval: float = 5.0):
+        """
+        Inicializar registro
+
+        Args:
+            metrics_dir: Directorio compartido por los workers para agregar sus
+                métricas (None para reportar solo las del proceso actual)
+            dump_interval: Segundos entre escrituras del archivo de este proceso
+        """
+        self.metrics_dir = metrics_dir
+        self.dump_interval = dump_interval
+        self._definitions: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._pid = os.getpid()
+        self._dumper: Optional[threading.Thread] = None
+        self._gauges: Dict[str, Callable[[], Optional[float]]] = {}
+
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+
+        self.histogram(STAGE_SECONDS, "Duración de cada etapa del procesamiento de un webhook")
+        self.histogram(PROCESSING_SECONDS, "Duración del procesamiento completo de un webhook")
+        self.counter(STAGE_ERRORS, "Etapas interrumpidas por una excepción")
+        self.counter(PROCESSED_TOTAL, "Webhooks procesados por resultado")
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """Declarar un histograma"""
+        self._definitions[name] = {"type": "histogram", "help": help_text, "buckets": tuple(buckets)}
+
+    def counter(self, name: str, help_text: str):
+        """Declarar un contador"""
+        self._definitions[name] = {"type": "counter", "help": help_text}
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], Optional[float]], aggregate: str = "sum"):
+        """
+        Declarar un gauge cuyo valor se lee al consultar las métricas
+
+        Args:
+            fn: Función que devuelve el valor actual del proceso (None para omitirlo)
+            aggregate: Cómo se combinan los procesos: "sum" (ej: peticiones en
+                curso de cada worker) o "latest" (un valor global que todos los
+                workers leen, ej: trabajos en la cola; se toma el más reciente)
+        """
+        self._definitions[name] = {"type": "gauge", "help": help_text, "aggregate": aggregate}
+        self._gauges[name] = fn
+
+    def _shard(self) -> _Shard:
+        """Fragmento del hilo actual (se descartan los heredados a través de fork)"""
+        shard = getattr(self._local, "shard", None)
+        if shard is not None and self._local.pid == os.getpid():
+            return shard
+
+        with self._lock:
+            pid = os.getpid()
+            if self._pid != pid:
+                self._pid = pid
+                self._shards = []
+                self._dumper = None
+            shard = _Shard()
+            self._shards.append(shard)
+            self._start_dumper()
+
+        self._local.shard = shard
+        self._local.pid = pid
+        return shard
+
+    def observe(self, name: str, value: float, **labels):
+        """Registrar una observación en un histograma"""
+        buckets = self._definitions[name]["buckets"]
+        histograms = self._shard().histograms
+        key = _key(name, labels)
+        values = histograms.get(key)
+        if values is None:
+            values = histograms[key] = [0] * (len(buckets) + 3)
+        values[bisect_left(buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Incrementar un contador"""
+        counters = self._shard().counters
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Medir la duración del bloque en un histograma"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Medir una etapa del procesamiento de un webhook (y contar si falla)"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(STAGE_ERRORS, stage=stage)
+            raise
+        finally:
+            self.observe(STAGE_SECONDS, time.perf_counter() - started, stage=stage)
+
+    def snapshot(self) -> Dict[str, Dict[LabelKey, object]]:
+        """Suma de los fragmentos de todos los hilos del proceso"""
+        with self._lock:
+            shards = list(self._shards) if self._pid == os.getpid() else []
+
+        histograms: Dict[LabelKey, List[float]] = {}
+        counters: Dict[LabelKey, float] = {}
+        for shard in shards:
+            for key, values in dict(shard.histograms).items():
+                self._add_values(histograms, key, values)
+            for key, value in dict(shard.counters).items():
+                counters[key] = counters.get(key, 0) + value
+        return {"histograms": histograms, "counters": counters, "gauges": self._read_gauges()}
+
+    def _read_gauges(self) -> Dict[LabelKey, float]:
+        gauges = {}
+        for name, fn in list(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                logger.warning(f"No se pudo leer el gauge {name}: {e}")
+                continue
+            if value is not None:
+                gauges[(name, ())] = value
+        return gauges
+
+    @staticmethod
+    def _add_values(histograms: Dict[LabelKey, List[float]], key: LabelKey, values: List[float]):
+        total = histograms.get(key)
+        if total is None:
+            histograms[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                total[i] += value
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.metrics_dir, f"{FILE_PREFIX}{pid}.json")
+
+    def dump(self):
+        """Guardar el estado del proceso en su archivo (escritura atómica)"""
+        if not self.metrics_dir:
+            return
+
+        snapshot = self.snapshot()
+        data = {
+            "histograms": [[name, labels, values] for (name, labels), values in snapshot["histograms"].items()],
+            "counters": [[name, labels, value] for (name, labels), value in snapshot["counters"].items()],
+            "gauges": [[name, labels, value] for (name, labels), value in snapshot["gauges"].items()],
+            "time": time.time()
+        }
+        path = self._path(os.getpid())
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _start_dumper(self):
+        """Iniciar el hilo que guarda periódicamente el estado del proceso (con el lock tomado)"""
+        if not self.metrics_dir or self._dumper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.dump_interval)
+                try:
+                    self.dump()
+                except Exception as e:
+                    logger.warning(f"No se pudieron guardar las métricas del proceso: {e}")
+
+        self._dumper = threading.Thread(target=run, name="metrics-dumper", daemon=True)
+        self._dumper.start()
+
+    def collect(self) -> Dict[str, Dict[LabelKey, object]]:
+        """
+        Métricas agregadas de todos los procesos
+
+        El proceso actual guarda su estado antes de leer, de modo que sus
+        propias métricas siempre están al día; las de los demás workers tienen
+        como máximo dump_interval segundos de retraso. Los gauges de archivos
+        sin actualizar en 3 * dump_interval se descartan (workers terminados).
+        """
+        if not self.metrics_dir:
+            return self.snapshot()
+
+        self.dump()
+        histograms: Dict[LabelKey, List[float]] = {}
+        counters: Dict[LabelKey, float] = {}
+        gauges: Dict[LabelKey, float] = {}
+        gauge_times: Dict[LabelKey, float] = {}
+        stale_before = time.time() - 3 * self.dump_interval
+        for path in glob.glob(os.path.join(self.metrics_dir, f"{FILE_PREFIX}*.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Archivo de métricas ilegible {path}: {e}")
+                continue
+
+            for name, labels, values in data["histograms"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                definition = self._definitions.get(name)
+                if definition and len(values) == len(definition["buckets"]) + 3:
+                    self._add_values(histograms, key, values)
+            for name, labels, value in data["counters"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+
+            dumped_at = data.get("time", 0)
+            if dumped_at < stale_before:
+                continue
+            for name, labels, value in data.get("gauges", []):
+                definition = self._definitions.get(name)
+                if not definition or definition["type"] != "gauge":
+                    continue
+                key = (name, tuple(tuple(label) for label in labels))
+                if definition["aggregate"] == "sum":
+                    gauges[key] = gauges.get(key, 0) + value
+                elif dumped_at >= gauge_times.get(key, 0):
+                    gauges[key] = value
+                    gauge_times[key] = dumped_at
+        return {"histograms": histograms, "counters": counters, "gauges": gauges}
+
+    def render(self) -> str:
+        """Métricas agregadas en formato de texto de Prometheus"""
+        collected = self.collect()
+        lines = []
+
+        for name, definition in self._definitions.items():
+            lines.append(f"# HELP {name} {definition['help']}")
+            lines.append(f"# TYPE {name} {definition['type']}")
+
+            if definition["type"] in ("counter", "gauge"):
+                values = collected["counters" if definition["type"] == "counter" else "gauges"]
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{name}{self._labels(labels)} {self._number(value)}")
+                continue
+
+            buckets = definition["buckets"]
+            for (metric, labels), values in sorted(collected["histograms"].items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, values):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(labels, le=self._number(bound))} {cumulative}")
+                lines.append(f"{name}_bucket{self._labels(labels, le='+Inf')} {self._number(values[-1])}")
+                lines.append(f"{name}_sum{self._labels(labels)} {values[-2]!r}")
+                lines.append(f"{name}_count{self._labels(labels)} {self._number(values[-1])}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(labels: Tuple[Tuple[str, str], ...], **extra) -> str:
+        pairs = list(labels) + list(extra.items())
+        if not pairs:
+            return ""
+        escaped = (
+            f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for k, v in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    @staticmethod
+    def _number(value: float) -> str:
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -4,17 +4,31 @@ Servicio de lógica de notificaciones
 
 import logging
 from typing import Dict, List, Optional
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
 from datetime import datetime
 import os
 
+from .template_builder import TemplateBuildLoader
+from .fragment_cache import FragmentRenderCache
+from .action_matcher import ActionMatcher
+
 logger = logging.getLogger(__name__)
 
 
 class NotificationService:
     """Servicio para generar y gestionar notificaciones"""
     
-    def __init__(self, templates_dir: str, client_portal_url: str, action_descriptions: Dict):
+    # Templates que se renderizan en cada email
+    TEMPLATE_NAMES = ('email_first_notification.html', 'email_progress_update.html',
+                      'email_progress_digest.html')
+    
+    # Variables de los templates propias de cada cliente; el resto depende solo de la acción
+    CLIENT_FIELDS = ('client_name', 'project_id', 'project_title', 'project_address', 'completion_date')
+    
+    def __init__(self, templates_dir: str, client_portal_url: str, action_descriptions: Dict,
+                 production: bool = False, bytecode_cache_dir: Optional[str] = None,
+                 build_templates: bool = False, fragment_cache_size: int = 0,
+                 action_matcher: Optional[ActionMatcher] = None):
         """
         Inicializar servicio de notificaciones
         
@@ -22,15 +36,73 @@ class NotificationService:
             templates_dir: Directorio donde están los templates de email
             client_portal_url: URL del portal de clientes
             action_descriptions: Mapeo de acciones a descripciones
+            production: Modo producción: sin recarga automática de templates y con
+                los templates precargados en la construcción
+            bytecode_cache_dir: Directorio de la caché de bytecode de Jinja2 (opcional);
+                evita recompilar los templates en cada arranque de un worker
+            build_templates: Construir los templates al cargarlos (herencia aplanada,
+                CSS en línea y HTML minificado), ver services.template_builder
+            fragment_cache_size: Combinaciones (template, acción) a memoizar en la caché
+                de fragmentos, ver services.fragment_cache (0 para desactivarla)
+            action_matcher: Índice de títulos de acción (compartido con OpenSolarService);
+                por defecto se construye con action_descriptions
         """
         self.client_portal_url = client_portal_url
         self.action_descriptions = action_descriptions
+        self.action_matcher = action_matcher or ActionMatcher(action_descriptions)
+        self.production = production
+        
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
         
         # Configurar Jinja2
+        loader = TemplateBuildLoader(templates_dir) if build_templates else FileSystemLoader(templates_dir)
         self.jinja_env = Environment(
-            loader=FileSystemLoader(templates_dir),
-            autoescape=select_autoescape(['html', 'xml'])
+            loader=loader,
+            autoescape=select_autoescape(['html', 'xml']),
+            auto_reload=not production,
+            bytecode_cache=bytecode_cache
         )
+        
+        self.fragment_cache = None
+        if fragment_cache_size > 0:
+            self.fragment_cache = FragmentRenderCache(self.CLIENT_FIELDS, maxsize=fragment_cache_size)
+        
+        self._templates = {}
+        if production:
+            self.preload_templates()
+    
+    def preload_templates(self):
+        """Compilar y guardar los templates de email (y su template base)"""
+        for name in self.TEMPLATE_NAMES:
+            self._templates[name] = self.jinja_env.get_template(name)
+        logger.info(f"Templates precargados: {', '.join(self.TEMPLATE_NAMES)}")
+    
+    def warm_up(self):
+        """Precargar los templates y renderizarlos una vez con datos de ejemplo"""
+        self.preload_templates()
+        sample_client = {'name': 'Cliente', 'email': 'cliente@example.com'}
+        sample_project = {'id': 0, 'title': 'Proyecto', 'address': ''}
+        sample_action = {'action': {'title': 'Acción completada'}, 'completion_date': ''}
+        self.generate_first_notification_email(sample_client, sample_project, sample_action)
+        self.generate_progress_update_email(sample_client, sample_project, sample_action)
+        self.generate_digest_email(sample_client, sample_project, [sample_action, sample_action])
+    
+    def _get_template(self, name: str):
+        """Template precargado (modo producción) o buscado en el entorno de Jinja2"""
+        template = self._templates.get(name)
+        if template is None:
+            template = self.jinja_env.get_template(name)
+        return template
+    
+    def _render(self, name: str, template_data: Dict) -> str:
+        """Renderizar un template de email (con la caché de fragmentos si está activa)"""
+        template = self._get_template(name)
+        if self.fragment_cache is None:
+            return template.render(**template_data)
+        return self.fragment_cache.render(template, template_data)
     
     def _format_completion_date(self, date_str: str) -> str:
         """
@@ -94,8 +166,7 @@ class NotificationService:
         }
         
         # Renderizar template HTML
-        template = self.jinja_env.get_template('email_first_notification.html')
-        html_body = template.render(**template_data)
+        html_body = self._render('email_first_notification.html', template_data)
         
         # Generar versión texto plano
         text_body = self._generate_text_version(template_data, is_first=True)
@@ -141,8 +212,7 @@ class NotificationService:
         }
         
         # Renderizar template HTML
-        template = self.jinja_env.get_template('email_progress_update.html')
-        html_body = template.render(**template_data)
+        html_body = self._render('email_progress_update.html', template_data)
         
         # Generar versión texto plano
         text_body = self._generate_text_version(template_data, is_first=False)
@@ -156,6 +226,52 @@ class NotificationService:
             'text': text_body
         }
     
+    def generate_digest_email(self, client_data: Dict, project_data: Dict,
+                              actions_data: List[Dict]) -> Dict:
+        """
+        Generar un email de resumen con varias acciones completadas del proyecto
+        
+        Args:
+            client_data: Datos del cliente
+            project_data: Datos del proyecto
+            actions_data: Datos de cada acción completada, en orden de completación
+            
+        Returns:
+            Dict con subject, html y text del email
+        """
+        actions = []
+        for action_data in actions_data:
+            action_info = self._get_action_info(action_data)
+            action_info['completion_date'] = self._format_completion_date(action_data.get('completion_date', ''))
+            actions.append(action_info)
+        
+        # Preparar datos para el template (los próximos pasos son los de la última acción)
+        template_data = {
+            'client_name': client_data.get('name', 'Cliente'),
+            'project_id': project_data.get('id', ''),
+            'project_title': project_data.get('title', ''),
+            'project_address': project_data.get('address', ''),
+            'actions': actions,
+            'next_steps': actions[-1]['next_steps'],
+            'portal_url': self.client_portal_url,
+            'year': '2025'
+        }
+        
+        # Renderizar template HTML
+        html_body = self._render('email_progress_digest.html', template_data)
+        
+        # Generar versión texto plano
+        text_body = self._generate_digest_text_version(template_data)
+        
+        # Generar asunto
+        subject = f"Actualización de tu Proyecto Solar - {len(actions)} nuevos avances"
+        
+        return {
+            'subject': subject,
+            'html': html_body,
+            'text': text_body
+        }
+    
     def _get_action_info(self, action_data: Dict) -> Dict:
         """
         Obtener información detallada de una acción
@@ -169,11 +285,10 @@ class NotificationService:
         action = action_data.get('action', {})
         action_title = action.get('title', 'Acción completada')
         
-        # Buscar descripción en el mapeo
-        action_desc_data = self.action_descriptions.get(
-            action_title,
-            self.action_descriptions.get('default', {})
-        )
+        # Buscar descripción en el mapeo (sin distinguir mayúsculas ni tildes)
+        action_desc_data = self.action_matcher.description(action_title)
+        if action_desc_data is None:
+            action_desc_data = self.action_descriptions.get('default', {})
         
         return {
             'title': action_title,
@@ -264,4 +379,46 @@ Revoluciona el concepto de vivir
 © {data['year']} Green House Project. Todos los derechos reservados.
 """
     
+    def _generate_digest_text_version(self, data: Dict) -> str:
+        """
+        Generar versión texto plano del email de resumen
+        
+        Args:
+            data: Datos del template
+            
+        Returns:
+            Texto plano del email
+        """
+        actions_text = "\n\n".join(
+            f"{action['title'].upper()}\n\n{action['description']}\n\n"
+            f"Fecha de completación: {action['completion_date']}"
+            for action in data['actions']
+        )
+        return f"""
+¡Hola, {data['client_name']}!
+
+Tu proyecto solar sigue avanzando. Te informamos que se han completado varias etapas:
 
+{actions_text}
+
+INFORMACIÓN DE TU PROYECTO
+
+Proyecto: {data['project_title']}
+Dirección: {data['project_address']}
+ID del Proyecto: {data['project_id']}
+
+PRÓXIMOS PASOS
+
+{data['next_steps']}
+
+Puedes consultar el estado completo de tu proyecto en: {data['portal_url']}
+
+Si tienes alguna pregunta, no dudes en contactarnos.
+
+¡Gracias por confiar en Green House Project!
+
+Equipo Green House Project
+Revoluciona el concepto de vivir
+
+© {data['year']} Green House Project. Todos los derechos reservados.
+"""
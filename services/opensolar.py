@@ -2,45 +2,243 @@
 Servicio de integración con OpenSolar API
 """
 
+import os
+import time
+import threading
 import requests
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import logging
 
+from .action_matcher import ActionMatcher
+from .cache import TTLCache
+from .http_session import PooledSession
+from .singleflight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
+# Campos del proyecto que deben venir en el webhook para no consultar la API
+PAYLOAD_REQUIRED_FIELDS = ('id', 'title', 'address', 'contacts_data')
+
 
 class OpenSolarService:
     """Servicio para interactuar con la API de OpenSolar"""
     
-    def __init__(self, api_token: str, org_id: str, base_url: str = 'https://api.opensolar.com/api'):
+    # Segundos que el lease dura más que la consulta más lenta (respuesta, caché y publicación)
+    LEASE_MARGIN = 5
+    
+    def __init__(self, api_token: str, org_id: str, base_url: str = 'https://api.opensolar.com/api',
+                 session: Optional[PooledSession] = None,
+                 project_cache: Optional[TTLCache] = None,
+                 lease_store=None, lease_ttl: Optional[float] = None, lease_poll_interval: float = 0.1,
+                 action_matcher: Optional[ActionMatcher] = None, request_timeout: float = 30):
+        """
+        Inicializar servicio de OpenSolar
+        
+        Args:
+            api_token: Token de la API de OpenSolar
+            org_id: ID de la organización
+            base_url: URL base de la API
+            session: Sesión HTTP con pool de conexiones (opcional)
+            project_cache: Caché de documentos de proyecto (opcional)
+            lease_store: Almacén de leases compartido entre procesos (FetchLease,
+                opcional) para que solo un worker consulte el mismo proyecto a la vez
+            lease_ttl: Segundos de validez del lease entre procesos. Por defecto la
+                duración máxima de una consulta (timeout por los reintentos de la
+                sesión) más un margen, para que no venza a mitad de la consulta
+            lease_poll_interval: Segundos entre consultas mientras se espera a otro proceso
+            action_matcher: Índice de títulos de acción (compartido con NotificationService);
+                por defecto se construye con Config.ACTION_DESCRIPTIONS y Config.TRIGGER_ACTIONS
+            request_timeout: Timeout (segundos) de cada intento de consulta de un proyecto
+        """
         self.api_token = api_token
         self.org_id = org_id
         self.base_url = base_url
+        self.session = session or PooledSession()
+        self.project_cache = project_cache
+        self.single_flight = SingleFlight()
+        self.lease_store = lease_store
+        self.request_timeout = request_timeout
+        if lease_ttl is None:
+            lease_ttl = self.session.max_request_duration(request_timeout) + self.LEASE_MARGIN
+        self.lease_ttl = lease_ttl
+        self.lease_poll_interval = lease_poll_interval
+        if action_matcher is None:
+            from config import Config
+            action_matcher = ActionMatcher(Config.ACTION_DESCRIPTIONS, Config.TRIGGER_ACTIONS)
+        self.action_matcher = action_matcher
+        self._lease_stats_lock = threading.Lock()
+        self.lease_stats = {'acquired': 0, 'shared': 0, 'timeouts': 0, 'stale': 0, 'direct': 0}
         self.headers = {
             'Authorization': f'Bearer {api_token}',
             'Content-Type': 'application/json'
         }
     
-    def get_project(self, project_id: int) -> Optional[Dict]:
+    def get_project(self, project_id: int, wait_for_lease: bool = True) -> Optional[Dict]:
         """
         Obtener información completa de un proyecto
         
+        Si hay caché configurada, devuelve el documento guardado mientras esté
+        vigente. Las llamadas concurrentes para el mismo proyecto se coalescen:
+        dentro del proceso comparten una única petición en curso y, si hay
+        almacén de leases, también se evita duplicarla entre workers.
+        
         Args:
             project_id: ID del proyecto en OpenSolar
+            wait_for_lease: Esperar a que otro proceso termine la consulta del
+                proyecto (trabajos de la cola). False en el hilo de una petición:
+                si el lease está tomado se usa la copia vencida de la caché o se
+                consulta directamente, sin esperar
             
         Returns:
             Diccionario con datos del proyecto o None si hay error
         """
+        if self.project_cache is not None:
+            project = self.project_cache.get(str(project_id))
+            if project is not None:
+                return project
+        
+        if self.lease_store is not None:
+            if not wait_for_lease:
+                # Clave aparte: una petición no debe unirse a una consulta que está esperando un lease
+                return self.single_flight.do(('no-wait', project_id),
+                                             lambda: self._fetch_project_with_lease(project_id, wait=False))
+            return self.single_flight.do(project_id, lambda: self._fetch_project_with_lease(project_id))
+        
+        return self.single_flight.do(project_id, lambda: self._fetch_project(project_id))
+    
+    def _fetch_project_with_lease(self, project_id: int, wait: bool = True) -> Optional[Dict]:
+        """
+        Consultar un proyecto coordinándose con los demás procesos mediante un lease
+        
+        Si otro proceso ya está consultando el proyecto, espera a que publique
+        el resultado en vez de repetir la petición (solo con wait=True; si no,
+        devuelve la copia vencida de la caché o consulta directamente).
+        """
+        lease_key = f"opensolar:project:{project_id}"
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        started = time.time()
+        deadline = started + self.lease_ttl
+        
+        while time.time() < deadline:
+            # ¿Otro proceso terminó la consulta mientras esperábamos?
+            lease = self.lease_store.get(lease_key)
+            if lease and lease['completed_at'] and lease['completed_at'] >= started and lease['result']:
+                self._count_lease('shared')
+                project = lease['result']
+                if self.project_cache is not None:
+                    self.project_cache.set(str(project_id), project)
+                return project
+            
+            if self.lease_store.acquire(lease_key, owner, self.lease_ttl):
+                self._count_lease('acquired')
+                project = None
+                try:
+                    project = self._fetch_project(project_id)
+                finally:
+                    self.lease_store.release(lease_key, owner, project)
+                return project
+            
+            if not wait:
+                return self._fetch_project_without_lease(project_id)
+            
+            time.sleep(self.lease_poll_interval)
+        
+        logger.warning(f"Proyecto {project_id}: Tiempo de espera del lease agotado, consultando directamente")
+        self._count_lease('timeouts')
+        return self._fetch_project(project_id)
+    
+    def _fetch_project_without_lease(self, project_id: int) -> Optional[Dict]:
+        """Copia vencida de la caché si existe; si no, consulta directa a la API"""
+        if self.project_cache is not None:
+            cached = self.project_cache.get_stale(str(project_id))
+            if cached is not None:
+                self._count_lease('stale')
+                return cached['value']
+        
+        self._count_lease('direct')
+        return self._fetch_project(project_id)
+    
+    def _count_lease(self, name: str):
+        with self._lease_stats_lock:
+            self.lease_stats[name] += 1
+    
+    def _fetch_project(self, project_id: int) -> Optional[Dict]:
+        """
+        Consultar un proyecto en la API
+        
+        Revalida la entrada expirada de la caché con ETag/Last-Modified cuando
+        la API los proporciona (un 304 renueva la entrada sin descargar el proyecto).
+        """
+        cache_key = str(project_id)
+        cached = None
+        headers = self.headers
+        
+        if self.project_cache is not None:
+            # Revalidación condicional de la entrada expirada
+            cached = self.project_cache.get_stale(cache_key)
+            if cached and (cached.get('etag') or cached.get('last_modified')):
+                headers = dict(self.headers)
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+        
         url = f"{self.base_url}/orgs/{self.org_id}/projects/{project_id}/"
         
         try:
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self.session.get(url, headers=headers, timeout=self.request_timeout)
+            
+            if response.status_code == 304 and cached:
+                self.project_cache.refresh(cache_key)
+                return cached['value']
+            
             response.raise_for_status()
-            return response.json()
+            project = response.json()
         except requests.exceptions.RequestException as e:
             logger.error(f"Error al obtener proyecto {project_id}: {e}")
             return None
+        
+        if self.project_cache is not None:
+            self.project_cache.set(
+                cache_key, project,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified')
+            )
+        
+        return project
+    
+    def invalidate_project(self, project_id: int, fields: Optional[Dict] = None) -> bool:
+        """
+        Invalidar el proyecto en caché si el webhook trae campos distintos a los guardados
+        
+        Args:
+            project_id: ID del proyecto en OpenSolar
+            fields: Campos del proyecto recibidos en el webhook. Si es None se
+                invalida la entrada sin comparar
+            
+        Returns:
+            True si se eliminó una entrada de la caché
+        """
+        if self.project_cache is None:
+            return False
+        
+        cache_key = str(project_id)
+        
+        if fields is not None:
+            cached = self.project_cache.get_stale(cache_key)
+            if not cached:
+                return False
+            
+            project = cached['value']
+            changed = [key for key, value in fields.items()
+                       if key in project and project[key] != value]
+            if not changed:
+                return False
+            
+            logger.info(f"Proyecto {project_id}: Campos modificados {changed}, invalidando caché")
+        
+        return self.project_cache.invalidate(cache_key)
     
     def get_recently_completed_actions(self, actions: List[Dict], 
                                       threshold_hours: int = 24) -> List[Dict]:
@@ -98,38 +296,44 @@ class OpenSolarService:
         
         return recently_completed
     
-    def is_initial_payment_action(self, action: Dict, trigger_keywords: List[str]) -> bool:
+    def is_initial_payment_action(self, action: Dict, trigger_keywords: Optional[List[str]] = None) -> bool:
         """
         Verificar si una acción es el pago de cuota inicial
         
         Args:
             action: Diccionario con datos de la acción
-            trigger_keywords: Lista de palabras clave que identifican el pago inicial
+            trigger_keywords: Palabras clave que identifican el pago inicial (opcional;
+                por defecto las del índice de títulos de acción)
             
         Returns:
-            True si es el pago inicial, False si no
+            True si el título contiene alguna palabra clave del pago inicial
         """
-        action_title = action.get('title', '').lower().strip()
+        if trigger_keywords is not None:
+            action_title = action.get('title', '').lower().strip()
+            return any(keyword.lower() in action_title for keyword in trigger_keywords)
         
-        return any(keyword.lower() in action_title for keyword in trigger_keywords)
+        return self.action_matcher.is_trigger(action.get('title', ''))
     
-    def get_action_description(self, action_title: str, descriptions_map: Dict) -> Dict:
+    def get_action_description(self, action_title: str, descriptions_map: Optional[Dict] = None) -> Dict:
         """
         Obtener descripción de una acción basada en su título
         
         Args:
             action_title: Título de la acción
-            descriptions_map: Mapeo de títulos a descripciones
+            descriptions_map: Mapeo de títulos a descripciones (opcional; por
+                defecto el del índice de títulos de acción)
             
         Returns:
             Diccionario con título, descripción y próximos pasos
         """
-        action_key = action_title.lower().strip()
-        
-        # Buscar coincidencia exacta o parcial
-        for key, info in descriptions_map.items():
-            if key in action_key or action_key in key:
-                return info
+        if descriptions_map is not None:
+            action_key = action_title.lower().strip()
+            info = next((info for key, info in descriptions_map.items()
+                         if key in action_key or action_key in key), None)
+        else:
+            info = self.action_matcher.description(action_title)
+        if info is not None:
+            return info
         
         # Descripción genérica si no se encuentra
         return {
@@ -138,6 +342,34 @@ class OpenSolarService:
             'next_steps': 'Nuestro equipo continuará trabajando en las siguientes etapas del proyecto.'
         }
     
+    def project_from_payload(self, project_data: Optional[Dict]) -> Optional[Dict]:
+        """
+        Obtener los datos del proyecto directamente del payload del webhook
+        
+        El webhook se suscribe a project.id, project.title, project.address y
+        project.contacts_data.*; si vienen completos no hace falta consultar la API.
+        
+        Args:
+            project_data: Datos del proyecto incluidos en el webhook
+            
+        Returns:
+            Diccionario con los datos del proyecto o None si faltan campos requeridos
+        """
+        if not project_data:
+            return None
+        
+        if any(project_data.get(field) in (None, '') for field in PAYLOAD_REQUIRED_FIELDS):
+            return None
+        
+        contacts_data = project_data.get('contacts_data')
+        if not isinstance(contacts_data, list) or not contacts_data or not isinstance(contacts_data[0], dict):
+            return None
+        
+        if not contacts_data[0].get('email'):
+            return None
+        
+        return project_data
+    
     def extract_client_data(self, project: Dict) -> Optional[Dict]:
         """
         Extraer datos del cliente principal del proyecto
@@ -197,7 +429,7 @@ class OpenSolarService:
         }
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+            response = self.session.post(url, headers=self.headers, json=payload, timeout=30)
             response.raise_for_status()
             webhook_data = response.json()
             logger.info(f"Webhook creado exitosamente: {webhook_data.get('id')}")
@@ -218,7 +450,7 @@ class OpenSolarService:
         url = f"{self.base_url}/orgs/{self.org_id}/webhooks/"
         
         try:
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self.session.get(url, headers=self.headers, timeout=30)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -251,7 +483,7 @@ class OpenSolarService:
             payload['payload_fields'] = payload_fields
         
         try:
-            response = requests.patch(url, headers=self.headers, json=payload, timeout=30)
+            response = self.session.patch(url, headers=self.headers, json=payload, timeout=30)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
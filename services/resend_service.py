@@ -4,7 +4,10 @@ Servicio para enviar correos usando Resend API
 import os
 import logging
 import requests
-from typing import Optional
+from typing import Dict, List, Optional
+
+from .http_session import PooledSession
+from .retry import parse_retry_after
 
 logger = logging.getLogger(__name__)
 
@@ -12,15 +15,20 @@ logger = logging.getLogger(__name__)
 class ResendService:
     """Servicio para enviar correos electrónicos usando Resend API"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, api_url: str = "https://api.resend.com/emails",
+                 session: Optional[PooledSession] = None):
         """
         Inicializa el servicio de Resend
         
         Args:
             api_key: API key de Resend
+            api_url: URL del endpoint de envío de Resend
+            session: Sesión HTTP con pool de conexiones (opcional)
         """
         self.api_key = api_key
-        self.api_url = "https://api.resend.com/emails"
+        self.api_url = api_url
+        self.batch_url = f"{api_url.rstrip('/')}/batch"
+        self.session = session or PooledSession()
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
@@ -46,6 +54,32 @@ class ResendService:
         Returns:
             bool: True si el envío fue exitoso, False en caso contrario
         """
+        return self.send_email_result(to_email, subject, html_content, from_email)["success"]
+    
+    def send_email_result(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        from_email: str = "onboarding@resend.dev",
+        idempotency_key: Optional[str] = None
+    ) -> Dict:
+        """
+        Envía un correo electrónico y retorna el detalle del resultado
+        
+        Args:
+            to_email: Email del destinatario
+            subject: Asunto del correo
+            html_content: Contenido HTML del correo
+            from_email: Email del remitente (por defecto usa el dominio de Resend)
+            idempotency_key: Cabecera Idempotency-Key (Resend no reenvía un email
+                con una clave ya usada en las últimas 24 horas)
+            
+        Returns:
+            Dict con 'success', 'id' (ID de Resend), 'status_code', 'error',
+            'retryable' (el fallo es transitorio) y 'retry_after' (segundos
+            indicados por Resend en la cabecera Retry-After, o None)
+        """
         try:
             logger.info(f"Enviando email a {to_email} con asunto: {subject}")
             
@@ -56,31 +90,112 @@ class ResendService:
                 "html": html_content
             }
             
-            response = requests.post(
+            headers = self.headers
+            if idempotency_key:
+                headers = dict(self.headers, **{"Idempotency-Key": idempotency_key})
+            
+            response = self.session.post(
                 self.api_url,
                 json=payload,
-                headers=self.headers,
+                headers=headers,
                 timeout=10
             )
             
             if response.status_code == 200:
-                logger.info(f"Email enviado exitosamente a {to_email}")
-                logger.info(f"Respuesta de Resend: {response.json()}")
-                return True
-            else:
-                logger.error(f"Error al enviar email: {response.status_code}")
-                logger.error(f"Respuesta: {response.text}")
-                return False
+                data = response.json()
+                logger.info(f"Email enviado exitosamente a {to_email} (id {data.get('id')})")
+                logger.debug(f"Respuesta de Resend: {data}")
+                return self._result(True, status_code=200, message_id=data.get("id"))
+            
+            logger.error(f"Error al enviar email: {response.status_code}")
+            logger.error(f"Respuesta: {response.text}")
+            return self._error_result(response)
                 
         except requests.exceptions.Timeout:
             logger.error(f"Timeout al enviar email a {to_email}")
-            return False
+            return self._result(False, error="Timeout", retryable=True)
         except requests.exceptions.RequestException as e:
             logger.error(f"Error de red al enviar email: {str(e)}")
-            return False
+            return self._result(False, error=str(e), retryable=True)
         except Exception as e:
             logger.error(f"Error inesperado al enviar email: {str(e)}")
-            return False
+            return self._result(False, error=str(e))
+    
+    @staticmethod
+    def _result(success: bool, status_code: Optional[int] = None, message_id: Optional[str] = None,
+                error: Optional[str] = None, retryable: bool = False,
+                retry_after: Optional[float] = None) -> Dict:
+        return {
+            "success": success,
+            "id": message_id,
+            "status_code": status_code,
+            "error": error,
+            "retryable": retryable,
+            "retry_after": retry_after
+        }
+    
+    def _error_result(self, response) -> Dict:
+        """Resultado de una respuesta de error (429 y 5xx son transitorios)"""
+        return self._result(
+            False,
+            status_code=response.status_code,
+            error=f"HTTP {response.status_code}: {response.text}",
+            retryable=response.status_code == 429 or response.status_code >= 500,
+            retry_after=parse_retry_after(response.headers.get("Retry-After"))
+        )
+    
+    def send_batch(self, messages: List[Dict]) -> List[Dict]:
+        """
+        Envía varios correos en una sola petición al endpoint batch de Resend
+        
+        Args:
+            messages: Lista de mensajes con to_email, subject, html_content y
+                from_email (opcional). Resend acepta hasta 100 por petición
+            
+        Returns:
+            Lista con un resultado por mensaje, en el mismo orden, con el mismo
+            formato que send_email_result
+        """
+        if not messages:
+            return []
+        
+        payload = [
+            {
+                "from": message.get("from_email", "onboarding@resend.dev"),
+                "to": [message["to_email"]],
+                "subject": message["subject"],
+                "html": message["html_content"]
+            }
+            for message in messages
+        ]
+        
+        try:
+            logger.info(f"Enviando lote de {len(messages)} emails")
+            
+            response = self.session.post(
+                self.batch_url,
+                json=payload,
+                headers=self.headers,
+                timeout=30
+            )
+            
+            if response.status_code == 200:
+                data = response.json().get("data", [])
+                logger.info(f"Lote de {len(messages)} emails enviado exitosamente")
+                return [
+                    self._result(True, status_code=200,
+                                 message_id=(data[i] or {}).get("id") if i < len(data) else None)
+                    for i in range(len(messages))
+                ]
+            
+            logger.error(f"Error al enviar lote de emails: HTTP {response.status_code}: {response.text}")
+            result = self._error_result(response)
+                
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error de red al enviar lote de emails: {str(e)}")
+            result = self._result(False, error=str(e), retryable=True)
+        
+        return [dict(result) for _ in messages]
     
     def send_email_with_retry(
         self,
@@ -91,32 +206,34 @@ class ResendService:
         max_retries: int = 3
     ) -> bool:
         """
-        Envía un correo con reintentos en caso de fallo
+        Envía un correo reintentando de inmediato los fallos de red
+        
+        No espera entre intentos: si Resend rechaza el envío (4xx), limita la
+        tasa (429) o indica Retry-After, se deja de reintentar para que el
+        llamador programe el reintento diferido (ver services.retry).
         
         Args:
             to_email: Email del destinatario
             subject: Asunto del correo
             html_content: Contenido HTML del correo
             from_email: Email del remitente
-            max_retries: Número máximo de reintentos
+            max_retries: Número máximo de intentos
             
         Returns:
             bool: True si el envío fue exitoso, False en caso contrario
         """
         for attempt in range(max_retries):
-            try:
-                logger.info(f"Intento {attempt + 1} de {max_retries} para enviar email a {to_email}")
+            logger.info(f"Intento {attempt + 1} de {max_retries} para enviar email a {to_email}")
+            
+            result = self.send_email_result(to_email, subject, html_content, from_email)
+            if result["success"]:
+                return True
+            
+            if result["status_code"] is not None or not result["retryable"]:
+                break
                 
-                if self.send_email(to_email, subject, html_content, from_email):
-                    return True
-                    
-                if attempt < max_retries - 1:
-                    logger.warning(f"Reintentando envío de email (intento {attempt + 2}/{max_retries})")
-                    
-            except Exception as e:
-                logger.error(f"Error en intento {attempt + 1}: {str(e)}")
-                if attempt < max_retries - 1:
-                    logger.warning(f"Reintentando...")
+            if attempt < max_retries - 1:
+                logger.warning(f"Reintentando envío de email (intento {attempt + 2}/{max_retries})")
         
-        logger.error(f"No se pudo enviar el email a {to_email} después de {max_retries} intentos")
+        logger.error(f"No se pudo enviar el email a {to_email} después de {attempt + 1} intentos")
         return False
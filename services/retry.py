@@ -0,0 +1,141 @@
+"""
+Reintentos diferidos con backoff exponencial y jitter
+
+Los reintentos no esperan en el hilo que detecta el fallo: se programan como
+trabajos en la cola persistente (tabla jobs, ordenada por run_at) y los
+ejecutan los workers cuando vence su retraso.
+"""
+
+import random
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt: int, base: float = 2, cap: float = 600) -> float:
+    """
+    Retraso antes del siguiente intento (backoff exponencial con jitter completo)
+
+    Args:
+        attempt: Número de intentos fallidos hasta ahora (1 para el primero)
+        base: Retraso base en segundos
+        cap: Retraso máximo en segundos
+
+    Returns:
+        Segundos de espera, aleatorios entre 0 y min(cap, base * 2^(attempt-1))
+    """
+    ceiling = min(cap, base * (2 ** max(attempt - 1, 0)))
+    return random.uniform(0, ceiling)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Interpretar la cabecera HTTP Retry-After
+
+    Args:
+        value: Segundos ('120') o fecha HTTP ('Wed, 21 Oct 2015 07:28:00 GMT')
+
+    Returns:
+        Segundos de espera o None si la cabecera no existe o no es válida
+    """
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RetryScheduler:
+    """Programa reintentos como trabajos diferidos en la cola persistente"""
+
+    def __init__(self, job_queue, base_delay: float = 2, max_delay: float = 600,
+                 max_attempts: int = 3):
+        """
+        Inicializar programador de reintentos
+
+        Args:
+            job_queue: Cola de trabajos (JobQueue)
+            base_delay: Retraso base en segundos para el backoff
+            max_delay: Retraso máximo en segundos (también limita Retry-After)
+            max_attempts: Intentos máximos del trabajo de reintento
+        """
+        self.job_queue = job_queue
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+    def delay_for(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Retraso del siguiente intento: Retry-After del servidor si lo indicó,
+        o backoff exponencial con jitter
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return backoff_delay(attempt, self.base_delay, self.max_delay)
+
+    def schedule(self, job_type: str, payload: Dict, attempt: int = 1,
+                 retry_after: Optional[float] = None) -> int:
+        """
+        Programar un reintento
+
+        Args:
+            job_type: Tipo de trabajo que ejecutará el reintento
+            payload: Datos del trabajo
+            attempt: Intentos fallidos hasta ahora
+            retry_after: Segundos indicados por el servidor (Retry-After), si los hay
+
+        Returns:
+            ID del trabajo creado
+        """
+        delay = self.delay_for(attempt, retry_after)
+        job_id = self.job_queue.enqueue(job_type, payload, delay=delay, max_attempts=self.max_attempts)
+        logger.info(f"Reintento '{job_type}' programado en {delay:.1f} segundos (trabajo {job_id})")
+        return job_id
+
+    def reserve(self, job_type: str, payload: Dict, delay: float) -> int:
+        """
+        Programar de antemano el reintento de una operación que está por ejecutarse
+
+        Si el proceso muere durante la operación, el trabajo la retoma cuando
+        vence el retraso; si la operación termina, se cancela (cancel) o se
+        reprograma (reschedule).
+
+        Args:
+            job_type: Tipo de trabajo que ejecutará el reintento
+            payload: Datos del trabajo
+            delay: Segundos de espera (mayor que la duración máxima de la operación)
+
+        Returns:
+            ID del trabajo creado
+        """
+        return self.job_queue.enqueue(job_type, payload, delay=delay, max_attempts=self.max_attempts)
+
+    def reschedule(self, job_id: int, error_message: str, attempt: int = 1,
+                   retry_after: Optional[float] = None) -> float:
+        """
+        Adelantar o posponer un reintento reservado después de un fallo transitorio
+
+        Returns:
+            Segundos hasta el reintento
+        """
+        delay = self.delay_for(attempt, retry_after)
+        self.job_queue.fail(job_id, error_message, delay)
+        logger.info(f"Reintento programado en {delay:.1f} segundos (trabajo {job_id})")
+        return delay
+
+    def cancel(self, job_id: int):
+        """Cancelar un reintento reservado que ya no hace falta"""
+        self.job_queue.complete(job_id)
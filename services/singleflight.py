@@ -0,0 +1,82 @@
+"""
+Coalescencia de llamadas concurrentes (single-flight)
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    """Llamada en curso compartida por los hilos que piden la misma clave"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Garantiza que solo haya una ejecución en curso por clave dentro del proceso
+
+    Los hilos que piden una clave mientras ya hay una ejecución en curso esperan
+    a que termine y reciben el mismo resultado (o la misma excepción).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Ejecutar fn para la clave, o esperar el resultado de la ejecución en curso
+
+        Args:
+            key: Clave que identifica la operación (por ejemplo el ID del proyecto)
+            fn: Función a ejecutar si no hay otra en curso para la clave
+
+        Returns:
+            El resultado de fn
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result
+
+    def stats(self) -> Dict[str, int]:
+        """Estadísticas de coalescencia"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "shared": self.shared,
+                "in_flight": len(self._calls)
+            }
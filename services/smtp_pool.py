@@ -0,0 +1,217 @@
+"""
+Pool de sesiones SMTP autenticadas y reutilizables
+"""
+
+import os
+import time
+import smtplib
+import logging
+import threading
+from contextlib import contextmanager
+from email.message import Message
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledConnection:
+    """Sesión SMTP autenticada con sus datos de uso"""
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """
+    Pool de conexiones SMTP (EHLO + STARTTLS + LOGIN una sola vez por conexión)
+
+    Las conexiones se devuelven al pool después de cada envío. Antes de reutilizar
+    una conexión que estuvo inactiva se comprueba con NOOP; si el servidor la
+    cerró (SMTPServerDisconnected) se abre una nueva y se reintenta el envío una vez.
+    Cada conexión se cierra después de max_messages_per_connection mensajes.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 max_size: int = 2, max_messages_per_connection: int = 100,
+                 max_idle: float = 240, health_check_interval: float = 30,
+                 timeout: float = 10):
+        """
+        Inicializar pool SMTP
+
+        Args:
+            host: Servidor SMTP
+            port: Puerto SMTP (STARTTLS)
+            username: Usuario para LOGIN
+            password: Contraseña (de aplicación) para LOGIN
+            max_size: Conexiones simultáneas máximas
+            max_messages_per_connection: Mensajes enviados antes de renovar la conexión
+            max_idle: Segundos de inactividad tras los que se descarta una conexión
+            health_check_interval: Segundos de inactividad a partir de los que se
+                comprueba la conexión con NOOP antes de usarla
+            timeout: Timeout de red en segundos
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_size = max_size
+        self.max_messages_per_connection = max_messages_per_connection
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._reset()
+        self.opened = 0
+        self.reused = 0
+        self.reconnects = 0
+        self.messages_sent = 0
+
+    def _reset(self):
+        """Estado por proceso (no se comparten sockets después de un fork)"""
+        self._idle: List[_PooledConnection] = []
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _open(self) -> _PooledConnection:
+        """Abrir y autenticar una conexión nueva"""
+        logger.info(f"Abriendo conexión SMTP a {self.host}:{self.port}")
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            smtp.starttls()
+            smtp.ehlo()
+            smtp.login(self.username, self.password)
+        except Exception:
+            self._quit(smtp)
+            raise
+
+        with self._lock:
+            self.opened += 1
+        return _PooledConnection(smtp)
+
+    @staticmethod
+    def _quit(smtp: smtplib.SMTP):
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _is_healthy(self, conn: _PooledConnection) -> bool:
+        """Comprobar con NOOP una conexión que estuvo inactiva"""
+        idle = time.monotonic() - conn.last_used
+        if idle > self.max_idle:
+            return False
+        if idle < self.health_check_interval:
+            return True
+
+        try:
+            code, _ = conn.smtp.noop()
+            return code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _acquire(self) -> _PooledConnection:
+        """Tomar una conexión sana del pool o abrir una nueva"""
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+
+            if conn is None:
+                return self._open()
+
+            if self._is_healthy(conn):
+                with self._lock:
+                    self.reused += 1
+                return conn
+
+            logger.info("Conexión SMTP inactiva o cerrada por el servidor, se descarta")
+            self._quit(conn.smtp)
+
+    def _release(self, conn: _PooledConnection, broken: bool = False):
+        """Devolver una conexión al pool (o cerrarla si está rota o llegó al límite)"""
+        if broken or conn.messages_sent >= self.max_messages_per_connection:
+            self._quit(conn.smtp)
+            return
+
+        conn.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Conexión autenticada del pool
+
+        Espera si ya hay max_size conexiones en uso. Si el bloque lanza una
+        excepción la conexión se descarta.
+        """
+        self._check_pid()
+        slots = self._slots
+        if not slots.acquire(timeout=self.timeout):
+            raise smtplib.SMTPException("No hay conexiones SMTP disponibles en el pool")
+
+        try:
+            conn = self._acquire()
+            try:
+                yield conn
+            except Exception:
+                self._release(conn, broken=True)
+                raise
+            else:
+                self._release(conn)
+        finally:
+            slots.release()
+
+    def send_message(self, msg: Message) -> Dict:
+        """
+        Enviar un mensaje con una conexión del pool
+
+        Si el servidor cerró la conexión se reintenta una vez con una conexión nueva.
+
+        Returns:
+            Dict con los destinatarios rechazados (vacío si todos fueron aceptados)
+        """
+        for attempt in range(2):
+            try:
+                with self.connection() as conn:
+                    refused = conn.smtp.send_message(msg)
+                    conn.messages_sent += 1
+                with self._lock:
+                    self.messages_sent += 1
+                return refused
+            except smtplib.SMTPServerDisconnected:
+                if attempt:
+                    raise
+                with self._lock:
+                    self.reconnects += 1
+                logger.warning("Conexión SMTP cerrada por el servidor, reconectando")
+
+    def close(self):
+        """Cerrar las conexiones inactivas del pool"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        if self._pid == os.getpid():
+            for conn in idle:
+                self._quit(conn.smtp)
+
+    def stats(self) -> Dict[str, int]:
+        """Estadísticas del pool"""
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "opened": self.opened,
+                "reused": self.reused,
+                "reconnects": self.reconnects,
+                "messages": self.messages_sent
+            }
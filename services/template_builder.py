@@ -0,0 +1,408 @@
+"""
+Construcción de los templates de email: herencia aplanada, CSS en línea y HTML minificado
+
+El trabajo se hace una sola vez, al cargar cada template (TemplateBuildLoader),
+sobre el código fuente Jinja2. Cada email solo rellena las variables del
+template ya construido.
+"""
+
+import re
+import threading
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Tuple
+
+from jinja2 import BaseLoader, FileSystemLoader
+
+# --- Herencia de templates -------------------------------------------------
+
+EXTENDS_RE = re.compile(r'^\s*{%-?\s*extends\s+["\']([^"\']+)["\']\s*-?%}', re.S)
+BLOCK_RE = re.compile(
+    r'{%-?\s*block\s+(\w+)\s*-?%}(.*?){%-?\s*endblock(?:\s+\w+)?\s*-?%}', re.S
+)
+
+
+def flatten_template(source: str, load_source: Callable[[str], str]) -> Optional[str]:
+    """
+    Sustituir {% extends %} por el template padre con los bloques del hijo
+
+    Args:
+        source: Código fuente del template
+        load_source: Función que retorna el código fuente de otro template por nombre
+
+    Returns:
+        El template completo, o None si usa construcciones que no se aplanan
+        (bloques anidados o super())
+    """
+    match = EXTENDS_RE.match(source)
+    if not match:
+        return source
+
+    if 'super()' in source:
+        return None
+
+    child_blocks = {}
+    for block in BLOCK_RE.finditer(source):
+        if '{% block' in block.group(2) or '{%- block' in block.group(2):
+            return None
+        child_blocks[block.group(1)] = block.group(2)
+
+    parent = flatten_template(load_source(match.group(1)), load_source)
+    if parent is None:
+        return None
+
+    if any('{% block' in block.group(2) for block in BLOCK_RE.finditer(parent)):
+        return None
+
+    return BLOCK_RE.sub(lambda block: child_blocks.get(block.group(1), block.group(2)), parent)
+
+
+# --- CSS -------------------------------------------------------------------
+
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+}
+
+# Selectores soportados: compuestos (tag, .clase, #id) separados por espacios (descendiente)
+COMPOUND_RE = re.compile(r'^(\*|[a-zA-Z][\w-]*)?((?:[.#][\w-]+)*)$')
+STYLE_ATTR_RE = re.compile(r'\sstyle\s*=\s*("[^"]*"|\'[^\']*\')', re.I)
+
+
+def _parse_compound(text: str) -> Optional[Dict]:
+    match = COMPOUND_RE.match(text)
+    if not match or not text:
+        return None
+    parts = re.findall(r'[.#][\w-]+', match.group(2))
+    return {
+        'tag': (match.group(1) or '*').lower(),
+        'classes': {p[1:] for p in parts if p[0] == '.'},
+        'ids': {p[1:] for p in parts if p[0] == '#'}
+    }
+
+
+def parse_selector(selector: str) -> Optional[Tuple[List[Dict], Tuple[int, int, int]]]:
+    """
+    Interpretar un selector de descendientes
+
+    Returns:
+        (compuestos, especificidad) o None si el selector no se puede aplicar en línea
+        (pseudo-clases, atributos, combinadores > + ~, etc.)
+    """
+    compounds = []
+    for text in selector.split():
+        compound = _parse_compound(text)
+        if compound is None:
+            return None
+        compounds.append(compound)
+
+    if not compounds:
+        return None
+
+    specificity = (
+        sum(len(c['ids']) for c in compounds),
+        sum(len(c['classes']) for c in compounds),
+        sum(1 for c in compounds if c['tag'] != '*')
+    )
+    return compounds, specificity
+
+
+def parse_declarations(text: str) -> List[Tuple[str, str, bool]]:
+    """Interpretar 'prop: valor; ...' como lista de (propiedad, valor, important)"""
+    declarations = []
+    for item in text.split(';'):
+        if ':' not in item:
+            continue
+        prop, value = item.split(':', 1)
+        prop, value = prop.strip().lower(), ' '.join(value.split())
+        important = value.lower().endswith('!important')
+        if important:
+            value = value[:-len('!important')].strip()
+        if prop and value:
+            declarations.append((prop, value, important))
+    return declarations
+
+
+def parse_stylesheet(css: str) -> Tuple[List[Dict], List[str]]:
+    """
+    Separar una hoja de estilos en reglas aplicables en línea y CSS residual
+
+    Returns:
+        (reglas, residual): reglas con 'compounds', 'specificity', 'order' y
+        'declarations'; residual con el CSS que debe quedarse en <style>
+        (@media, pseudo-clases, etc.)
+    """
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    rules, residual = [], []
+    position, order = 0, 0
+
+    while position < len(css):
+        brace = css.find('{', position)
+        if brace == -1:
+            break
+        prelude = css[position:brace].strip()
+
+        # Buscar la llave de cierre correspondiente (las reglas @ pueden anidar llaves)
+        depth, end = 1, brace + 1
+        while end < len(css) and depth:
+            depth += {'{': 1, '}': -1}.get(css[end], 0)
+            end += 1
+        body = css[brace + 1:end - 1]
+        position = end
+
+        if prelude.startswith('@'):
+            residual.append(f"{prelude}{{{body}}}")
+            continue
+
+        declarations = parse_declarations(body)
+        unsupported = []
+        for selector in prelude.split(','):
+            parsed = parse_selector(selector.strip())
+            if parsed is None:
+                unsupported.append(selector.strip())
+                continue
+            compounds, specificity = parsed
+            rules.append({
+                'compounds': compounds,
+                'specificity': specificity,
+                'order': order,
+                'declarations': declarations
+            })
+            order += 1
+
+        if unsupported:
+            residual.append(f"{','.join(unsupported)}{{{body}}}")
+
+    return rules, residual
+
+
+def _matches(compound: Dict, element: Dict) -> bool:
+    return (
+        (compound['tag'] == '*' or compound['tag'] == element['tag'])
+        and compound['classes'] <= element['classes']
+        and compound['ids'] <= element['ids']
+    )
+
+
+def _selector_matches(compounds: List[Dict], stack: List[Dict]) -> bool:
+    """El último compuesto aplica al elemento actual y los anteriores a algún ancestro, en orden"""
+    if not _matches(compounds[-1], stack[-1]):
+        return False
+
+    ancestor = len(stack) - 2
+    for compound in reversed(compounds[:-1]):
+        while ancestor >= 0 and not _matches(compound, stack[ancestor]):
+            ancestor -= 1
+        if ancestor < 0:
+            return False
+        ancestor -= 1
+    return True
+
+
+def minify_css(css: str) -> str:
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = ' '.join(css.split())
+    return re.sub(r'\s*([{};:,])\s*', r'\1', css).replace(';}', '}')
+
+
+class _InlineParser(HTMLParser):
+    """Recorre el HTML y calcula los cambios (posiciones en el código fuente) para aplicar los estilos"""
+
+    def __init__(self, source: str, rules: List[Dict]):
+        super().__init__(convert_charrefs=False)
+        self.source = source
+        self.rules = rules
+        self.stack: List[Dict] = []
+        self.edits: List[Tuple[int, int, str]] = []
+        self.style_blocks: List[Tuple[int, int]] = []
+        self._style_start = None
+        self._line_offsets = [0]
+        for line in source.splitlines(keepends=True):
+            self._line_offsets.append(self._line_offsets[-1] + len(line))
+
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self._line_offsets[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        start = self._offset()
+        text = self.get_starttag_text()
+        attributes = dict(attrs)
+        element = {
+            'tag': tag,
+            'classes': set((attributes.get('class') or '').split()),
+            'ids': {attributes['id']} if attributes.get('id') else set()
+        }
+
+        if tag == 'style':
+            self._style_start = start
+
+        self.stack.append(element)
+        style = self._compute_style(attributes.get('style'))
+        if style:
+            self.edits.append((start, start + len(text), self._with_style(text, style)))
+
+        if tag in VOID_ELEMENTS or text.endswith('/>'):
+            self.stack.pop()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'style' and self._style_start is not None:
+            end = self.source.find('>', self._offset()) + 1
+            self.style_blocks.append((self._style_start, end))
+            self._style_start = None
+
+        # Cerrar hasta el elemento correspondiente (tolera etiquetas sin cerrar)
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index]['tag'] == tag:
+                del self.stack[index:]
+                break
+
+    def _compute_style(self, inline_style: Optional[str]) -> str:
+        """Declaraciones finales del elemento según la cascada (important, especificidad, orden)"""
+        matched = []
+        for rule in self.rules:
+            if _selector_matches(rule['compounds'], self.stack):
+                for prop, value, important in rule['declarations']:
+                    matched.append(((important, rule['specificity'], rule['order']), prop, value, important))
+
+        if not matched:
+            return ''
+
+        # El atributo style original gana a las reglas de la hoja (salvo !important)
+        for prop, value, important in parse_declarations(inline_style or ''):
+            matched.append(((important, (1, 0, 0, 0), 0), prop, value, important))
+
+        final: Dict[str, str] = {}
+        for _, prop, value, important in sorted(matched, key=lambda item: item[0]):
+            final.pop(prop, None)
+            final[prop] = f"{value} !important" if important else value
+
+        return ';'.join(f"{prop}:{value}" for prop, value in final.items()).replace('"', "'")
+
+    @staticmethod
+    def _with_style(tag_text: str, style: str) -> str:
+        attribute = f' style="{style}"'
+        if STYLE_ATTR_RE.search(tag_text):
+            return STYLE_ATTR_RE.sub(lambda _: attribute, tag_text, count=1)
+        closing = 2 if tag_text.endswith('/>') else 1
+        return tag_text[:-closing].rstrip() + attribute + tag_text[-closing:]
+
+
+def inline_css(source: str) -> str:
+    """
+    Aplicar en línea (atributo style) las reglas de los bloques <style>
+
+    Las reglas que no se pueden aplicar en línea se conservan en el primer
+    bloque <style>; si no queda ninguna, los bloques se eliminan.
+    """
+    blocks = re.findall(r'<style[^>]*>(.*?)</style>', source, flags=re.S | re.I)
+    if not blocks:
+        return source
+
+    rules, residual = parse_stylesheet('\n'.join(blocks))
+    parser = _InlineParser(source, rules)
+    parser.feed(source)
+    parser.close()
+
+    edits = list(parser.edits)
+    for index, (start, end) in enumerate(parser.style_blocks):
+        replacement = f"<style>{minify_css(''.join(residual))}</style>" if residual and index == 0 else ''
+        edits = [edit for edit in edits if not (start <= edit[0] < end)]
+        edits.append((start, end, replacement))
+
+    for start, end, replacement in sorted(edits, key=lambda edit: edit[0], reverse=True):
+        source = source[:start] + replacement + source[end:]
+    return source
+
+
+# --- Minificación ------------------------------------------------------------
+
+BLOCK_TAGS = (
+    'html|head|body|title|meta|link|style|div|p|h[1-6]|table|thead|tbody|tr|td|th|'
+    'ul|ol|li|br|hr|img|center'
+)
+PRESERVE_RE = re.compile(r'(<(pre|textarea)\b.*?</\2>)', re.S | re.I)
+
+
+def minify_html(source: str) -> str:
+    """
+    Minificar HTML: sin comentarios, espacios colapsados y sin espacios
+    alrededor de las etiquetas de bloque (se conserva el contenido de <pre> y <textarea>)
+    """
+    preserved = []
+
+    def keep(match):
+        preserved.append(match.group(1))
+        return f"\x00{len(preserved) - 1}\x00"
+
+    source = PRESERVE_RE.sub(keep, source)
+    source = re.sub(r'<!--(?!\[if).*?-->', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(rf'\s*(</?(?:{BLOCK_TAGS})\b[^>]*>)\s*', r'\1', source, flags=re.I)
+    source = re.sub(r'\x00(\d+)\x00', lambda m: preserved[int(m.group(1))], source)
+    return source.strip()
+
+
+def build_email_template(source: str, load_source: Callable[[str], str], minify: bool = True) -> str:
+    """
+    Construir un template de email: herencia aplanada, CSS en línea y HTML minificado
+
+    Si el template usa construcciones que no se pueden aplanar se retorna sin cambios.
+    """
+    flattened = flatten_template(source, load_source)
+    if flattened is None:
+        return source
+
+    built = inline_css(flattened)
+    return minify_html(built) if minify else built
+
+
+class TemplateBuildLoader(BaseLoader):
+    """
+    Loader de Jinja2 que entrega los templates HTML ya construidos
+
+    El resultado se guarda en memoria y se reconstruye solo si cambia alguno
+    de los archivos de los que depende (el template y sus padres).
+    """
+
+    def __init__(self, searchpath: str, minify: bool = True):
+        """
+        Args:
+            searchpath: Directorio de los templates
+            minify: Minificar el HTML construido
+        """
+        self.loader = FileSystemLoader(searchpath)
+        self.minify = minify
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[str, Optional[str], List[Callable[[], bool]]]] = {}
+        self.builds = 0
+
+    def get_source(self, environment, template):
+        with self._lock:
+            cached = self._cache.get(template)
+        if cached and all(uptodate() for uptodate in cached[2]):
+            source, filename, dependencies = cached
+            return source, filename, lambda: all(uptodate() for uptodate in dependencies)
+
+        source, filename, uptodate = self.loader.get_source(environment, template)
+        if not template.endswith(('.html', '.htm')):
+            return source, filename, uptodate
+
+        dependencies = [uptodate]
+
+        def load_source(name: str) -> str:
+            parent_source, _, parent_uptodate = self.loader.get_source(environment, name)
+            dependencies.append(parent_uptodate)
+            return parent_source
+
+        built = build_email_template(source, load_source, self.minify)
+        with self._lock:
+            self._cache[template] = (built, filename, dependencies)
+            self.builds += 1
+
+        return built, filename, lambda: all(uptodate() for uptodate in dependencies)
+
+    def list_templates(self):
+        return self.loader.list_templates()
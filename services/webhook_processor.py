@@ -0,0 +1,613 @@
+"""
+Procesamiento de webhooks de OpenSolar
+
+Separa la validación rápida del payload (que se hace en el hilo de la petición)
+del procesamiento completo (consulta a OpenSolar, renderizado y envío del email),
+que puede ejecutarse en segundo plano desde la cola de trabajos.
+"""
+
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from .metrics import MetricsRegistry, PROCESSED_TOTAL, PROCESSING_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Email de administración al que se envían las notificaciones
+ADMIN_EMAIL = "admin@greenhproject.com"
+
+
+class WebhookProcessor:
+    """Procesador de webhooks de OpenSolar"""
+
+    def __init__(self, opensolar_service, notification_service, mailer,
+                 notification_model, config, batch_dispatcher=None, retry_scheduler=None,
+                 job_queue=None, metrics: Optional[MetricsRegistry] = None):
+        """
+        Inicializar procesador de webhooks
+
+        Args:
+            opensolar_service: Servicio de OpenSolar
+            notification_service: Servicio de generación de emails
+            mailer: Envío de emails (MailRouter o un transporte de services.mail_transport)
+            notification_model: Modelo de notificaciones (o None si no hay base de datos)
+            config: Configuración de la aplicación
+            batch_dispatcher: Despachador de lotes de Resend (opcional, requiere base de datos)
+            retry_scheduler: Programador de reintentos diferidos de envío (opcional,
+                requiere base de datos)
+            job_queue: Cola de trabajos atendida por workers (opcional); con
+                config.NOTIFICATION_DIGEST_WINDOW > 0 las actualizaciones de progreso
+                de un proyecto se agrupan en un email de resumen
+            metrics: Registro de métricas por etapa (por defecto uno propio del procesador)
+        """
+        self.opensolar_service = opensolar_service
+        self.notification_service = notification_service
+        self.mailer = mailer
+        self.notification_model = notification_model
+        self.config = config
+        self.batch_dispatcher = batch_dispatcher if notification_model else None
+        self.retry_scheduler = retry_scheduler if notification_model else None
+        self.digest_window = config.NOTIFICATION_DIGEST_WINDOW
+        self.digest_queue = job_queue if notification_model and self.digest_window > 0 else None
+        self.metrics = metrics or MetricsRegistry()
+        self._stats_lock = threading.Lock()
+        # Cuántos eventos usaron el payload del webhook y cuántos consultaron la API
+        self.project_source_counts = {"payload": 0, "api": 0}
+        # Actualizaciones retenidas para un resumen y resúmenes enviados
+        self.digest_counts = {"buffered": 0, "digests": 0, "deferred": 0}
+
+    def validate(self, webhook_data: Optional[Dict]) -> Dict:
+        """
+        Validar un webhook sin tocar servicios externos
+
+        Args:
+            webhook_data: Payload JSON recibido
+
+        Returns:
+            Dict con 'status' ('accepted', 'ignored' o 'error'), 'http_status'
+            y, según el caso, 'project_id', 'reason' o 'error'
+        """
+        if not webhook_data:
+            logger.error("Webhook: No se recibieron datos JSON")
+            return {"status": "error", "error": "No JSON data received", "http_status": 400}
+
+        model = webhook_data.get("model")
+        event = webhook_data.get("event")
+
+        # Solo se procesan eventos de tipo "Event" con acción "CREATE"
+        # (cuando se marca una acción como completada)
+        if model != "Event" or event != "CREATE":
+            # Los webhooks de proyecto no generan emails, pero sí invalidan la caché
+            if model in ("Project", "project"):
+                project_fields = webhook_data.get("fields") or {}
+                if project_fields.get("id"):
+                    self.opensolar_service.invalidate_project(project_fields["id"], project_fields)
+            logger.info(f"Webhook ignorado: model={model}, event={event}")
+            return {
+                "status": "ignored",
+                "reason": f"Not a relevant webhook (model={model}, event={event})",
+                "http_status": 200
+            }
+
+        # Los datos del evento están en "fields"
+        event_data = webhook_data.get("fields", {})
+        if not event_data:
+            logger.error("Webhook: No hay datos de evento en el payload (fields)")
+            return {"status": "error", "error": "No event data in payload", "http_status": 400}
+
+        # Verificar que el evento esté completado
+        if not event_data.get("is_complete", False):
+            logger.info("Webhook ignorado: Evento no está completado")
+            return {"status": "ignored", "reason": "Event not complete", "http_status": 200}
+
+        project_id = (event_data.get("project_data") or {}).get("id")
+        if not project_id:
+            logger.error("Webhook: No se encontró ID de proyecto en el evento")
+            return {"status": "error", "error": "No project ID in event", "http_status": 400}
+
+        return {"status": "accepted", "project_id": project_id, "http_status": 202}
+
+    def process(self, webhook_data: Dict, in_request: bool = False) -> Dict:
+        """
+        Procesar completamente un webhook: obtener el proyecto, generar y enviar el email
+
+        Args:
+            webhook_data: Payload JSON recibido
+            in_request: True si se procesa en el hilo de la petición HTTP (no se
+                espera a que otro proceso termine de consultar el proyecto)
+
+        Returns:
+            Dict con 'status', 'http_status' y 'retry' (True si el fallo es
+            transitorio y conviene reintentar el trabajo)
+        """
+        with self.metrics.timer(PROCESSING_SECONDS):
+            result = self._process(webhook_data, in_request)
+        self.metrics.inc(PROCESSED_TOTAL, status=result["status"])
+        return result
+
+    def _process(self, webhook_data: Dict, in_request: bool = False) -> Dict:
+        validation = self.validate(webhook_data)
+        if validation["status"] != "accepted":
+            validation["retry"] = False
+            return validation
+
+        event_data = webhook_data["fields"]
+        project_id = validation["project_id"]
+        logger.info(f"Procesando evento completado para proyecto ID: {project_id}")
+
+        action_info = self._action_info(event_data)
+        action_id = action_info["action"]["id"]
+
+        # Estado previo del proyecto: si la acción ya se notificó y si es la primera notificación
+        if self.notification_model:
+            with self.metrics.stage("db_read"):
+                notification_state = self.notification_model.get_notification_state(project_id, action_id)
+        else:
+            notification_state = {"already_notified": False, "is_first_notification": True}
+
+        # Evitar notificaciones duplicadas (OpenSolar reintenta y los trabajos pueden re-ejecutarse)
+        if notification_state["already_notified"]:
+            logger.info(f"Proyecto {project_id}, Acción {action_id}: Ya notificada, omitiendo")
+            return {"status": "ignored", "reason": "Already notified", "http_status": 200, "retry": False}
+
+        with self.metrics.stage("get_project"):
+            project_full_data, error = self._load_project(project_id, event_data, wait_for_lease=not in_request)
+        if error:
+            return error
+
+        # Extraer datos del cliente
+        with self.metrics.stage("extract_client_data"):
+            client_data = self.opensolar_service.extract_client_data(project_full_data)
+        if not client_data or not client_data.get("email"):
+            logger.error(f"Proyecto {project_id}: No se encontraron datos de contacto o email del cliente")
+            return {"status": "error", "error": "Client contact data or email is missing",
+                    "http_status": 400, "retry": False}
+
+        is_first_notification_for_project = notification_state["is_first_notification"]
+
+        # Determinar si es la acción que dispara la primera notificación
+        is_trigger_action = self.opensolar_service.is_initial_payment_action(action_info["action"])
+
+        email_type = "progress_update"
+
+        with self.metrics.stage("render"):
+            if is_first_notification_for_project and is_trigger_action:
+                logger.info(f"Proyecto {project_id}: Generando primera notificación")
+                email_content = self.notification_service.generate_first_notification_email(
+                    client_data, project_full_data, action_info
+                )
+                email_type = "first_notification"
+            else:
+                logger.info(f"Proyecto {project_id}: Generando notificación de progreso")
+                email_content = self.notification_service.generate_progress_update_email(
+                    client_data, project_full_data, action_info
+                )
+
+        client_email = client_data["email"]
+
+        try:
+            logger.info(f"Preparando envío de email HTML a {client_email}")
+            logger.info(f"Asunto: {email_content['subject']}")
+            logger.info(f"HTML content length: {len(email_content['html'])} caracteres")
+
+            # Guardar el HTML en un archivo temporal para referencia
+            temp_dir = "/tmp/emails_to_send"
+            os.makedirs(temp_dir, exist_ok=True)
+
+            email_filename = f"{temp_dir}/email_{project_id}_{action_id}.html"
+            with open(email_filename, 'w', encoding='utf-8') as f:
+                f.write(email_content['html'])
+
+            logger.info(f"Email HTML guardado en: {email_filename}")
+
+            # NOTA: Por ahora enviamos a admin@greenhproject.com porque el dominio no está verificado en Resend
+            admin_subject = self._admin_subject(client_data['full_name'], email_content['subject'])
+
+            notification_fields = {
+                "project_id": project_id,
+                "project_identifier": project_full_data.get("identifier"),
+                "project_title": project_full_data.get("title"),
+                "action_id": action_id,
+                "action_title": action_info["action"]["title"],
+                "recipient_email": client_email,
+                "recipient_name": client_data.get("full_name"),
+                "email_type": email_type,
+                "email_subject": email_content["subject"],
+                "email_body": email_content["html"],
+                "webhook_data": webhook_data
+            }
+
+            # Actualización de progreso de un proyecto ya notificado: retener para el resumen
+            if self.digest_queue and email_type == "progress_update" and not is_first_notification_for_project:
+                return self._buffer(notification_fields)
+
+            if self.batch_dispatcher:
+                # Registrar como 'queued' junto con su trabajo de lote; el despachador
+                # actualiza el estado al enviar el lote
+                with self.metrics.stage("db_write"), self.notification_model.db.connection():
+                    notification_id = self.notification_model.create(**notification_fields, status="queued")
+                    job_id = self.batch_dispatcher.submit(notification_id, ADMIN_EMAIL, admin_subject)
+                    self.notification_model.set_delivery_job(notification_id, job_id)
+                logger.info(f"Proyecto {project_id}, Acción {action_id}: Notificación {notification_id} en cola de envío por lotes")
+                return {"status": "queued", "email_sent": False, "notification_id": notification_id,
+                        "http_status": 202, "retry": False}
+
+            # Registrar la notificación como 'sending' antes de enviar: si el envío se
+            # completa pero falla la escritura del resultado, el reintento del trabajo
+            # la encuentra ya notificada y no reenvía el email. Si el proceso muere
+            # antes de registrar el resultado, el trabajo de recuperación la envía
+            notification_id = recovery_job_id = None
+            if self.notification_model:
+                with self.metrics.stage("db_write"):
+                    notification_id, recovery_job_id = self._record_sending(notification_fields, admin_subject)
+        except Exception as e:
+            logger.error(f"Error al procesar notificación: {str(e)}")
+            return {"status": "error", "error": str(e), "http_status": 500, "retry": True}
+
+        try:
+            with self.metrics.stage("send"):
+                result = self.mailer.send(
+                    to_email=ADMIN_EMAIL,
+                    subject=admin_subject,
+                    html_content=email_content['html'],
+                    plain_content=email_content.get('text'),
+                    idempotency_key=self._idempotency_key(notification_id, email_content['html'])
+                )
+        except Exception as e:
+            logger.error(f"Error al enviar notificación: {str(e)}")
+            result = {"success": False, "id": None, "error": str(e), "retryable": True, "retry_after": None}
+
+        success = result["success"]
+
+        if not success and result["retryable"] and recovery_job_id is not None:
+            # Reintento diferido: la notificación queda 'queued' hasta enviarse o agotar los intentos
+            with self.metrics.stage("db_write"), self.notification_model.db.connection():
+                self.notification_model.update_status(notification_id, "queued", result["error"])
+                self.retry_scheduler.reschedule(recovery_job_id, result["error"],
+                                                retry_after=result["retry_after"])
+            logger.warning(f"Proyecto {project_id}, Acción {action_id}: Envío fallido ({result['error']}), "
+                           f"reintento programado para la notificación {notification_id}")
+            return {"status": "queued", "email_sent": False, "notification_id": notification_id,
+                    "http_status": 202, "retry": False}
+
+        # Registrar el resultado del envío (si hay base de datos) y cancelar la recuperación
+        if notification_id is not None:
+            with self.metrics.stage("db_write"), self.notification_model.db.connection():
+                self.notification_model.update_status(
+                    notification_id,
+                    "sent" if success else "failed",
+                    error_message=None if success else result["error"],
+                    provider_message_id=result["id"]
+                )
+                if recovery_job_id is not None:
+                    self.retry_scheduler.cancel(recovery_job_id)
+
+        if success:
+            logger.info(f"Proyecto {project_id}, Acción {action_id}: Notificación enviada a {client_email}")
+            return {"status": "success", "email_sent": True, "http_status": 200, "retry": False}
+
+        logger.error(f"Proyecto {project_id}, Acción {action_id}: Fallo al enviar notificación a {client_email}")
+        return {"status": "error", "error": "Failed to send email", "http_status": 500,
+                "retry": result["retryable"], "retry_after": result["retry_after"]}
+
+    def deliver(self, payload: Dict) -> Dict:
+        """
+        Reintentar el envío de una notificación registrada (trabajo 'send_email')
+
+        Args:
+            payload: Dict con 'notification_id', 'to_email' y 'subject'
+
+        Returns:
+            Dict con 'status' y 'retry'; si el fallo es transitorio incluye
+            'retry_after' (Retry-After del proveedor o None para usar el backoff)
+        """
+        notification_id = payload["notification_id"]
+        notification = self.notification_model.get_by_id(notification_id)
+        if not notification:
+            logger.error(f"Notificación {notification_id}: No existe, se descarta el reintento")
+            return {"status": "ignored", "reason": "Notification not found", "retry": False}
+
+        if notification["status"] == "sent":
+            return {"status": "success", "email_sent": False, "retry": False}
+
+        # 'sending': el proceso que la enviaba murió antes de registrar el resultado.
+        # La clave de idempotencia evita duplicarla si el email sí llegó a salir
+        with self.metrics.stage("send"):
+            result = self.mailer.send(
+                to_email=payload["to_email"],
+                subject=payload["subject"],
+                html_content=notification["email_body"],
+                idempotency_key=self._idempotency_key(notification_id, notification["email_body"])
+            )
+
+        if result["success"]:
+            self.notification_model.update_status(notification_id, "sent", provider_message_id=result["id"])
+            logger.info(f"Notificación {notification_id}: Enviada en reintento")
+            return {"status": "success", "email_sent": True, "retry": False}
+
+        if not result["retryable"]:
+            self.notification_model.update_status(notification_id, "failed", result["error"])
+            return {"status": "error", "error": result["error"], "retry": False}
+
+        self.notification_model.update_status(notification_id, "queued", result["error"])
+        return {"status": "error", "error": result["error"], "retry": True,
+                "retry_after": result["retry_after"]}
+
+    def delivery_exhausted(self, payload: Dict, error_message: str):
+        """Marcar como fallida una notificación cuyos reintentos se agotaron"""
+        self.notification_model.update_status(payload["notification_id"], "failed", error_message)
+
+    def recover_stale_notifications(self) -> int:
+        """
+        Recuperar las notificaciones que quedaron en 'sending' o 'queued' sin trabajo de envío
+
+        Con reintentos diferidos se vuelven a encolar (el envío usa la misma clave
+        de idempotencia, por lo que no se duplica si el email sí salió); sin
+        ellos se marcan como fallidas para que no cuenten como notificadas.
+
+        Returns:
+            Número de notificaciones recuperadas
+        """
+        if not self.notification_model:
+            return 0
+
+        older_than = self.config.NOTIFICATION_STALE_AFTER
+        if not self.retry_scheduler:
+            rows = self.notification_model.claim_stale(older_than, "failed", "Send interrupted, outcome unknown")
+            for row in rows:
+                logger.error(f"Notificación {row['id']}: Envío interrumpido, marcada como fallida")
+            return len(rows)
+
+        with self.notification_model.db.connection():
+            rows = self.notification_model.claim_stale(older_than, "queued", "Send interrupted, retrying")
+            for row in rows:
+                job_id = self.retry_scheduler.reserve("send_email", {
+                    "notification_id": row["id"],
+                    "to_email": ADMIN_EMAIL,
+                    "subject": self._admin_subject(row["recipient_name"], row["email_subject"])
+                }, delay=0)
+                self.notification_model.set_delivery_job(row["id"], job_id)
+        for row in rows:
+            logger.warning(f"Notificación {row['id']}: Envío interrumpido, reintento programado")
+        return len(rows)
+
+    def _record_sending(self, notification_fields: Dict, subject: str) -> Tuple[int, Optional[int]]:
+        """
+        Registrar una notificación como 'sending' junto con su trabajo de recuperación
+
+        Returns:
+            Tupla (ID de la notificación, ID del trabajo 'send_email' o None sin reintentos diferidos)
+        """
+        with self.notification_model.db.connection():
+            notification_id = self.notification_model.create(**notification_fields, status="sending")
+            if not self.retry_scheduler:
+                return notification_id, None
+
+            job_id = self.retry_scheduler.reserve(
+                "send_email",
+                {"notification_id": notification_id, "to_email": ADMIN_EMAIL, "subject": subject},
+                delay=self.config.NOTIFICATION_SEND_RECOVERY_DELAY
+            )
+            self.notification_model.set_delivery_job(notification_id, job_id)
+        return notification_id, job_id
+
+    @staticmethod
+    def _admin_subject(client_name: Optional[str], subject: str) -> str:
+        """Asunto del email de administración (incluye el nombre del cliente)"""
+        return f"[Cliente: {client_name}] {subject}"
+
+    @staticmethod
+    def _idempotency_key(notification_id: Optional[int], html: str) -> Optional[str]:
+        """
+        Clave de idempotencia del envío de una notificación
+
+        Incluye un hash del contenido para no chocar con la de otra notificación
+        que reutilice el ID (por ejemplo, con una base de datos recreada).
+        """
+        if notification_id is None:
+            return None
+        digest = hashlib.sha256(html.encode('utf-8')).hexdigest()[:16]
+        return f"notification-{notification_id}-{digest}"
+
+    def _action_info(self, event_data: Dict) -> Dict:
+        """Construir el objeto de acción de un evento (compatible con los templates)"""
+        completion_date = event_data.get("completion_date")
+        return {
+            "action": {
+                "id": event_data.get("id"),
+                "title": event_data.get("title", "Acción"),
+                "url": event_data.get("action", "")
+            },
+            "event": {
+                "is_complete": True,
+                "completion_date": completion_date
+            },
+            "completion_date": completion_date
+        }
+
+    def _load_project(self, project_id: int, event_data: Dict,
+                      wait_for_lease: bool = True) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """
+        Obtener los datos del proyecto de un evento
+
+        Args:
+            project_id: ID del proyecto
+            event_data: Campos del evento (pueden traer los datos del proyecto)
+            wait_for_lease: Esperar a otro proceso que ya consulta el proyecto (ver
+                OpenSolarService.get_project)
+
+        Returns:
+            Tupla (datos del proyecto, None) o (None, resultado de error del procesamiento)
+        """
+        # Camino rápido: usar los datos del proyecto que ya vienen en el webhook
+        project_full_data = None
+        if self.config.WEBHOOK_PAYLOAD_FAST_PATH:
+            project_full_data = self.opensolar_service.project_from_payload(event_data.get("project_data"))
+
+        if project_full_data:
+            self._count_project_source("payload")
+            return project_full_data, None
+
+        self._count_project_source("api")
+
+        # Descartar el proyecto en caché si el evento trae campos que cambiaron
+        self.opensolar_service.invalidate_project(project_id, event_data.get("project_data"))
+
+        # Obtener datos completos del proyecto desde OpenSolar API
+        try:
+            project_full_data = self.opensolar_service.get_project(project_id, wait_for_lease=wait_for_lease)
+        except Exception as e:
+            logger.error(f"Error al obtener proyecto {project_id}: {str(e)}")
+            return None, {"status": "error", "error": f"Error fetching project: {str(e)}",
+                          "http_status": 500, "retry": True}
+
+        if not project_full_data:
+            logger.error(f"No se pudo obtener datos del proyecto {project_id}")
+            return None, {"status": "error", "error": "Could not fetch project data",
+                          "http_status": 500, "retry": True}
+
+        return project_full_data, None
+
+    def _buffer(self, notification_fields: Dict) -> Dict:
+        """
+        Retener una actualización de progreso hasta el envío del resumen del proyecto
+
+        La primera actualización retenida abre la ventana: programa el trabajo
+        'digest' que, pasados digest_window segundos, envía juntas todas las
+        retenidas del proyecto. La ventana sobrevive a reinicios porque tanto
+        las notificaciones como el trabajo están en la base de datos.
+        """
+        project_id = notification_fields["project_id"]
+        with self.metrics.stage("db_write"):
+            notification_id = self.notification_model.create(**notification_fields, status="buffered")
+
+        if self.notification_model.is_oldest_buffered(project_id, notification_id):
+            self._schedule_digest(project_id)
+            logger.info(f"Proyecto {project_id}: Resumen de progreso programado en {self.digest_window} segundos")
+
+        with self._stats_lock:
+            self.digest_counts["buffered"] += 1
+
+        logger.info(f"Proyecto {project_id}, Acción {notification_fields['action_id']}: "
+                    f"Notificación {notification_id} retenida para el resumen")
+        return {"status": "buffered", "email_sent": False, "notification_id": notification_id,
+                "http_status": 202, "retry": False}
+
+    def _schedule_digest(self, project_id: int, deferrals: int = 0):
+        # claim_id identifica al trabajo: sus reintentos recuperan las notificaciones que tomó;
+        # deferrals cuenta las veces que se pospuso esperando la primera notificación
+        payload = {"project_id": project_id, "claim_id": uuid.uuid4().hex, "deferrals": deferrals}
+        self.digest_queue.enqueue("digest", payload, delay=self.digest_window,
+                                  max_attempts=self.config.JOB_MAX_ATTEMPTS)
+
+    @staticmethod
+    def _digest_claim(payload: Dict) -> str:
+        """Identificador con el que un trabajo 'digest' toma las notificaciones retenidas"""
+        return payload.get("claim_id") or f"project-{payload['project_id']}"
+
+    def send_digest(self, payload: Dict) -> Dict:
+        """
+        Enviar el resumen de las actualizaciones retenidas de un proyecto (trabajo 'digest')
+
+        Con una sola actualización retenida se envía su email tal cual; con varias,
+        un email de resumen que las lista todas. Si la primera notificación del
+        proyecto aún está pendiente de envío, el resumen se pospone otra ventana,
+        hasta NOTIFICATION_DIGEST_MAX_DEFERRALS veces; después se envía igual.
+
+        Args:
+            payload: Dict con 'project_id', 'claim_id' y 'deferrals'
+
+        Returns:
+            Dict con 'status' y 'retry' (y 'retry_after' si el fallo es transitorio)
+        """
+        project_id = payload["project_id"]
+
+        if self.notification_model.has_pending(project_id, "first_notification"):
+            deferrals = payload.get("deferrals", 0)
+            if deferrals < self.config.NOTIFICATION_DIGEST_MAX_DEFERRALS:
+                self._schedule_digest(project_id, deferrals + 1)
+                with self._stats_lock:
+                    self.digest_counts["deferred"] += 1
+                logger.info(f"Proyecto {project_id}: Primera notificación pendiente, resumen pospuesto")
+                return {"status": "deferred", "retry": False}
+            logger.warning(f"Proyecto {project_id}: Primera notificación pendiente tras {deferrals} "
+                           f"esperas, se envía el resumen sin ella")
+
+        records = self.notification_model.claim_buffered(project_id, self._digest_claim(payload))
+        if not records:
+            return {"status": "ignored", "reason": "No buffered notifications", "retry": False}
+
+        notification_ids = [record["id"] for record in records]
+
+        if len(records) == 1:
+            record = records[0]
+            subject = record["email_subject"]
+            email_content = {"subject": subject, "html": record["email_body"], "text": None}
+            recipient_name = record["recipient_name"]
+        else:
+            events = [self._event_data(record) for record in records]
+            with self.metrics.stage("get_project"):
+                project_full_data, error = self._load_project(project_id, events[-1])
+            if error:
+                self.notification_model.update_statuses(notification_ids, "buffered", error["error"])
+                return error
+
+            client_data = self.opensolar_service.extract_client_data(project_full_data)
+            if not client_data or not client_data.get("email"):
+                error_message = "Client contact data or email is missing"
+                self.notification_model.update_statuses(notification_ids, "failed", error_message)
+                logger.error(f"Proyecto {project_id}: No se encontraron datos de contacto para el resumen")
+                return {"status": "error", "error": error_message, "retry": False}
+
+            with self.metrics.stage("render"):
+                email_content = self.notification_service.generate_digest_email(
+                    client_data, project_full_data, [self._action_info(event) for event in events]
+                )
+            recipient_name = client_data["full_name"]
+
+        # NOTA: Por ahora enviamos a admin@greenhproject.com porque el dominio no está verificado en Resend
+        with self.metrics.stage("send"):
+            result = self.mailer.send(
+                to_email=ADMIN_EMAIL,
+                subject=f"[Cliente: {recipient_name}] {email_content['subject']}",
+                html_content=email_content["html"],
+                plain_content=email_content["text"]
+            )
+
+        if result["success"]:
+            self.notification_model.update_statuses(notification_ids, "sent", provider_message_id=result["id"])
+            with self._stats_lock:
+                self.digest_counts["digests"] += 1
+            logger.info(f"Proyecto {project_id}: Resumen de {len(records)} actualizaciones enviado")
+            return {"status": "success", "email_sent": True, "retry": False}
+
+        if not result["retryable"]:
+            self.notification_model.update_statuses(notification_ids, "failed", result["error"])
+            return {"status": "error", "error": result["error"], "retry": False}
+
+        # Devolverlas a la ventana: el reintento del trabajo las envía junto con las nuevas
+        self.notification_model.update_statuses(notification_ids, "buffered", result["error"])
+        return {"status": "error", "error": result["error"], "retry": True,
+                "retry_after": result["retry_after"]}
+
+    def digest_exhausted(self, payload: Dict, error_message: str):
+        """Marcar como fallidas las actualizaciones retenidas cuyo resumen agotó los reintentos"""
+        records = self.notification_model.claim_buffered(payload["project_id"], self._digest_claim(payload))
+        self.notification_model.update_statuses([record["id"] for record in records], "failed", error_message)
+
+    @staticmethod
+    def _event_data(record: Dict) -> Dict:
+        """Datos del evento guardados con una notificación"""
+        webhook_data = record.get("webhook_data")
+        if isinstance(webhook_data, str):
+            webhook_data = json.loads(webhook_data)
+        return (webhook_data or {}).get("fields") or {}
+
+    def _count_project_source(self, source: str):
+        with self._stats_lock:
+            self.project_source_counts[source] += 1
@@ -0,0 +1,132 @@
+"""
+Grabación de las peticiones de webhook recibidas
+
+Cada petición se agrega como una línea JSON (NDJSON) a un archivo de solo
+anexado, con su instante de llegada, headers y cuerpo, para poder reproducir
+después el tráfico real con webhook_replay.py. Los headers con credenciales no
+se guardan. Cada línea se escribe con una sola llamada write() sobre un archivo
+abierto con O_APPEND, de modo que los hilos y los workers de gunicorn pueden
+compartir el archivo sin intercalar registros.
+"""
+
+import os
+import json
+import base64
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# Headers que nunca se graban (el reproductor agrega su propia autenticación)
+REDACTED_HEADERS = frozenset({'x-webhook-secret', 'authorization', 'cookie', 'proxy-authorization'})
+
+
+class WebhookRecorder:
+    """Graba peticiones en un archivo NDJSON de solo anexado"""
+
+    def __init__(self, path: str):
+        """
+        Inicializar grabador
+
+        Args:
+            path: Archivo NDJSON de destino (se crea si no existe)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+        self.records = 0
+        self.errors = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _file(self) -> int:
+        """Descriptor del archivo en el proceso actual (se reabre después de un fork)"""
+        pid = os.getpid()
+        if self._fd is None or self._pid != pid:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            self._pid = pid
+        return self._fd
+
+    def record(self, method: str, path: str, headers: Mapping[str, str], body: bytes,
+               received_at: Optional[float] = None):
+        """
+        Agregar una petición al archivo
+
+        Nunca lanza excepciones: un error de escritura solo se registra en el
+        log para no afectar la respuesta al webhook.
+
+        Args:
+            method: Método HTTP
+            path: Ruta con query string
+            headers: Headers de la petición (se omiten los de REDACTED_HEADERS)
+            body: Cuerpo sin procesar
+            received_at: Instante de llegada (epoch; por defecto ahora)
+        """
+        received_at = time.time() if received_at is None else received_at
+        entry = {
+            "ts": datetime.fromtimestamp(received_at, timezone.utc).isoformat(timespec='milliseconds'),
+            "t": received_at,
+            "method": method,
+            "path": path,
+            "headers": {k: v for k, v in headers.items() if k.lower() not in REDACTED_HEADERS}
+        }
+        try:
+            entry["body"] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(body).decode('ascii')
+
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8')
+        try:
+            with self._lock:
+                os.write(self._file(), line)
+                self.records += 1
+        except OSError as e:
+            self.errors += 1
+            logger.warning(f"No se pudo grabar el webhook en {self.path}: {e}")
+
+    def close(self):
+        """Cerrar el archivo"""
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                os.close(self._fd)
+            self._fd = None
+
+    def stats(self) -> Dict:
+        """Peticiones grabadas por este proceso"""
+        return {"path": self.path, "records": self.records, "errors": self.errors}
+
+
+def read_recording(path: str) -> Iterator[Dict]:
+    """
+    Leer un archivo grabado por WebhookRecorder
+
+    Las líneas incompletas o ilegibles (por ejemplo, la última si el proceso
+    terminó a mitad de una escritura) se omiten.
+
+    Args:
+        path: Archivo NDJSON
+
+    Returns:
+        Iterador de dicts con 't', 'method', 'path', 'headers' y 'body' (bytes)
+    """
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                if "body_b64" in entry:
+                    entry["body"] = base64.b64decode(entry.pop("body_b64"))
+                else:
+                    entry["body"] = entry.get("body", "").encode('utf-8')
+            except (ValueError, TypeError) as e:
+                logger.warning(f"{path}:{number}: línea ilegible omitida ({e})")
+                continue
+            yield entry
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de durabilidad del envío por lotes
+
+Los mensajes que esperan lote viven en la cola de trabajos: si el proceso se
+reinicia antes del envío (o a mitad de un lote), otro despachador los recupera
+y la notificación solo pasa a 'sent' cuando Resend acepta el lote.
+
+    python test_batch_dispatcher.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# Agregar el directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import Database, Notification, JobQueue
+from services.batch_dispatcher import ResendBatchDispatcher
+
+
+class FakeResend:
+    """Rechaza el primer lote con un error transitorio y acepta los siguientes"""
+
+    def __init__(self, fail_first: bool = False):
+        self.fail_first = fail_first
+        self.batches = []
+
+    def send_batch(self, messages):
+        self.batches.append(messages)
+        if self.fail_first and len(self.batches) == 1:
+            return [{"success": False, "id": None, "status_code": 503, "error": "Service unavailable",
+                     "retryable": True, "retry_after": 0, "provider": "resend"} for _ in messages]
+        return [{"success": True, "id": f"msg-{len(self.batches)}-{i}", "status_code": 200, "error": None,
+                 "retryable": False, "retry_after": None, "provider": "resend"} for i in range(len(messages))]
+
+
+def create_queued(notification_model: Notification, action_id: int) -> int:
+    return notification_model.create(
+        project_id=7, action_id=action_id, action_title='Visita técnica',
+        recipient_email='cliente@example.com', email_type='progress_update',
+        email_subject=f'Avance {action_id}', email_body=f'<p>Avance {action_id}</p>', status='queued'
+    )
+
+
+def make_dispatcher(resend, notification_model, job_queue, lease_seconds=300):
+    return ResendBatchDispatcher(resend, notification_model, job_queue, max_batch_size=10,
+                                 max_wait_ms=0, lease_seconds=lease_seconds, retry_delay=0.01)
+
+
+def test_queued_messages_survive_restart():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(f"sqlite:///{os.path.join(tmp_dir, 'batch.db')}")
+        notification_model = Notification(db)
+        job_queue = JobQueue(db)
+
+        # Primer proceso: encola y toma el lote, pero muere antes de enviarlo
+        crashed = make_dispatcher(FakeResend(), notification_model, job_queue, lease_seconds=0.01)
+        ids = [create_queued(notification_model, action_id) for action_id in (1, 2, 3)]
+        for notification_id in ids:
+            crashed.submit(notification_id, 'admin@example.com', f'Notificación {notification_id}')
+        assert len(crashed._collect_batch()) == 3
+        assert job_queue.count_pending() == 3
+        assert {notification_model.get_by_id(i)["status"] for i in ids} == {"queued"}
+
+        # Segundo proceso: recupera los trabajos al vencer el lease; el primer lote falla
+        time.sleep(0.05)
+        resend = FakeResend(fail_first=True)
+        dispatcher = make_dispatcher(resend, notification_model, job_queue)
+        dispatcher._send(dispatcher._collect_batch())
+        assert {notification_model.get_by_id(i)["status"] for i in ids} == {"queued"}
+        assert job_queue.count_pending() == 3
+
+        time.sleep(0.05)
+        dispatcher._send(dispatcher._collect_batch())
+        assert [len(batch) for batch in resend.batches] == [3, 3]
+        assert {notification_model.get_by_id(i)["status"] for i in ids} == {"sent"}
+        assert job_queue.count_pending() == 0
+        assert dispatcher.stats()["sent"] == 3
+
+
+if __name__ == "__main__":
+    test_queued_messages_survive_restart()
+    print("✓ Los mensajes en espera de lote sobreviven a un reinicio")
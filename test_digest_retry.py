@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de durabilidad del resumen de progreso
+
+Si el envío del resumen lanza una excepción (o el worker muere a mitad del
+trabajo), las actualizaciones retenidas no deben perderse: el reintento del
+trabajo 'digest' las recupera y las envía. Si la primera notificación del
+proyecto no sale nunca de la cola, el resumen se pospone un número limitado
+de veces y después se envía.
+
+    python test_digest_retry.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# Agregar el directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from database import Database, Notification, JobQueue
+from services import OpenSolarService, NotificationService
+from services.job_worker import JobWorkerPool
+from services.webhook_processor import WebhookProcessor
+
+PROJECT_ID = 4242
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+class DigestConfig(Config):
+    NOTIFICATION_DIGEST_WINDOW = 0.01
+    WEBHOOK_PAYLOAD_FAST_PATH = True
+    NOTIFICATION_DIGEST_MAX_DEFERRALS = 2
+
+
+class FlakyMailer:
+    """Lanza una excepción en el primer envío y acepta los siguientes"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def send(self, to_email, subject, html_content, plain_content=None):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("conexión interrumpida")
+        return {"success": True, "id": f"msg-{self.calls}", "status_code": 200, "error": None,
+                "retryable": False, "retry_after": None, "provider": "test"}
+
+
+def progress_webhook(action_id: int) -> dict:
+    return {
+        "model": "Event",
+        "event": "CREATE",
+        "fields": {
+            "id": action_id,
+            "title": "Visita técnica",
+            "is_complete": True,
+            "completion_date": "2025-10-04T21:34:27Z",
+            "project_data": {
+                "id": PROJECT_ID,
+                "title": "Casa Pérez 5kW",
+                "address": "Calle 10 # 20-30, Bogotá",
+                "contacts_data": [{"first_name": "María", "family_name": "Pérez", "email": "cliente@example.com"}]
+            }
+        }
+    }
+
+
+def run_until_empty(pool: JobWorkerPool, job_queue: JobQueue, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while job_queue.count_pending() and time.monotonic() < deadline:
+        if not pool.run_once():
+            time.sleep(0.01)
+
+
+def make_processor(notification_model, job_queue, mailer):
+    processor = WebhookProcessor(
+        opensolar_service=OpenSolarService(api_token='', org_id='1'),
+        notification_service=NotificationService(
+            templates_dir=TEMPLATES_DIR,
+            client_portal_url=Config.CLIENT_PORTAL_URL,
+            action_descriptions=Config.ACTION_DESCRIPTIONS
+        ),
+        mailer=mailer,
+        notification_model=notification_model,
+        config=DigestConfig,
+        job_queue=job_queue
+    )
+    pool = JobWorkerPool(
+        job_queue,
+        handlers={"digest": processor.send_digest},
+        exhausted_handlers={"digest": processor.digest_exhausted},
+        retry_delay=0.01,
+        max_retry_delay=0.01
+    )
+    return processor, pool
+
+
+def test_digest_survives_send_exception():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(f"sqlite:///{os.path.join(tmp_dir, 'digest.db')}")
+        notification_model = Notification(db)
+        job_queue = JobQueue(db)
+        mailer = FlakyMailer()
+        processor, pool = make_processor(notification_model, job_queue, mailer)
+
+        # El proyecto ya recibió su primera notificación: las siguientes se retienen
+        notification_model.create(
+            project_id=PROJECT_ID, action_id=1, action_title='Pago de cuota inicial',
+            recipient_email='cliente@example.com', email_type='first_notification',
+            email_subject='Bienvenida', email_body='<p>Bienvenida</p>', status='sent'
+        )
+        for action_id in (2, 3):
+            assert processor.process(progress_webhook(action_id))["status"] == "buffered"
+
+        time.sleep(0.05)
+        assert pool.run_once()  # el envío lanza la excepción y el trabajo se reprograma
+
+        held = notification_model.get_by_project(PROJECT_ID)
+        assert sorted(n["status"] for n in held) == ["digesting", "digesting", "sent"]
+        # Siguen contando como notificadas (sin duplicados mientras se reintenta)
+        assert notification_model.check_if_notified(PROJECT_ID, 2)
+
+        time.sleep(0.05)
+        run_until_empty(pool, job_queue)
+
+        statuses = {n["action_id"]: n["status"] for n in notification_model.get_by_project(PROJECT_ID)}
+        assert statuses == {1: "sent", 2: "sent", 3: "sent"}, statuses
+        assert mailer.calls == 2
+
+
+def test_digest_deferrals_are_capped():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(f"sqlite:///{os.path.join(tmp_dir, 'digest.db')}")
+        notification_model = Notification(db)
+        job_queue = JobQueue(db)
+        mailer = FlakyMailer()
+        mailer.calls = 1  # sin la excepción del primer envío
+        processor, pool = make_processor(notification_model, job_queue, mailer)
+
+        # La primera notificación del proyecto no sale nunca de la cola
+        notification_model.create(
+            project_id=PROJECT_ID, action_id=1, action_title='Pago de cuota inicial',
+            recipient_email='cliente@example.com', email_type='first_notification',
+            email_subject='Bienvenida', email_body='<p>Bienvenida</p>', status='queued'
+        )
+        for action_id in (2, 3):
+            assert processor.process(progress_webhook(action_id))["status"] == "buffered"
+
+        time.sleep(0.05)
+        run_until_empty(pool, job_queue)
+
+        statuses = {n["action_id"]: n["status"] for n in notification_model.get_by_project(PROJECT_ID)}
+        assert statuses == {1: "queued", 2: "sent", 3: "sent"}, statuses
+        assert processor.digest_counts["deferred"] == DigestConfig.NOTIFICATION_DIGEST_MAX_DEFERRALS
+        assert mailer.calls == 2
+
+
+if __name__ == "__main__":
+    test_digest_survives_send_exception()
+    print("✓ El resumen se envía en el reintento después de una excepción")
+    test_digest_deferrals_are_capped()
+    print("✓ El resumen deja de posponerse si la primera notificación no sale de la cola")
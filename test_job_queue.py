@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de los trabajos cuyo worker murió en el último intento
+
+Un trabajo con el lease vencido solo se vuelve a tomar si le quedan intentos;
+si ya los agotó, el pool lo marca como fallido y llama a su handler de fallo
+definitivo en vez de ejecutarlo otra vez. La misma revisión periódica
+elimina los trabajos terminados que superan el tiempo de retención.
+
+    python test_job_queue.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+
+# Agregar el directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import Database, JobQueue
+from services.job_worker import JobWorkerPool
+
+
+def test_expired_lease_respects_max_attempts():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        job_queue = JobQueue(Database(f"sqlite:///{os.path.join(tmp_dir, 'jobs.db')}"))
+        job_id = job_queue.enqueue("send_email", {"notification_id": 1}, max_attempts=2)
+
+        # Dos workers mueren con el trabajo tomado
+        for attempt in (1, 2):
+            job = job_queue.claim(lease_seconds=0.01)
+            assert job["id"] == job_id and job["attempts"] == attempt
+            time.sleep(0.05)
+
+        assert job_queue.claim(lease_seconds=0.01) is None
+
+        handled, exhausted = [], []
+        pool = JobWorkerPool(
+            job_queue,
+            handlers={"send_email": handled.append},
+            exhausted_handlers={"send_email": lambda payload, error: exhausted.append((payload, error))}
+        )
+        assert not pool.run_once()
+        assert handled == []
+        assert exhausted == [({"notification_id": 1}, "Lease expired on the last attempt")]
+        assert job_queue.count_pending() == 0
+
+
+def test_finished_jobs_are_purged_after_retention():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(f"sqlite:///{os.path.join(tmp_dir, 'jobs.db')}")
+        job_queue = JobQueue(db)
+        done_id, failed_id, recent_id, pending_id = (
+            job_queue.enqueue("send_email", {"notification_id": i}, delay=3600) for i in range(4)
+        )
+        job_queue.complete(done_id)
+        job_queue.fail(failed_id, "Provider rejected the message")
+        with db.connection() as conn:
+            conn.cursor().execute("UPDATE jobs SET updated_at = '2000-01-01 00:00:00' WHERE id IN (?, ?, ?)",
+                                  (done_id, failed_id, pending_id))
+        job_queue.complete(recent_id)
+
+        pool = JobWorkerPool(job_queue, handlers={"send_email": lambda payload: None},
+                             retention_seconds=3600)
+        assert not pool.run_once()
+
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM jobs ORDER BY id")
+            remaining = [row["id"] for row in cursor.fetchall()]
+        assert remaining == [recent_id, pending_id]
+
+
+def test_one_thread_reaps_per_interval():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        job_queue = JobQueue(Database(f"sqlite:///{os.path.join(tmp_dir, 'jobs.db')}"))
+        reaps = []
+        pool = JobWorkerPool(job_queue, handlers={"send_email": lambda payload: None},
+                             maintenance=[lambda: reaps.append(threading.get_ident())])
+
+        start = threading.Barrier(8)
+
+        def worker():
+            start.wait()
+            pool.run_once()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(reaps) == 1
+
+
+if __name__ == "__main__":
+    test_expired_lease_respects_max_attempts()
+    print("✓ Los trabajos sin intentos con el lease vencido se cierran como fallidos")
+    test_finished_jobs_are_purged_after_retention()
+    print("✓ Los trabajos terminados se eliminan al superar el tiempo de retención")
+    test_one_thread_reaps_per_interval()
+    print("✓ Un solo hilo ejecuta la revisión periódica en cada intervalo")
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de envío único del webhook
+
+Si el email se envía pero falla la escritura del resultado en la base de
+datos, el reintento del trabajo no debe reenviar el email. Si el proceso
+muere entre registrar la notificación y enviarla, el email se envía igual
+(una sola vez) mediante el trabajo de recuperación.
+
+    python test_webhook_send_once.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# Agregar el directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from database import Database, Notification, JobQueue
+from services import OpenSolarService, NotificationService
+from services.job_worker import JobWorkerPool
+from services.retry import RetryScheduler
+from services.webhook_processor import WebhookProcessor
+
+PROJECT_ID = 5151
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+class FastPathConfig(Config):
+    NOTIFICATION_DIGEST_WINDOW = 0
+    WEBHOOK_PAYLOAD_FAST_PATH = True
+    NOTIFICATION_SEND_RECOVERY_DELAY = 0.05
+
+
+class CountingMailer:
+    """Cuenta los emails entregados; como Resend, no repite un envío con la misma clave de idempotencia"""
+
+    def __init__(self):
+        self.calls = 0
+        self.keys = {}
+
+    def send(self, to_email, subject, html_content, plain_content=None, idempotency_key=None):
+        if idempotency_key not in self.keys:
+            self.calls += 1
+            self.keys[idempotency_key] = f"msg-{self.calls}"
+        return {"success": True, "id": self.keys[idempotency_key], "status_code": 200, "error": None,
+                "retryable": False, "retry_after": None, "provider": "test"}
+
+
+class FlakyNotification(Notification):
+    """La primera escritura del estado 'sent' falla (ej: base de datos bloqueada)"""
+
+    failures = 1
+
+    def _maybe_fail(self, status):
+        if status == "sent" and self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+
+    def create(self, **kwargs):
+        self._maybe_fail(kwargs.get("status"))
+        return super().create(**kwargs)
+
+    def update_status(self, notification_id, status, *args, **kwargs):
+        self._maybe_fail(status)
+        return super().update_status(notification_id, status, *args, **kwargs)
+
+
+WEBHOOK = {
+    "model": "Event",
+    "event": "CREATE",
+    "fields": {
+        "id": 1,
+        "title": "Pago de cuota inicial",
+        "is_complete": True,
+        "completion_date": "2025-10-04T21:34:27Z",
+        "project_data": {
+            "id": PROJECT_ID,
+            "title": "Casa Gómez 3kW",
+            "address": "Carrera 7 # 1-10, Medellín",
+            "contacts_data": [{"first_name": "Luis", "family_name": "Gómez", "email": "luis@example.com"}]
+        }
+    }
+}
+
+
+def make_processor(db, notification_model, job_queue, mailer):
+    processor = WebhookProcessor(
+        opensolar_service=OpenSolarService(api_token='', org_id='1'),
+        notification_service=NotificationService(
+            templates_dir=TEMPLATES_DIR,
+            client_portal_url=Config.CLIENT_PORTAL_URL,
+            action_descriptions=Config.ACTION_DESCRIPTIONS
+        ),
+        mailer=mailer,
+        notification_model=notification_model,
+        config=FastPathConfig,
+        retry_scheduler=RetryScheduler(job_queue, base_delay=0.01, max_delay=0.01, max_attempts=3),
+        job_queue=job_queue
+    )
+    pool = JobWorkerPool(
+        job_queue,
+        handlers={"webhook": processor.process, "send_email": processor.deliver},
+        retry_delay=0.01, max_retry_delay=0.01,
+        exhausted_handlers={"send_email": processor.delivery_exhausted}
+    )
+    return processor, pool
+
+
+def notification_status(db):
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT status FROM notifications")
+        return [row["status"] for row in cursor.fetchall()]
+
+
+def drain(pool, job_queue):
+    for _ in range(20):
+        if not job_queue.count_pending():
+            return
+        pool.run_once()
+        time.sleep(0.06)
+
+
+def test_db_failure_after_send_does_not_resend():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(f"sqlite:///{os.path.join(tmp_dir, 'send_once.db')}")
+        notification_model = FlakyNotification(db)
+        job_queue = JobQueue(db)
+        mailer = CountingMailer()
+        processor, pool = make_processor(db, notification_model, job_queue, mailer)
+
+        job_queue.enqueue("webhook", WEBHOOK)
+
+        assert pool.run_once()  # envía y falla al registrar el resultado: el trabajo se reprograma
+        assert mailer.calls == 1
+
+        time.sleep(0.06)
+        assert pool.run_once()  # el reintento encuentra la notificación ya registrada
+        assert mailer.calls == 1
+
+        # El trabajo de recuperación cierra la notificación sin duplicar el email
+        drain(pool, job_queue)
+        assert mailer.calls == 1
+        assert job_queue.count_pending() == 0
+        assert notification_status(db) == ["sent"]
+
+
+class KilledMailer(CountingMailer):
+    """El proceso muere justo después de registrar la notificación, antes de enviarla"""
+
+    def __init__(self):
+        super().__init__()
+        self.killed = False
+
+    def send(self, *args, **kwargs):
+        if not self.killed:
+            self.killed = True
+            raise SystemExit("worker killed")
+        return super().send(*args, **kwargs)
+
+
+def test_process_killed_after_create_sends_once():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(f"sqlite:///{os.path.join(tmp_dir, 'killed.db')}")
+        notification_model = Notification(db)
+        job_queue = JobQueue(db)
+        mailer = KilledMailer()
+        processor, pool = make_processor(db, notification_model, job_queue, mailer)
+
+        try:
+            processor.process(WEBHOOK, in_request=True)
+        except SystemExit:
+            pass
+        assert notification_status(db) == ["sending"]
+
+        # Un webhook repetido no la duplica, y la recuperación la envía
+        assert processor.process(WEBHOOK, in_request=True)["status"] == "ignored"
+        drain(pool, job_queue)
+        assert mailer.calls == 1
+        assert notification_status(db) == ["sent"]
+
+
+def test_stale_notifications_are_recovered():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(f"sqlite:///{os.path.join(tmp_dir, 'stale.db')}")
+        notification_model = Notification(db)
+        job_queue = JobQueue(db)
+        mailer = CountingMailer()
+        processor, pool = make_processor(db, notification_model, job_queue, mailer)
+
+        # Notificación en 'sending' cuyo trabajo de recuperación se perdió
+        notification_id = notification_model.create(
+            project_id=PROJECT_ID, action_id=1, action_title='Pago de cuota inicial',
+            recipient_email='luis@example.com', recipient_name='Luis Gómez',
+            email_type='first_notification', email_subject='Bienvenido',
+            email_body='<p>Bienvenido</p>', status='sending'
+        )
+        assert processor.recover_stale_notifications() == 0  # todavía reciente
+        with db.connection() as conn:
+            conn.cursor().execute("UPDATE notifications SET sent_at = '2000-01-01 00:00:00'")
+
+        assert processor.recover_stale_notifications() == 1
+        assert processor.recover_stale_notifications() == 0  # ya tiene su trabajo de envío
+        drain(pool, job_queue)
+        assert mailer.calls == 1
+        assert notification_model.get_by_id(notification_id)["status"] == "sent"
+
+        # Sin reintentos diferidos se marca como fallida
+        processor.retry_scheduler = None
+        notification_model.update_status(notification_id, "sending")
+        assert processor.recover_stale_notifications() == 1
+        assert notification_model.get_by_id(notification_id)["status"] == "failed"
+
+
+if __name__ == "__main__":
+    test_db_failure_after_send_does_not_resend()
+    print("✓ Un fallo de base de datos después del envío no reenvía el email")
+    test_process_killed_after_create_sends_once()
+    print("✓ Un envío interrumpido después de registrar la notificación se completa una sola vez")
+    test_stale_notifications_are_recovered()
+    print("✓ Las notificaciones interrumpidas sin trabajo de envío se recuperan")
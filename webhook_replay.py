@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reproducir tráfico de webhooks contra la aplicación
+
+Fuentes:
+- Un archivo NDJSON grabado con WEBHOOK_RECORD_PATH (todas las peticiones
+  recibidas, con sus headers y el instante de llegada)
+- Los payloads guardados en la tabla de notificaciones (columna webhook_data;
+  solo eventos que generaron una notificación, con resolución de segundos)
+
+Ritmo:
+- --speed 1 reproduce los intervalos originales, --speed 10 los acorta 10 veces
+- --flat-out envía todo lo más rápido posible con --concurrency peticiones
+  simultáneas
+
+Las peticiones se autentican con X-Webhook-Secret (WEBHOOK_SECRET o --secret);
+los headers de autenticación grabados no se conservan. Los eventos ya
+notificados se ignoran por deduplicación: con --id-offset se suma un valor al
+id de cada acción para que vuelvan a procesarse. La aplicación de destino envía
+emails de verdad; para pruebas de capacidad conviene apuntarla a servidores
+simulados (ver benchmarks/bench_webhook.py).
+
+Uso:
+    python webhook_replay.py --log webhooks.ndjson [--speed 1 | --flat-out] [--concurrency 16]
+    python webhook_replay.py --from-db [--status sent] [--limit 1000] [--id-offset 1000000]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Agregar el directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import get_config
+from services.webhook_recorder import read_recording
+
+WEBHOOK_PATH = "/webhook/opensolar"
+
+# Headers de la grabación que no se reenvían (los calcula la sesión HTTP)
+HOP_HEADERS = frozenset({'host', 'content-length', 'connection', 'accept-encoding', 'transfer-encoding'})
+
+LOCAL_HOSTS = frozenset({'localhost', '127.0.0.1', '::1'})
+
+
+def load_log(path: str) -> List[Dict]:
+    """Peticiones de un archivo grabado, con 'offset' en segundos desde la primera"""
+    events = sorted(read_recording(path), key=lambda e: e["t"])
+    if not events:
+        return []
+
+    start = events[0]["t"]
+    return [{
+        "offset": event["t"] - start,
+        "method": event.get("method", "POST"),
+        "path": event.get("path") or WEBHOOK_PATH,
+        "headers": {k: v for k, v in event.get("headers", {}).items() if k.lower() not in HOP_HEADERS},
+        "body": event["body"]
+    } for event in events]
+
+
+def load_db(config, status: Optional[str], limit: Optional[int]) -> List[Dict]:
+    """Payloads guardados en las notificaciones, en el orden en que se recibieron"""
+    from database import Database, Notification
+
+    notification_model = Notification(Database(config.DATABASE_URL))
+    rows = []
+    for notification in notification_model.iter_notifications(status=status, columns=['webhook_data']):
+        webhook_data = notification.get('webhook_data')
+        if not webhook_data:
+            continue
+        rows.append((notification['sent_at'], notification['id'], webhook_data))
+        if limit and len(rows) >= limit:
+            break
+
+    rows.sort(key=lambda row: (str(row[0]), row[1]))
+    if not rows:
+        return []
+
+    start = _timestamp(rows[0][0])
+    return [{
+        "offset": _timestamp(sent_at) - start,
+        "method": "POST",
+        "path": WEBHOOK_PATH,
+        "headers": {"Content-Type": "application/json"},
+        "body": (webhook_data if isinstance(webhook_data, str) else json.dumps(webhook_data)).encode('utf-8')
+    } for sent_at, _, webhook_data in rows]
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+def offset_action_id(body: bytes, id_offset: int) -> bytes:
+    """Sumar id_offset al id de la acción de un evento (para evitar la deduplicación)"""
+    try:
+        payload = json.loads(body)
+        fields = payload.get("fields") if isinstance(payload, dict) else None
+        if payload.get("model") == "Event" and isinstance(fields, dict) and isinstance(fields.get("id"), int):
+            fields["id"] += id_offset
+            return json.dumps(payload).encode('utf-8')
+    except (ValueError, AttributeError):
+        pass
+    return body
+
+
+def percentiles(values: List[float]) -> Dict:
+    """p50 / p95 / p99 en milisegundos"""
+    if not values:
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(int(len(values) * q), len(values) - 1)] * 1000
+
+    return {"count": len(values), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def replay(events: List[Dict], target: str, secret: str, speed: Optional[float],
+           concurrency: int, timeout: float) -> Dict:
+    """
+    Enviar las peticiones al destino
+
+    Args:
+        events: Peticiones con 'offset', 'method', 'path', 'headers' y 'body'
+        target: URL base de la aplicación (ej: http://localhost:5000)
+        secret: Secreto del webhook
+        speed: Factor de velocidad sobre los intervalos originales (None = sin esperas)
+        concurrency: Peticiones simultáneas como máximo
+        timeout: Timeout de cada petición (segundos)
+
+    Returns:
+        Dict con los códigos HTTP, errores de conexión, latencias y retraso de salida
+    """
+    statuses = defaultdict(int)
+    errors = defaultdict(int)
+    latencies = []
+    lock = threading.Lock()
+    local = threading.local()
+    max_lag = [0.0]
+
+    def session() -> requests.Session:
+        if getattr(local, "session", None) is None:
+            local.session = requests.Session()
+            local.session.mount("http://", HTTPAdapter(pool_maxsize=1))
+            local.session.mount("https://", HTTPAdapter(pool_maxsize=1))
+        return local.session
+
+    def send(event: Dict, scheduled: float):
+        headers = dict(event["headers"], **{"X-Webhook-Secret": secret})
+        started = time.perf_counter()
+        try:
+            response = session().request(event["method"], target.rstrip("/") + event["path"],
+                                         data=event["body"], headers=headers, timeout=timeout)
+            outcome = response.status_code
+        except requests.exceptions.RequestException as e:
+            outcome = None
+            error = type(e).__name__
+        elapsed = time.perf_counter() - started
+
+        with lock:
+            latencies.append(elapsed)
+            if outcome is None:
+                errors[error] += 1
+            else:
+                statuses[outcome] += 1
+            if speed is not None:
+                max_lag[0] = max(max_lag[0], started - scheduled)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for event in events:
+            scheduled = started
+            if speed is not None:
+                scheduled = started + event["offset"] / speed
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            executor.submit(send, event, scheduled)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(events),
+        "elapsed_seconds": elapsed,
+        "rate_per_second": len(events) / elapsed if elapsed else None,
+        "recorded_span_seconds": events[-1]["offset"] if events else 0,
+        "max_send_lag_ms": max_lag[0] * 1000 if speed is not None else None,
+        "http_status": {str(k): v for k, v in sorted(statuses.items())},
+        "connection_errors": dict(errors),
+        "latency": percentiles(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reproducir tráfico de webhooks contra la aplicación')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--log', help='Archivo NDJSON grabado con WEBHOOK_RECORD_PATH')
+    source.add_argument('--from-db', action='store_true', help='Payloads guardados en la tabla de notificaciones')
+    parser.add_argument('--status', help='Con --from-db, solo notificaciones en este estado')
+    parser.add_argument('--limit', type=int, help='Con --from-db, máximo de notificaciones (las más recientes)')
+    parser.add_argument('--target', default='http://localhost:5000', help='URL base de la aplicación')
+    parser.add_argument('--allow-remote', action='store_true', help='Permitir un destino que no sea local')
+    parser.add_argument('--secret', help='Secreto del webhook (por defecto WEBHOOK_SECRET)')
+    timing = parser.add_mutually_exclusive_group()
+    timing.add_argument('--speed', type=float, default=1.0, help='Factor de velocidad sobre el ritmo original')
+    timing.add_argument('--flat-out', action='store_true', help='Sin esperas entre peticiones')
+    parser.add_argument('--concurrency', type=int, default=16, help='Peticiones simultáneas como máximo')
+    parser.add_argument('--id-offset', type=int, default=0, help='Sumar este valor al id de cada acción')
+    parser.add_argument('--timeout', type=float, default=30, help='Timeout de cada petición (segundos)')
+    parser.add_argument('--json', help='Guardar el reporte en este archivo JSON')
+    args = parser.parse_args()
+
+    if args.speed <= 0:
+        parser.error("--speed debe ser mayor que 0 (usa --flat-out para enviar sin esperas)")
+
+    host = urlsplit(args.target).hostname
+    if host not in LOCAL_HOSTS and not args.allow_remote:
+        parser.error(f"El destino {args.target} no es local: la aplicación enviaría emails reales. "
+                     f"Usa --allow-remote si es intencional")
+
+    config = get_config()
+    if args.log:
+        events = load_log(args.log)
+    else:
+        events = load_db(config, args.status, args.limit)
+
+    if not events:
+        print("✗ No hay peticiones para reproducir")
+        sys.exit(1)
+
+    if args.id_offset:
+        for event in events:
+            event["body"] = offset_action_id(event["body"], args.id_offset)
+
+    speed = None if args.flat_out else args.speed
+    mode = "sin esperas" if speed is None else f"{speed:g}x"
+    print("=" * 60)
+    print("REPRODUCCIÓN DE WEBHOOKS")
+    print("=" * 60)
+    print(f"Origen:  {args.log or 'base de datos'} ({len(events)} peticiones, "
+          f"{events[-1]['offset']:.1f} s grabados)")
+    print(f"Destino: {args.target} ({mode}, concurrencia {args.concurrency})")
+
+    report = replay(events, args.target, args.secret or config.WEBHOOK_SECRET, speed,
+                    args.concurrency, args.timeout)
+
+    latency = report["latency"]
+    print()
+    print(f"Enviadas:          {report['requests']} en {report['elapsed_seconds']:.2f} s "
+          f"({report['rate_per_second']:.1f} peticiones/s)")
+    if report["max_send_lag_ms"] is not None:
+        print(f"Retraso de salida: {report['max_send_lag_ms']:.1f} ms como máximo")
+    print(f"Códigos HTTP:      {report['http_status']}")
+    if report["connection_errors"]:
+        print(f"Errores de conexión: {report['connection_errors']}")
+    print(f"Latencia:          p50 {latency['p50_ms']:.1f} ms   p95 {latency['p95_ms']:.1f} ms   "
+          f"p99 {latency['p99_ms']:.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"source": args.log or "database", "target": args.target, "mode": mode,
+                       "concurrency": args.concurrency, **report}, f, indent=2)
+        print(f"\nReporte guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    main()